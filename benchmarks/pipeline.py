@@ -0,0 +1,369 @@
+"""
+Benchmark the publish -> transport -> consumer pipeline on this machine.
+
+Every backend runs in-process: a `websockets` server stands in for the
+WebSocket proxy, and Redis is fakeredis unless --redis-host points at a real
+server. Results are printed and saved as JSON so runs can be compared across
+commits:
+
+    python -m benchmarks.pipeline --output before.json
+    python -m benchmarks.pipeline --compare before.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import time
+
+import fakeredis
+import numpy as np
+import websockets
+from redis import asyncio as aioredis
+
+from data_io.async_websocket_channel import AsyncWebSocketChannelPublisher
+from data_io.codec import make_codec
+from data_io.parse import parse_interface_file
+from data_io.redis_channel import AsyncRedisChannelPublisher
+from data_io.ws_forward import MultiPortProxy
+
+INTERFACE_FILE = os.path.join(os.path.dirname(__file__), "interface.mdx")
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+SOURCE = "benchmark"
+VALUE_POOL = 16  # Distinct values cycled through, so generation is not measured
+
+# payload -> (channel, value factory, default message count)
+PAYLOADS = {
+    "scalar": ("temperature", lambda rng: float(rng.standard_normal()), 20000),
+    "struct": (
+        "position",
+        lambda rng: {"lat": rng.uniform(-90, 90), "lon": rng.uniform(-180, 180)},
+        20000,
+    ),
+    "spectrum": ("spectrum", lambda rng: rng.random(100), 5000),
+    "image": (
+        "image",
+        lambda rng: rng.integers(0, 256, (256, 256), dtype=np.uint8),
+        200,
+    ),
+}
+BACKENDS = ("websocket", "redis", "proxy")
+ENCODINGS = ("json", "binary")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def interface_codec(encoding):
+    channels = parse_interface_file(INTERFACE_FILE)["data_channels"]
+    return make_codec(encoding, SOURCE, channels)
+
+
+class Arrivals:
+    """
+    Consumer-side record of one run. Messages of a channel arrive in publish
+    order, so the n-th arrival is matched with the n-th publish time.
+    """
+
+    def __init__(self, expected):
+        self.expected = expected
+        self.sent = []  # publish times, appended by the producer
+        self.latencies = []
+        self.bytes = 0
+        self.last = None
+        self.complete = asyncio.Event()
+
+    def add(self, size, count):
+        now = time.perf_counter()
+        start = len(self.latencies)
+        self.latencies.extend(now - sent for sent in self.sent[start : start + count])
+        self.bytes += size
+        self.last = now
+        if len(self.latencies) >= self.expected:
+            self.complete.set()
+
+
+async def produce(publish, channel_name, values, arrivals, rate):
+    """
+    Publish `arrivals.expected` values, as fast as possible or at `rate` per second.
+    """
+    start = time.perf_counter()
+    for i in range(arrivals.expected):
+        if rate:
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        arrivals.sent.append(time.perf_counter())
+        await publish(channel_name, values[i % len(values)])
+
+
+async def run_websocket(encoding, channel_name, values, arrivals, options):
+    codec = interface_codec(encoding)
+
+    async def consume(ws):
+        async for frame in ws:
+            arrivals.add(len(frame), len(codec.decode(frame)))
+
+    async with websockets.serve(consume, "127.0.0.1", 0, max_size=None) as server:
+        port = server.sockets[0].getsockname()[1]
+        publisher = AsyncWebSocketChannelPublisher(
+            SOURCE, INTERFACE_FILE, f"ws://127.0.0.1:{port}", encoding=encoding
+        )
+        await publisher.start()
+        try:
+            await produce(
+                publisher.publish, channel_name, values, arrivals, options.rate
+            )
+            await wait_complete(arrivals, options.timeout)
+        finally:
+            await publisher.close()
+
+
+async def run_redis(encoding, channel_name, values, arrivals, options):
+    codec = interface_codec(encoding)
+    decode = codec.decode if encoding == "binary" else json.loads
+
+    if options.redis_host:
+        subscriber = aioredis.Redis(host=options.redis_host, port=options.redis_port)
+        publisher = AsyncRedisChannelPublisher(
+            SOURCE,
+            INTERFACE_FILE,
+            options.redis_host,
+            options.redis_port,
+            encoding=encoding,
+        )
+    else:
+        server = fakeredis.FakeServer()
+        subscriber = fakeredis.FakeAsyncRedis(server=server)
+        publisher = AsyncRedisChannelPublisher(
+            SOURCE,
+            INTERFACE_FILE,
+            encoding=encoding,
+            client=fakeredis.FakeAsyncRedis(server=server),
+        )
+
+    pubsub = subscriber.pubsub()
+    await pubsub.subscribe(channel_name)
+
+    async def consume():
+        async for message in pubsub.listen():
+            if message["type"] == "message":
+                decode(message["data"])
+                arrivals.add(len(message["data"]), 1)
+
+    consumer = asyncio.create_task(consume())
+    await publisher.start()
+    try:
+        await produce(publisher.publish, channel_name, values, arrivals, options.rate)
+        await wait_complete(arrivals, options.timeout)
+    finally:
+        await publisher.close()
+        if publisher.pool is None:
+            await publisher.redis.aclose()  # The fakeredis client is not closed
+        consumer.cancel()
+        await pubsub.aclose()
+        await subscriber.aclose()
+
+
+async def run_proxy(encoding, channel_name, values, arrivals, options):
+    """
+    JSON lines over TCP through MultiPortProxy in high-throughput mode.
+    """
+    codec = interface_codec(encoding)
+
+    async def consume(ws):
+        async for frame in ws:
+            arrivals.add(len(frame), len(codec.decode(frame)))
+
+    async with websockets.serve(consume, "127.0.0.1", 0, max_size=None) as server:
+        ws_port = server.sockets[0].getsockname()[1]
+        listen_port = free_port()
+        proxy = MultiPortProxy(
+            "127.0.0.1", ws_port, [listen_port], batch_size=options.proxy_batch
+        )
+        proxy_task = asyncio.create_task(proxy.start())
+        await proxy.connected.wait()
+        await asyncio.sleep(0.1)  # Let the listener bind
+        reader, writer = await asyncio.open_connection("127.0.0.1", listen_port)
+
+        async def publish(channel_name, value):
+            writer.write(codec.encode(channel_name, value).encode() + b"\n")
+            await writer.drain()
+
+        try:
+            await produce(publish, channel_name, values, arrivals, options.rate)
+            await wait_complete(arrivals, options.timeout)
+        finally:
+            writer.close()
+            proxy_task.cancel()
+            await proxy.close()
+
+
+RUNNERS = {"websocket": run_websocket, "redis": run_redis, "proxy": run_proxy}
+
+
+async def wait_complete(arrivals, timeout):
+    try:
+        await asyncio.wait_for(arrivals.complete.wait(), timeout)
+    except asyncio.TimeoutError:
+        print(
+            f"Timed out with {len(arrivals.latencies)}/{arrivals.expected} "
+            "messages received."
+        )
+
+
+async def run_one(backend, encoding, payload, options):
+    channel_name, factory, count = PAYLOADS[payload]
+    rng = np.random.default_rng(0)
+    values = [factory(rng) for _ in range(VALUE_POOL)]
+    arrivals = Arrivals(max(1, int(count * options.scale)))
+
+    cpu = time.process_time()
+    start = time.perf_counter()
+    await RUNNERS[backend](encoding, channel_name, values, arrivals, options)
+    cpu = time.process_time() - cpu
+
+    received = len(arrivals.latencies)
+    elapsed = (arrivals.last or time.perf_counter()) - start
+    latencies = np.array(arrivals.latencies or [np.nan]) * 1000
+    return {
+        "backend": backend,
+        "encoding": encoding,
+        "payload": payload,
+        "messages": arrivals.expected,
+        "received": received,
+        "seconds": elapsed,
+        "msgs_per_s": received / elapsed,
+        "mb_per_s": arrivals.bytes / elapsed / 1e6,
+        "latency_p50_ms": float(np.percentile(latencies, 50)),
+        "latency_p99_ms": float(np.percentile(latencies, 99)),
+        "cpu_us_per_msg": cpu / max(received, 1) * 1e6,
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def key(result):
+    return (result["backend"], result["encoding"], result["payload"])
+
+
+def print_results(results, baseline=None):
+    previous = {key(result): result for result in baseline or ()}
+    print(
+        f"{'backend':<10}{'encoding':<9}{'payload':<9}{'msgs/s':>11}{'MB/s':>9}"
+        f"{'p50 ms':>9}{'p99 ms':>9}{'cpu us':>9}"
+    )
+    for result in results:
+        line = (
+            f"{result['backend']:<10}{result['encoding']:<9}{result['payload']:<9}"
+            f"{result['msgs_per_s']:>11.0f}{result['mb_per_s']:>9.2f}"
+            f"{result['latency_p50_ms']:>9.2f}{result['latency_p99_ms']:>9.2f}"
+            f"{result['cpu_us_per_msg']:>9.1f}"
+        )
+        old = previous.get(key(result))
+        if old is not None:
+            line += (
+                f"  msgs/s x{result['msgs_per_s'] / old['msgs_per_s']:.2f}"
+                f"  p99 x{result['latency_p99_ms'] / old['latency_p99_ms']:.2f}"
+            )
+        if result["received"] < result["messages"]:
+            line += f"  ({result['messages'] - result['received']} lost)"
+        print(line)
+
+
+async def main(options):
+    results = []
+    for backend in options.backends:
+        for encoding in options.encodings:
+            if backend == "proxy" and encoding != "json":
+                continue  # The proxy forwards JSON lines only
+            for payload in options.payloads:
+                results.append(await run_one(backend, encoding, payload, options))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Publish pipeline benchmarks")
+    parser.add_argument(
+        "-b", "--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS)
+    )
+    parser.add_argument(
+        "-e", "--encodings", nargs="+", choices=ENCODINGS, default=list(ENCODINGS)
+    )
+    parser.add_argument(
+        "-p", "--payloads", nargs="+", choices=list(PAYLOADS), default=list(PAYLOADS)
+    )
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=1.0,
+        help="Multiply the number of messages sent per payload",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=0,
+        help="Publish N messages per second instead of as fast as possible, "
+        "to measure latency below saturation",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=60,
+        help="Seconds to wait for the consumer to receive every message",
+    )
+    parser.add_argument(
+        "--proxy-batch", type=int, default=1000, help="MultiPortProxy batch size"
+    )
+    parser.add_argument("--redis-host", help="Use this Redis server, not fakeredis")
+    parser.add_argument("--redis-port", type=int, default=6379)
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="Results file (default: benchmarks/results/<commit>-<time>.json)",
+    )
+    parser.add_argument("--compare", help="Results file to compare against")
+    options = parser.parse_args()
+
+    results = asyncio.run(main(options))
+
+    baseline = None
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)["results"]
+    print_results(results, baseline)
+
+    report = {"environment": environment(), "options": vars(options)}
+    report["results"] = results
+    output = options.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        name = f"{report['environment']['commit'] or 'results'}-{int(time.time())}"
+        output = os.path.join(RESULTS_DIR, f"{name}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved results to {output}")
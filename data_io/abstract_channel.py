@@ -1,20 +1,45 @@
 """Basic channel publisher implementation."""
 
-from abc import abstractmethod
+import asyncio
 import json
+import threading
+import time
+from abc import abstractmethod
+
+import numpy as np
 
-from ruamel.yaml import YAML
+from data_io.codec import ColumnBlock, Trace, make_codec, resolve_dtype
+from data_io.decimate import make_decimators
+from data_io.metrics import Metrics
+from data_io.parse import parse_interface_file, watch_interface_file
+from data_io.scheduler import ChannelScheduler
+
+
+def wake(future):
+    if not future.done():
+        future.set_result(None)
 
 
 class AbstractChannelPublisher:
     """Simple class to publish messages to data channels."""
 
-    def __init__(self, source_name: str, interface_file: str):
+    def __init__(self, source_name: str, interface_file: str, encoding="json"):
         """
         Parse the interface file and initialize Redis connection.
+        :param encoding: Wire encoding for messages, "json" or "binary".
         """
         self.name = source_name
-        self.channels = self.parse_interface_file(interface_file)
+        self.interface_file = interface_file
+        self.encoding = encoding
+        self.channels = {}
+        self.release_timers = {}
+        self.decimate_timers = {}
+        self.metrics = None
+        self.subscriptions = None  # Channels with live consumers; None if unknown
+        self.subscription_waiters = []  # (event loop, future) pairs
+        self.subscription_listeners = []
+        self.sequences = {}  # Next sequence number of each traced channel
+        self.reload_interface()
 
     @property
     def channel_list(self):
@@ -24,23 +49,397 @@ class AbstractChannelPublisher:
         """
         Parse the YAML section of the interface file to extract channel configs.
         """
-        yaml = YAML()
-        with open(interface_file, "r", encoding="utf-8") as file:
-            content = file.read()
-        yaml_part, _ = content.split("---", 2)[1:]  # Split YAML from MDX
-        config = yaml.load(yaml_part)
-        return config.get("channels", {})
+        return parse_interface_file(interface_file)["data_channels"]
+
+    def reload_interface(self, result=None):
+        """
+        Pick up channel changes from the interface file without reconnecting.
+        Binary channel ids follow front matter order, so consumers must reload too.
+        """
+        if result is None:
+            result = parse_interface_file(self.interface_file)
+        self.channels = result["data_channels"]
+        self.codec = make_codec(self.encoding, self.name, self.channels)
+        self.compiled_validators = result["validators"]
+        self.validators = {
+            name: validator
+            for name, validator in self.compiled_validators.items()
+            if validator is not None and self.channels[name].get("validate", True)
+        }
+        for timer in self.decimate_timers.values():
+            timer.cancel()
+        self.decimate_timers = {}
+        self.decimators = make_decimators(self.channels)
+        self.skip_unchanged = {
+            name
+            for name, config in self.channels.items()
+            if config.get("skip_unchanged")
+        }
+        self.traced = {
+            name for name, config in self.channels.items() if config.get("trace")
+        }
+        self.last_values = {}
+        self.scheduler = ChannelScheduler(self.channels)
+        self.set_subscriptions(self.subscriptions)
+
+    def enable_metrics(self, metrics=None):
+        """
+        Start counting messages, bytes, encode and send time per channel.
+        Read them with `self.metrics.snapshot()` or `serve_prometheus`.
+        """
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.metrics.gauge("queue_depth", lambda: self.queue_depth)
+        self.metrics.gauge("queue_dropped", lambda: self.queue_dropped)
+        self.metrics.gauge("throttled_channels", lambda: len(self.throttled_channels))
+        return self.metrics
+
+    @property
+    def queue_depth(self):
+        return 0
+
+    @property
+    def queue_dropped(self):
+        return 0
+
+    def set_subscriptions(self, channels):
+        """
+        Record which channels have live consumers (None: unknown, so publish
+        everything). Values published to the other channels are discarded.
+        """
+        self.subscriptions = None if channels is None else set(channels)
+        # Unknown channels are never idle, so publishing to them still fails
+        self.idle = set()
+        if self.subscriptions is not None:
+            self.idle = set(self.channels) - self.subscriptions
+        waiters, self.subscription_waiters = self.subscription_waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(wake, future)
+        for listener in self.subscription_listeners:
+            listener(self.subscriptions)
+
+    def handle_control(self, message):
+        """
+        Apply a {"subscriptions": [...] | null} message sent by the broker or proxy.
+        """
+        try:
+            request = json.loads(message)
+            channels = request["subscriptions"]
+        except (ValueError, KeyError, TypeError):
+            print(f"Ignored invalid control message: {message!r}")
+            return
+        self.set_subscriptions(channels)
+
+    def is_subscribed(self, channel_name):
+        """
+        Whether anyone is watching a channel. True until the broker or proxy
+        reports otherwise.
+        """
+        return channel_name not in self.idle
+
+    async def wait_for_subscribers(self, channel_name):
+        """
+        Wait until a consumer subscribes to a channel.
+        """
+        loop = asyncio.get_running_loop()
+        while not self.is_subscribed(channel_name):
+            future = loop.create_future()
+            self.subscription_waiters.append((loop, future))
+            if self.is_subscribed(channel_name):
+                break  # Subscribed while the waiter was being registered
+            await future
+
+    def set_validation(self, channel_name, enabled):
+        """
+        Turn value validation on or off for a channel, e.g. in trusted hot loops.
+        """
+        validator = self.compiled_validators.get(channel_name)
+        if enabled and validator is not None:
+            self.validators[channel_name] = validator
+        else:
+            self.validators.pop(channel_name, None)
+
+    def prepare(self, channel_name, value):
+        """
+        Check that a channel exists and validate the value with its compiled validator.
+        Returns the (possibly coerced) value to publish.
+        """
+        if channel_name not in self.channels:
+            raise ValueError(
+                f"Channel '{channel_name}' is not defined in the interface file."
+            )
+        validator = self.validators.get(channel_name)
+        if validator is not None:
+            return validator(value)
+        return value
+
+    def make_block(self, channel_name, values, timestamps=None):
+        """
+        Check and convert a block of values for `publish_many`: a 1-D array for
+        a time series channel, and for a struct channel a dict of one array
+        per field, a structured array or a list of records.
+        Replaces the per-value validator.
+        """
+        config = self.channels.get(channel_name)
+        if config is None:
+            raise ValueError(
+                f"Channel '{channel_name}' is not defined in the interface file."
+            )
+        try:
+            if config.get("type") == "time_series":
+                columns = np.asarray(values, resolve_dtype(config.get("dtype")))
+                size = len(columns) if columns.ndim == 1 else None
+            elif config.get("type") == "struct":
+                fields = config.get("fields", {})
+                if isinstance(values, list):
+                    values = {field: [row[field] for row in values] for field in fields}
+                columns = {
+                    field: np.asarray(values[field], resolve_dtype(dtype))
+                    for field, dtype in fields.items()
+                }
+                sizes = {
+                    len(column) if column.ndim == 1 else None
+                    for column in columns.values()
+                }
+                size = sizes.pop() if len(sizes) == 1 else None
+            else:
+                raise ValueError(
+                    "publish_many only supports time_series and struct channels"
+                )
+            if size is None:
+                raise ValueError("columns must be 1-D and of equal length")
+            if timestamps is not None:
+                timestamps = np.asarray(timestamps, np.float64)
+                if timestamps.shape != (size,):
+                    raise ValueError(f"expected {size} timestamps")
+        except (TypeError, KeyError, ValueError) as e:
+            raise ValueError(f"Invalid block for channel '{channel_name}': {e}") from e
+        return ColumnBlock(columns, timestamps)
+
+    def reduce_block(self, channel_name, block):
+        """
+        Blocks to send for a published block: the block itself, or for channels
+        that are decimated, rate limited or skip unchanged values, a block of
+        the values `reduce` lets through (without timestamps).
+        """
+        if not (
+            channel_name in self.decimators
+            or channel_name in self.scheduler
+            or channel_name in self.skip_unchanged
+        ):
+            return (block,)
+        values = [
+            reduced
+            for value in block.rows()
+            for reduced in self.reduce(channel_name, value)
+        ]
+        if not values:
+            return ()
+        return (self.make_block(channel_name, values),)
+
+    def set_tracing(self, channel_name, enabled):
+        """
+        Turn sequence numbers and send times on or off for a channel,
+        overriding its `trace` front matter key.
+        """
+        if enabled:
+            self.traced.add(channel_name)
+        else:
+            self.traced.discard(channel_name)
+
+    def trace(self, channel_name):
+        """
+        Trace for a record about to be sent: the channel's next sequence
+        number and the send time. None for untraced channels.
+        """
+        if channel_name not in self.traced:
+            return None
+        seq = self.sequences.get(channel_name, 0)
+        self.sequences[channel_name] = seq + 1
+        return Trace(seq, time.time())
+
+    def is_unchanged(self, channel_name, value):
+        """
+        Whether a `skip_unchanged` channel's value equals the last one published.
+        """
+        if channel_name not in self.skip_unchanged:
+            return False
+        previous = self.last_values.get(channel_name)
+        # Arrays are copied, since they may be reused and modified in place
+        self.last_values[channel_name] = (
+            value.copy() if isinstance(value, np.ndarray) else value
+        )
+        if isinstance(value, np.ndarray) or isinstance(previous, np.ndarray):
+            return np.array_equal(previous, value)
+        return previous == value
+
+    def reduce(self, channel_name, value):
+        """
+        Values to send for a published value: the value itself, nothing if it
+        is unchanged, or for channels with a `decimate` key, the reduced values
+        of each completed interval. Intervals that end without a later value
+        are sent by `release_decimated`, and values of channels over their
+        `max_rate` are held and sent later by `release`.
+        """
+        if self.is_unchanged(channel_name, value):
+            return ()
+        if channel_name not in self.decimators:
+            return self.schedule(channel_name, (value,))
+        return self.schedule(channel_name, self.decimate(channel_name, value))
+
+    def decimate(self, channel_name, value):
+        """
+        Add a value to a channel's decimator, returning the reduced values of
+        the interval it completes. A newly opened interval is flushed by a
+        timer once it ends.
+        """
+        decimator = self.decimators[channel_name]
+        values = decimator.add(value)
+        if values:
+            timer = self.decimate_timers.pop(channel_name, None)
+            if timer is not None:
+                timer.cancel()
+        elif channel_name not in self.decimate_timers:
+            self.decimate_timers[channel_name] = self.call_later(
+                decimator.interval, self.release_decimated, channel_name
+            )
+        return values
+
+    def release_decimated(self, channel_name):
+        """
+        Send the reduced values of a decimated channel's interval that ended
+        without a later value.
+        """
+        self.decimate_timers.pop(channel_name, None)
+        decimator = self.decimators.get(channel_name)
+        if decimator is None or not len(decimator):
+            return
+        for value in self.schedule(channel_name, decimator.flush()):
+            self.send_released(channel_name, value)
+
+    def schedule(self, channel_name, values):
+        """
+        Values of a channel that may be sent now. For channels over their
+        `max_rate`, the newest other value is held and sent later by `release`.
+        """
+        if channel_name not in self.scheduler:
+            return values
+        values = [
+            value for value in values if self.scheduler.offer(channel_name, value)
+        ]
+        self.schedule_release(channel_name)
+        return values
+
+    @property
+    def throttled_channels(self):
+        """
+        Channels currently holding back a value because of their `max_rate`.
+        """
+        return self.scheduler.throttled
+
+    def schedule_release(self, channel_name):
+        delay = self.scheduler.arm(channel_name)
+        if delay is not None:
+            self.release_timers[channel_name] = self.call_later(
+                delay, self.release, channel_name
+            )
+
+    def call_later(self, delay, callback, *args):
+        """
+        Call `callback(*args)` after `delay` seconds, from a timer thread.
+        Returns a handle with a `cancel()` method.
+        """
+        timer = threading.Timer(delay, callback, args)
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    def release(self, channel_name):
+        """
+        Send a rate-limited channel's held value once it is due.
+        """
+        self.release_timers.pop(channel_name, None)
+        for record in self.scheduler.release(channel_name):
+            self.send_released(*record)
+        self.schedule_release(channel_name)
+
+    @abstractmethod
+    def send_released(self, channel_name, value):
+        """Send a value released by the scheduler."""
+
+    def drain_held(self):
+        """
+        Stop pending releases and return every value still held back, including
+        those of the decimators, as records.
+        """
+        for timer in [*self.release_timers.values(), *self.decimate_timers.values()]:
+            timer.cancel()
+        self.release_timers = {}
+        self.decimate_timers = {}
+        return self.flush_decimators() + self.scheduler.drain()
+
+    def flush_decimators(self):
+        """
+        Reduce and return the values still held by the decimators as records.
+        """
+        return [
+            (channel_name, value)
+            for channel_name, decimator in self.decimators.items()
+            if len(decimator)
+            for value in decimator.flush()
+        ]
+
+    async def watch_interface(self, interval=1.0):
+        """
+        Reload the channels whenever the interface file changes. Run as a task.
+        """
+        await watch_interface_file(self.interface_file, self.reload_interface, interval)
+
+    def measure(self, encode, channel_name, value, *args):
+        """
+        Call `encode(channel_name, value, *args)`, recording its size and
+        duration if metrics are enabled.
+        """
+        if self.metrics is None:
+            return encode(channel_name, value, *args)
+        start = time.perf_counter()
+        encoded = encode(channel_name, value, *args)
+        self.metrics.record_encode(
+            channel_name, len(encoded), time.perf_counter() - start
+        )
+        return encoded
 
     def format(self, channel_name, value):
         """
         Format the value to be published to a channel.
         """
-        return json.dumps(
-            {
-                "source": self.name,
-                "channel": channel_name,
-                "value": value,
-            }
+        return self.measure(
+            self.codec.encode, channel_name, value, self.trace(channel_name)
+        )
+
+    def format_value(self, channel_name, value):
+        """
+        Format only the value, for transports that carry the channel name.
+        """
+        return self.measure(
+            self.codec.encode_value, channel_name, value, self.trace(channel_name)
+        )
+
+    def format_batch(self, records):
+        """
+        Format a list of (channel, value) records as a single multi-record message.
+        """
+        if self.metrics is None and not self.traced:
+            return self.codec.encode_batch(records)
+        return self.codec.join_batch(
+            [
+                self.measure(
+                    self.codec.encode_record,
+                    channel_name,
+                    value,
+                    self.trace(channel_name),
+                )
+                for channel_name, value in records
+            ]
         )
 
     @abstractmethod
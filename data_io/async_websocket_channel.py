@@ -0,0 +1,237 @@
+import asyncio
+import time
+
+import websockets
+from websockets.exceptions import ConnectionClosed
+
+from data_io.abstract_channel import AbstractChannelPublisher
+from data_io.batching import AsyncOutbox, BackpressureError
+
+
+class AsyncWebSocketChannelPublisher(AbstractChannelPublisher):
+    """Publish messages to data channels via WebSocket from an asyncio event loop."""
+
+    def __init__(
+        self,
+        source_name: str,
+        interface_file: str,
+        ws_url="ws://localhost:8080",
+        max_outbox=100000,
+        batch_size=1000,
+        retry_interval=1,
+        coalesce=(),
+        encoding="json",
+    ):
+        """
+        Parse the interface file. The connection is opened by `start()`.
+        :param max_outbox: Maximum number of records waiting to be sent.
+        :param batch_size: Maximum number of records sent in a single frame.
+        :param retry_interval: Seconds to wait between reconnect attempts.
+        :param coalesce: Channels for which only the newest queued value is sent.
+        :param encoding: Wire encoding for messages, "json" or "binary".
+        """
+        super().__init__(source_name, interface_file, encoding)
+        self.ws_url = f"{ws_url}/producer"
+        self.ws = None
+        self.outbox = AsyncOutbox(max_outbox, coalesce, batch_size)
+        self.retry_interval = retry_interval
+        self.sender = None
+        self.receiver = None
+        self.connecting = asyncio.Lock()
+        self.connected_once = False
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    @property
+    def queue_depth(self):
+        return len(self.outbox)
+
+    @property
+    def queue_dropped(self):
+        return self.outbox.queue.dropped
+
+    async def start(self):
+        """
+        Connect to the WebSocket server and start the background sender and
+        the receiver of subscription updates.
+        """
+        await self.connect()
+        self.sender = asyncio.create_task(self.send_loop())
+        self.receiver = asyncio.create_task(self.receive_loop())
+
+    async def connect(self):
+        """
+        Connect to the WebSocket server, retrying until it succeeds.
+        """
+        async with self.connecting:
+            while self.ws is None:
+                await self.try_connect()
+        return self.ws
+
+    async def try_connect(self):
+        try:
+            self.ws = await websockets.connect(self.ws_url)
+            print(f"Connected to WebSocket server at {self.ws_url}")
+            if self.connected_once and self.metrics is not None:
+                self.metrics.inc("reconnects")
+            self.connected_once = True
+        except Exception as e:
+            print(f"Failed to connect to WebSocket server: {e}. Retrying...")
+            await asyncio.sleep(self.retry_interval)
+
+    async def receive_loop(self):
+        """
+        Apply the subscription updates sent by the broker or proxy, reconnecting
+        whenever the connection drops, even while nothing is being sent.
+        """
+        while True:
+            ws = await self.connect()
+            try:
+                async for message in ws:
+                    if isinstance(message, str):
+                        self.handle_control(message)
+            except ConnectionClosed:
+                pass
+            if self.ws is ws:
+                print("WebSocket disconnected. Attempting to reconnect...")
+                self.ws = None
+
+    async def publish(self, channel_name, value):
+        """
+        Queue a value for sending, waiting for outbox space if it is full.
+        Values are encoded when sent, so arrays must not be modified in place
+        after they are published. Values for channels nobody watches are
+        discarded.
+        """
+        if channel_name in self.idle:
+            return
+        value = self.prepare(channel_name, value)
+        for value in self.reduce(channel_name, value):
+            await self.outbox.put(channel_name, value)
+
+    async def publish_many(self, channel_name, values, timestamps=None):
+        """
+        Queue a block of values of a time series or struct channel, sent as a
+        single columnar record. See `make_block` for the accepted values;
+        `timestamps` are optional seconds since the epoch, one per value.
+        """
+        if channel_name in self.idle:
+            return
+        block = self.make_block(channel_name, values, timestamps)
+        for block in self.reduce_block(channel_name, block):
+            await self.outbox.put(channel_name, block)
+
+    def publish_nowait(self, channel_name, value):
+        """
+        Queue a value for sending without waiting.
+        Raises BackpressureError if the outbox is full.
+        """
+        if channel_name in self.idle:
+            return
+        value = self.prepare(channel_name, value)
+        for value in self.reduce(channel_name, value):
+            self.outbox.put_nowait(channel_name, value)
+
+    def call_later(self, delay, callback, *args):
+        return asyncio.get_running_loop().call_later(delay, callback, *args)
+
+    def send_released(self, channel_name, value):
+        try:
+            self.outbox.put_nowait(channel_name, value)
+        except BackpressureError:
+            if self.metrics is not None:
+                self.metrics.inc("dropped", channel_name)
+            print(f"Dropped rate-limited value for '{channel_name}': outbox full.")
+
+    async def send_loop(self):
+        """
+        Send queued records, reconnecting whenever the connection drops.
+        """
+        while records := await self.outbox.get_batch():
+            frame = self.encode_records(records)
+            if frame is None:
+                continue
+
+            while True:
+                ws = await self.connect()
+                start = time.perf_counter()
+                try:
+                    await ws.send(frame)
+                    if self.metrics is not None:
+                        self.metrics.observe(
+                            "send_seconds", time.perf_counter() - start
+                        )
+                    break
+                except ConnectionClosed:
+                    print("WebSocket disconnected. Attempting to reconnect...")
+                    self.ws = None
+                except Exception as e:
+                    print(f"Failed to send frame: {e}. Reconnecting...")
+                    self.ws = None
+                    await ws.close()
+
+    def encode_records(self, records):
+        """
+        Encode queued records as one frame. Records that cannot be encoded are
+        logged and dropped; returns None if none could be.
+        """
+        try:
+            if len(records) == 1:
+                return self.format(*records[0])
+            return self.format_batch(records)
+        except Exception as e:
+            if len(records) == 1:
+                self.drop_unencodable(records[0][0], e)
+                return None
+
+        # Encode the records one at a time to find the bad ones
+        encoded = []
+        for channel_name, value in records:
+            try:
+                encoded.append(
+                    self.measure(
+                        self.codec.encode_record,
+                        channel_name,
+                        value,
+                        self.trace(channel_name),
+                    )
+                )
+            except Exception as e:
+                self.drop_unencodable(channel_name, e)
+        return self.codec.join_batch(encoded) if encoded else None
+
+    def drop_unencodable(self, channel_name, error):
+        if self.metrics is not None:
+            self.metrics.inc("dropped", channel_name)
+        print(f"Dropped a value for '{channel_name}' that cannot be encoded: {error}")
+
+    async def close(self, timeout=5):
+        """
+        Send any queued records and close the WebSocket connection.
+        """
+        for channel_name, value in self.drain_held():
+            await self.outbox.put(channel_name, value)
+        self.outbox.close()
+        if self.sender is not None:
+            try:
+                await asyncio.wait_for(self.sender, timeout)
+            except asyncio.TimeoutError:
+                print(f"Dropped {len(self.outbox)} unsent records on close.")
+            self.sender = None
+        if self.receiver is not None:
+            self.receiver.cancel()
+            try:
+                await self.receiver
+            except asyncio.CancelledError:
+                pass
+            self.receiver = None
+
+        if self.ws is not None:
+            await self.ws.close()
+            self.ws = None
+            print("WebSocket connection closed.")
@@ -0,0 +1,274 @@
+"""Bounded, coalescing publish queue used for batched publishing."""
+
+import asyncio
+import threading
+import time
+from collections import deque
+
+
+class BackpressureError(RuntimeError):
+    """Raised when a publish queue is full and cannot accept more values."""
+
+
+OVERFLOW_POLICIES = ("reject", "drop_oldest", "coalesce")
+
+
+class PublishQueue:
+    """Bounded queue of (channel, value) records with per-channel coalescing."""
+
+    def __init__(self, max_size=100000, coalesce=(), overflow="reject"):
+        """
+        Create an empty queue.
+        :param max_size: Maximum number of pending records.
+        :param coalesce: Channel names for which only the latest value is kept.
+        :param overflow: What to do with a new record when the queue is full:
+            "reject" it, "drop_oldest" queued record, or "coalesce" the queued
+            records down to the latest value per channel.
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(
+                f"Unknown overflow policy '{overflow}'. "
+                f"Expected one of: {', '.join(OVERFLOW_POLICIES)}."
+            )
+        self.max_size = max_size
+        self.coalesce = set(coalesce)
+        self.overflow = overflow
+        self.records = deque()
+        self.latest = {}
+        self.oldest = None  # Monotonic time the oldest pending record was queued
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.records) + len(self.latest)
+
+    @property
+    def full(self):
+        return len(self) >= self.max_size
+
+    def put(self, channel_name, value):
+        """
+        Queue a value. Returns False if the queue is full and the value was dropped.
+        """
+        if channel_name in self.coalesce:
+            if channel_name not in self.latest and self.full:
+                self.dropped += 1
+                return False
+            self.latest[channel_name] = value
+        else:
+            if self.full and not self.make_room():
+                self.dropped += 1
+                return False
+            self.records.append((channel_name, value))
+
+        if self.oldest is None:
+            self.oldest = time.monotonic()
+        return True
+
+    def make_room(self):
+        """
+        Apply the overflow policy. Returns True if there is now room for a record.
+        """
+        if self.overflow == "coalesce":
+            latest = {}
+            for channel_name, value in self.records:
+                latest[channel_name] = value
+            self.dropped += len(self.records) - len(latest)
+            self.records = deque(latest.items())
+        if self.overflow != "reject" and self.full and self.records:
+            self.records.popleft()
+            self.dropped += 1
+        return not self.full
+
+    def age(self):
+        """
+        Seconds since the oldest pending record was queued, or None if empty.
+        """
+        if self.oldest is None:
+            return None
+        return time.monotonic() - self.oldest
+
+    def drain(self, limit=None):
+        """
+        Remove and return up to `limit` records, followed by all coalesced values.
+        """
+        if limit is None or limit >= len(self.records):
+            records = list(self.records)
+            self.records.clear()
+        else:
+            records = [self.records.popleft() for _ in range(limit)]
+
+        if self.latest:
+            records.extend(self.latest.items())
+            self.latest.clear()
+
+        if not self.records:
+            self.oldest = None
+        return records
+
+
+class BackgroundFlusher:
+    """Flush a PublishQueue from a background thread in size/latency-bounded batches."""
+
+    def __init__(
+        self, send, batch_size, max_latency=0.01, max_queue=100000, coalesce=()
+    ):
+        """
+        Start the flusher thread.
+        :param send: Callable that sends a list of (channel, value) records.
+        :param batch_size: Flush once this many records are queued.
+        :param max_latency: Maximum seconds a record may wait before being flushed.
+        :param max_queue: Maximum number of queued records before put fails.
+        :param coalesce: Channels for which only the newest queued value is sent.
+        """
+        self.send = send
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.queue = PublishQueue(max_queue, coalesce)
+        self.ready = threading.Condition()
+        self.closing = False
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def __len__(self):
+        return len(self.queue)
+
+    def put(self, channel_name, value):
+        """
+        Queue a value. Raises BackpressureError if the queue is full and
+        RuntimeError if a previous background flush failed.
+        """
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise RuntimeError(f"Failed to publish message: {error}") from error
+
+        with self.ready:
+            if not self.queue.put(channel_name, value):
+                raise BackpressureError(
+                    f"Publish queue is full ({self.queue.max_size} records pending)."
+                )
+            if len(self.queue) >= self.batch_size:
+                self.ready.notify()
+
+    def run(self):
+        """
+        Flush queued records once a full batch is ready or the oldest is too old.
+        """
+        while True:
+            with self.ready:
+                while not self.closing and len(self.queue) < self.batch_size:
+                    age = self.queue.age()
+                    if age is not None and age >= self.max_latency:
+                        break
+                    timeout = None if age is None else self.max_latency - age
+                    self.ready.wait(timeout)
+                if self.closing:
+                    return
+                records = self.queue.drain(self.batch_size)
+
+            try:
+                self.send(records)
+            except Exception as e:
+                self.error = e
+
+    def flush(self):
+        """
+        Send every queued record immediately from the calling thread.
+        """
+        while True:
+            with self.ready:
+                records = self.queue.drain(self.batch_size)
+            if not records:
+                return
+            try:
+                self.send(records)
+            except Exception as e:
+                raise RuntimeError(f"Failed to publish message: {e}") from e
+
+    def close(self):
+        """
+        Stop the flusher thread and send anything still queued.
+        """
+        with self.ready:
+            self.closing = True
+            self.ready.notify()
+        self.thread.join()
+        self.flush()
+
+
+class AsyncOutbox:
+    """PublishQueue that lets asyncio tasks wait for space and for batches."""
+
+    def __init__(self, max_size=100000, coalesce=(), batch_size=1000, max_latency=0):
+        """
+        Create an empty outbox.
+        :param max_size: Maximum number of pending records.
+        :param coalesce: Channels for which only the latest value is kept.
+        :param batch_size: Maximum number of records returned by `get_batch`.
+        :param max_latency: Seconds `get_batch` waits for a partial batch to fill.
+        """
+        self.queue = PublishQueue(max_size, coalesce)
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.pending = asyncio.Event()
+        self.space = asyncio.Event()
+        self.batch_ready = asyncio.Event()
+        self.closed = False
+
+    def __len__(self):
+        return len(self.queue)
+
+    async def put(self, channel_name, value):
+        """
+        Queue a value, waiting for space if the outbox is full.
+        """
+        while self.queue.full and channel_name not in self.queue.latest:
+            self.space.clear()
+            await self.space.wait()
+        self.queue.put(channel_name, value)
+        self.notify()
+
+    def put_nowait(self, channel_name, value):
+        """
+        Queue a value without waiting. Raises BackpressureError if the outbox is full.
+        """
+        if not self.queue.put(channel_name, value):
+            raise BackpressureError(
+                f"Outbox is full ({self.queue.max_size} records pending)."
+            )
+        self.notify()
+
+    def notify(self):
+        self.pending.set()
+        if len(self.queue) >= self.batch_size:
+            self.batch_ready.set()
+
+    async def get_batch(self):
+        """
+        Wait for queued records and return the next batch.
+        Returns an empty list once the outbox is closed and drained.
+        """
+        while not self.queue:
+            if self.closed:
+                return []
+            self.pending.clear()
+            await self.pending.wait()
+
+        if self.max_latency and len(self.queue) < self.batch_size and not self.closed:
+            self.batch_ready.clear()
+            try:
+                await asyncio.wait_for(self.batch_ready.wait(), self.max_latency)
+            except asyncio.TimeoutError:
+                pass
+
+        records = self.queue.drain(self.batch_size)
+        self.space.set()
+        return records
+
+    def close(self):
+        """
+        Stop accepting waits; `get_batch` returns what is left, then an empty list.
+        """
+        self.closed = True
+        self.pending.set()
+        self.batch_ready.set()
@@ -0,0 +1,358 @@
+"""Asyncio WebSocket broker that fans producer messages out to consumers."""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import time
+from urllib.parse import parse_qs, urlparse
+
+import websockets
+from websockets.exceptions import ConnectionClosed
+
+from data_io.batching import OVERFLOW_POLICIES, PublishQueue
+from data_io.channel_store import ChannelStore
+from data_io.codec import CODECS, DECODE_ERRORS, BinaryCodec, make_codec
+from data_io.parse import parse_interface_file
+
+
+class Consumer:
+    """A connected consumer with its own bounded send queue and channel filter."""
+
+    def __init__(
+        self,
+        connection,
+        codec,
+        channels=None,
+        max_queue=10000,
+        policy="drop_oldest",
+        snapshot_codec=None,
+    ):
+        """
+        :param connection: The consumer's WebSocket connection.
+        :param codec: Codec used to join queued records into frames.
+        :param channels: Channel names to forward, or None for every channel.
+        :param max_queue: Maximum number of records waiting to be sent.
+        :param policy: Slow-consumer policy when the queue is full,
+            "drop_oldest" or "coalesce" to the latest value per channel.
+        :param snapshot_codec: Codec used to encode history snapshots
+            (defaults to `codec`).
+        """
+        self.connection = connection
+        self.codec = codec
+        self.snapshot_codec = snapshot_codec or codec
+        self.channels = channels
+        self.queue = PublishQueue(max_queue, overflow=policy)
+        self.snapshots = []
+        self.ready = asyncio.Event()
+
+    @property
+    def dropped(self):
+        return self.queue.dropped
+
+    def wants(self, channel_name):
+        return self.channels is None or channel_name in self.channels
+
+    def put(self, channel_name, encoded_record):
+        self.queue.put(channel_name, encoded_record)
+        self.ready.set()
+
+    def put_snapshot(self, records):
+        """
+        Queue a history snapshot, sent as one frame ahead of any live records.
+        """
+        if records:
+            self.snapshots.append(self.snapshot_codec.encode_batch(records))
+            self.ready.set()
+
+    async def send_loop(self, batch_size=1000):
+        """
+        Send queued records as batch frames for as long as the consumer is connected.
+        """
+        try:
+            await self.drain_forever(batch_size)
+        except ConnectionClosed:
+            pass
+
+    async def drain_forever(self, batch_size):
+        while True:
+            await self.ready.wait()
+            while self.snapshots:
+                await self.connection.send(self.snapshots.pop(0))
+            records = self.queue.drain(batch_size)
+            if not self.queue:
+                self.ready.clear()
+            if records:
+                await self.connection.send(
+                    self.codec.join_batch([record for _, record in records])
+                )
+
+
+class ChannelBroker:
+    """Accept producers on /producer and fan their messages out to /consumer clients."""
+
+    def __init__(
+        self,
+        interface_file,
+        verbose=False,
+        max_queue=10000,
+        policy="drop_oldest",
+    ):
+        """
+        Parse the interface file and create the per-channel history store.
+        :param max_queue: Maximum number of records queued per consumer.
+        :param policy: Slow-consumer policy, "drop_oldest" or "coalesce".
+        """
+        self.channels = parse_interface_file(interface_file)["data_channels"]
+        self.decoder = BinaryCodec("broker", self.channels)
+        self.codecs = {
+            encoding: make_codec(encoding, "broker", self.channels)
+            for encoding in CODECS
+        }
+        # Snapshots go to a single consumer, so they must not advance the
+        # delta compression state shared by everyone using the live codecs
+        self.snapshot_codecs = dict(
+            self.codecs, binary=BinaryCodec("broker", self.channels, compress=False)
+        )
+        self.store = ChannelStore(self.channels)
+        self.verbose = verbose
+        self.max_queue = max_queue
+        self.policy = policy
+        self.producers = set()
+        self.consumers = set()
+        self.subscriptions = set()  # Channels with a consumer; None for all
+
+    async def start(self, port, local_only=False):
+        """
+        Serve producers and consumers until cancelled.
+        """
+        host = "127.0.0.1" if local_only else "0.0.0.0"
+        async with websockets.serve(self.handle_connection, host, port, max_size=None):
+            print(
+                f"Broker started:\n- Producers: ws://{host}:{port}/producer"
+                f"\n- Consumers: ws://{host}:{port}/consumer"
+            )
+            await asyncio.Future()
+
+    async def handle_connection(self, connection):
+        url = urlparse(connection.request.path)
+        if url.path == "/producer":
+            await self.handle_producer(connection)
+        elif url.path == "/consumer":
+            await self.handle_consumer(connection, parse_qs(url.query))
+        else:
+            if self.verbose:
+                print("Invalid connection path")
+            await connection.close(4000, "Invalid path")
+
+    async def handle_producer(self, connection):
+        """
+        Forward every frame a producer sends until it disconnects. Producers
+        are sent {"subscriptions": [...] | null} on connect and whenever the
+        set of watched channels changes (null: every channel).
+        """
+        self.producers.add(connection)
+        if self.verbose:
+            print("Producer connected")
+        try:
+            await connection.send(self.subscription_message())
+            async for frame in connection:
+                self.forward(frame)
+        except ConnectionClosed:
+            pass
+        finally:
+            self.producers.discard(connection)
+            if self.verbose:
+                print("Producer disconnected")
+
+    def subscribed_channels(self):
+        """
+        Channels at least one consumer wants, or None if a consumer wants all.
+        """
+        subscribed = set()
+        for consumer in self.consumers:
+            if consumer.channels is None:
+                return None
+            subscribed |= consumer.channels
+        return subscribed
+
+    def subscription_message(self):
+        subscriptions = self.subscriptions
+        if subscriptions is not None:
+            subscriptions = sorted(subscriptions)
+        return json.dumps({"subscriptions": subscriptions})
+
+    def update_subscriptions(self):
+        """
+        Tell producers which channels are watched whenever that changes, so
+        they can skip producing the others.
+        """
+        subscriptions = self.subscribed_channels()
+        if subscriptions == self.subscriptions:
+            return
+        self.subscriptions = subscriptions
+        websockets.broadcast(self.producers, self.subscription_message())
+
+    def forward(self, frame):
+        """
+        Record a producer frame in the store and queue it for each interested consumer.
+        Records are encoded once per encoding, not once per consumer. Traced
+        records get a "broker" hop time.
+        """
+        try:
+            records = self.decoder.decode_traced(frame)
+        except DECODE_ERRORS as e:
+            if self.verbose:
+                print(f"Dropped invalid producer frame: {e}")
+            return
+
+        unknown = {name for name, _, _ in records if name not in self.channels}
+        if unknown:
+            if self.verbose:
+                print(f"Dropped records for unknown channels: {sorted(unknown)}")
+            records = [record for record in records if record[0] not in unknown]
+
+        self.store.extend([(channel_name, value) for channel_name, value, _ in records])
+
+        now = time.time()
+        for _, _, trace in records:
+            if trace is not None:
+                trace.stamp("broker", now)
+
+        encoded = {}
+        for consumer in self.consumers:
+            codec = consumer.codec
+            if codec not in encoded:
+                encoded[codec] = self.encode_records(codec, records)
+            for channel_name, record in encoded[codec]:
+                if consumer.wants(channel_name):
+                    consumer.put(channel_name, record)
+
+    def encode_records(self, codec, records):
+        """
+        Encode (channel, value, trace) records for consumers of one encoding.
+        Records that cannot be encoded are logged and skipped.
+        """
+        encoded = []
+        for channel_name, value, trace in records:
+            try:
+                encoded.append(
+                    (channel_name, codec.encode_record(channel_name, value, trace))
+                )
+            except Exception as e:
+                print(
+                    f"Dropped a record for '{channel_name}' that cannot be encoded: {e}"
+                )
+        return encoded
+
+    async def handle_consumer(self, connection, query):
+        """
+        Send a history snapshot, then stream live records until the consumer leaves.
+        Query parameters: `channels` (comma-separated filter), `encoding` and
+        `history` (0 to skip the snapshot, e.g. for recorders).
+        """
+        encoding = query.get("encoding", ["json"])[0]
+        if encoding not in self.codecs:
+            await connection.close(4000, f"Unknown encoding '{encoding}'")
+            return
+        channels = None
+        if "channels" in query:
+            channels = set(query["channels"][0].split(","))
+
+        consumer = Consumer(
+            connection,
+            self.codecs[encoding],
+            channels,
+            self.max_queue,
+            self.policy,
+            self.snapshot_codecs[encoding],
+        )
+        # Registering and taking the snapshot happen without yielding to the
+        # event loop, so the consumer sees every record exactly once.
+        self.consumers.add(consumer)
+        if query.get("history", ["1"])[0] != "0":
+            consumer.put_snapshot(self.store.snapshot_records(channels))
+        self.update_subscriptions()
+        if self.verbose:
+            print("Consumer connected")
+
+        sender = asyncio.create_task(consumer.send_loop())
+        try:
+            async for message in connection:
+                self.handle_control(consumer, message)
+        except ConnectionClosed:
+            pass
+        finally:
+            self.consumers.discard(consumer)
+            self.update_subscriptions()
+            sender.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await sender
+            if self.verbose:
+                print(f"Consumer disconnected ({consumer.dropped} records dropped)")
+
+    def handle_control(self, consumer, message):
+        """
+        Apply a {"action": "subscribe" | "unsubscribe", "channels": [...]} message.
+        Newly subscribed channels are sent their history snapshot first.
+        """
+        try:
+            request = json.loads(message)
+            action, channels = request["action"], set(request["channels"])
+        except (ValueError, KeyError, TypeError):
+            if self.verbose:
+                print(f"Ignored invalid consumer message: {message!r}")
+            return
+
+        if action == "subscribe":
+            if consumer.channels is None:
+                return
+            added = channels - consumer.channels
+            consumer.channels |= added
+            consumer.put_snapshot(self.store.snapshot_records(added))
+        elif action == "unsubscribe":
+            if consumer.channels is None:
+                consumer.channels = set(self.channels)
+            consumer.channels -= channels
+        self.update_subscriptions()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="WebSocket channel broker")
+    parser.add_argument(
+        "-p", "--port", required=True, type=int, help="Port to listen on"
+    )
+    parser.add_argument(
+        "-i", "--interface-file", required=True, help="Interface (MDX) file"
+    )
+    parser.add_argument(
+        "--local", action="store_true", help="Restrict to local connections only"
+    )
+    parser.add_argument(
+        "--max-queue",
+        type=int,
+        default=10000,
+        help="Maximum records queued per consumer (default: 10000)",
+    )
+    parser.add_argument(
+        "--policy",
+        choices=[policy for policy in OVERFLOW_POLICIES if policy != "reject"],
+        default="drop_oldest",
+        help="Slow-consumer policy (default: drop_oldest)",
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="Enable verbose output"
+    )
+    args = parser.parse_args()
+
+    broker = ChannelBroker(
+        args.interface_file,
+        verbose=args.verbose,
+        max_queue=args.max_queue,
+        policy=args.policy,
+    )
+
+    try:
+        asyncio.run(broker.start(args.port, args.local))
+    except KeyboardInterrupt:
+        print("Shutting down...")
@@ -0,0 +1,216 @@
+"""Server-side history for data channels."""
+
+from collections import defaultdict
+
+import numpy as np
+
+from data_io.codec import ColumnBlock, resolve_dtype
+
+
+def channel_dtype(config):
+    """
+    NumPy dtype used to store one value of a channel.
+    Scalar and struct channels get typed storage; anything else is kept as objects.
+    """
+    channel_type = config.get("type")
+    if channel_type == "time_series":
+        return np.dtype(resolve_dtype(config.get("dtype")))
+    if channel_type == "struct":
+        return np.dtype(
+            [
+                (field, resolve_dtype(dtype))
+                for field, dtype in config.get("fields", {}).items()
+            ]
+        )
+    return np.dtype(object)
+
+
+class ChannelRingBuffer:
+    """Fixed-capacity ring buffer backed by a NumPy array."""
+
+    def __init__(self, capacity, dtype=object, frame_shape=()):
+        """
+        Allocate the buffer.
+        :param capacity: Maximum number of values kept.
+        :param dtype: Dtype of one value; structured dtypes store struct records.
+        :param frame_shape: Shape of one value, for array and image channels
+            stored as a single (capacity, *frame_shape) array.
+        """
+        if capacity < 1:
+            raise ValueError("Ring buffer capacity must be at least 1.")
+        self.capacity = capacity
+        self.frame_shape = tuple(frame_shape)
+        self.data = np.empty((capacity, *self.frame_shape), dtype=dtype)
+        self.fields = self.data.dtype.names
+        self.count = 0  # Total number of values ever appended
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(int(config.get("buffer", 1)), channel_dtype(config))
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def coerce(self, value):
+        if self.fields and isinstance(value, dict):
+            return tuple(value[field] for field in self.fields)
+        if self.frame_shape and np.shape(value) != self.frame_shape:
+            raise ValueError(
+                f"Expected a value of shape {self.frame_shape}, got {np.shape(value)}."
+            )
+        return value
+
+    def append(self, value):
+        """
+        Append one value, overwriting the oldest once full.
+        """
+        self.data[self.count % self.capacity] = self.coerce(value)
+        self.count += 1
+
+    def extend(self, values):
+        """
+        Append many values with at most two slice assignments.
+        """
+        if self.data.dtype == object:
+            block = np.empty(len(values), dtype=object)
+            for i, value in enumerate(values):
+                block[i] = value  # Element-wise, so arrays stay whole objects
+        elif self.fields:
+            block = np.array([self.coerce(value) for value in values], self.data.dtype)
+        else:
+            block = np.asarray(values, dtype=self.data.dtype)
+            if block.shape[1:] != self.frame_shape:
+                raise ValueError(
+                    f"Expected values of shape {self.frame_shape}, "
+                    f"got {block.shape[1:]}."
+                )
+
+        skipped = max(len(block) - self.capacity, 0)
+        block = block[skipped:]
+        start = (self.count + skipped) % self.capacity
+        head = min(len(block), self.capacity - start)
+        self.data[start : start + head] = block[:head]
+        self.data[: len(block) - head] = block[head:]
+        self.count += len(values)
+
+    def window(self, n=None):
+        """
+        The last `n` values (all stored values by default), oldest first.
+        Returns a copy, since the buffer keeps being overwritten.
+        """
+        size = len(self)
+        n = size if n is None else min(n, size)
+        end = self.count % self.capacity
+        if n <= end:
+            return self.data[end - n : end].copy()
+        return np.concatenate((self.data[end - n :], self.data[:end]))
+
+    def snapshot(self):
+        return self.window()
+
+    def latest(self):
+        """
+        The most recently appended value, or None if empty.
+        """
+        if not self.count:
+            return None
+        return self.data[(self.count - 1) % self.capacity]
+
+    def values(self):
+        """
+        Stored values as plain Python objects, oldest first.
+        """
+        snapshot = self.snapshot()
+        if self.fields:
+            return [dict(zip(self.fields, row)) for row in snapshot.tolist()]
+        return snapshot.tolist()
+
+
+class ChannelStore:
+    """Per-channel ring buffers sized and typed from the interface file channels."""
+
+    def __init__(self, channels, typed_arrays=False):
+        """
+        Create one ring buffer per channel, using the channel's `buffer` size.
+        :param typed_arrays: Store array and image channels as one typed array
+            per channel, shaped after the first value received, instead of as
+            objects.
+        """
+        self.buffers = {
+            name: ChannelRingBuffer.from_config(config)
+            for name, config in channels.items()
+        }
+        self.array_dtypes = {}
+        if typed_arrays:
+            for name, config in channels.items():
+                if config.get("type") == "image":
+                    self.array_dtypes[name] = resolve_dtype(
+                        config.get("dtype"), "uint8"
+                    )
+                elif config.get("type") == "array":
+                    self.array_dtypes[name] = resolve_dtype(config.get("dtype"))
+
+    def __getitem__(self, channel_name):
+        return self.buffers[channel_name]
+
+    def append(self, channel_name, value):
+        """
+        Record a value published to a channel. Unknown channels are ignored.
+        """
+        if isinstance(value, ColumnBlock):
+            self.extend([(channel_name, value)])
+            return
+        buffer = self.buffers.get(channel_name)
+        if buffer is None:
+            return
+        try:
+            buffer.append(value)
+        except (TypeError, ValueError, KeyError):
+            # The value does not fit the declared layout (e.g. a list of struct
+            # records), so keep this channel's history as plain objects instead.
+            buffer = self.buffers[channel_name] = ChannelRingBuffer(buffer.capacity)
+            buffer.append(value)
+
+    def extend(self, records):
+        """
+        Record a list of (channel, value) records, appending the values of
+        each channel in bulk. Column blocks are stored value by value.
+        """
+        grouped = defaultdict(list)
+        for channel_name, value in records:
+            if isinstance(value, ColumnBlock):
+                grouped[channel_name].extend(value.rows())
+            else:
+                grouped[channel_name].append(value)
+        for channel_name, values in grouped.items():
+            self.extend_channel(channel_name, values)
+
+    def extend_channel(self, channel_name, values):
+        buffer = self.buffers.get(channel_name)
+        if buffer is None:
+            return
+        if (
+            not buffer.count
+            and buffer.data.dtype == object
+            and channel_name in self.array_dtypes
+        ):
+            buffer = self.buffers[channel_name] = ChannelRingBuffer(
+                buffer.capacity, self.array_dtypes[channel_name], np.shape(values[0])
+            )
+        try:
+            buffer.extend(values)
+        except (TypeError, ValueError, KeyError):
+            for value in values:
+                self.append(channel_name, value)
+
+    def snapshot_records(self, channels=None):
+        """
+        Stored history as (channel, value) records, ready to be sent to a new
+        subscriber as a single batch before the live stream.
+        """
+        names = self.buffers if channels is None else channels
+        records = []
+        for name in names:
+            if name in self.buffers:
+                records.extend((name, value) for value in self.buffers[name].values())
+        return records
@@ -0,0 +1,656 @@
+"""Wire encodings for channel messages."""
+
+import json
+import math
+import struct
+import time
+
+import numpy as np
+
+from data_io.compression import ArrayCompressor
+
+# Binary frames start with a fixed header: magic byte, record kind, channel id.
+# Channel ids are the position of the channel in the interface file front matter.
+MAGIC = 0xD1
+HEADER = struct.Struct("<BBH")
+COUNT = struct.Struct("<I")
+ARRAY_HEADER = struct.Struct("<BB")  # dtype code, number of dimensions
+SCALAR = struct.Struct("<d")
+TRACE = struct.Struct("<QdB")  # sequence number, send time, number of hops
+NAME_SIZE = struct.Struct("<B")
+NO_SEQ = (1 << 64) - 1  # Binary trace of a record with only hop times
+
+KIND_JSON = 0
+KIND_SCALAR = 1
+KIND_STRUCT = 2
+KIND_STRUCT_LIST = 3
+KIND_ARRAY = 4
+KIND_BATCH = 5
+KIND_PACKED = 6  # Array with a compressed payload, see data_io.compression
+KIND_COLUMNS = 7  # Block of time series or struct values, see ColumnBlock
+KIND_TRACED = 8  # Trace followed by a record frame, see Trace
+KIND_HOP = 9  # Hop name and time stamped by a proxy, followed by any frame
+
+HAS_TIMESTAMPS = 1  # Column block flag
+
+# Raised by the codecs for payloads that are not valid channel messages
+DECODE_ERRORS = (
+    ValueError,
+    KeyError,
+    IndexError,
+    TypeError,
+    AttributeError,
+    struct.error,
+)
+
+# Index in this list is the dtype code sent on the wire.
+DTYPES = [
+    "uint8",
+    "int8",
+    "uint16",
+    "int16",
+    "uint32",
+    "int32",
+    "float32",
+    "float64",
+    "int64",
+]
+DTYPE_ALIASES = {"float": "float64", "double": "float64", "int": "int64"}
+STRUCT_CHARS = {
+    "uint8": "B",
+    "int8": "b",
+    "uint16": "H",
+    "int16": "h",
+    "uint32": "I",
+    "int32": "i",
+    "float32": "f",
+    "float64": "d",
+    "int64": "q",
+}
+
+
+def resolve_dtype(name, default="float64"):
+    """
+    Map a front matter dtype name to one of the supported wire dtypes.
+    """
+    dtype = DTYPE_ALIASES.get(name, name) if name else default
+    if dtype not in DTYPES:
+        raise ValueError(f"Unsupported dtype '{name}'.")
+    return dtype
+
+
+def as_array(value, dtype):
+    """
+    View a value as a little-endian ndarray.
+    ndarrays and buffer-protocol objects that already have a supported dtype
+    are used as-is; anything else is converted to `dtype`.
+    """
+    if not isinstance(value, np.ndarray):
+        try:
+            value = np.asarray(memoryview(value))
+        except TypeError:
+            return np.asarray(value, dtype=dtype)
+    if value.dtype.name not in DTYPES:
+        value = value.astype(dtype)
+    return np.ascontiguousarray(value, dtype=value.dtype.newbyteorder("<"))
+
+
+class ColumnBlock:
+    """
+    A block of values of one time series or struct channel, sent as a single
+    columnar message by `publish_many`.
+    """
+
+    def __init__(self, columns, timestamps=None):
+        """
+        :param columns: 1-D array of values for a time series, or field name ->
+            1-D array for a struct.
+        :param timestamps: Optional 1-D float64 array of seconds since the epoch,
+            one per value.
+        """
+        self.columns = columns
+        self.timestamps = timestamps
+
+    def __len__(self):
+        if isinstance(self.columns, dict):
+            return len(next(iter(self.columns.values()), ()))
+        return len(self.columns)
+
+    def __repr__(self):
+        return f"ColumnBlock({len(self)} values)"
+
+    def rows(self):
+        """
+        The values one at a time: floats for a time series, dicts for a struct.
+        """
+        if not isinstance(self.columns, dict):
+            return np.asarray(self.columns).tolist()
+        fields = list(self.columns)
+        return [
+            dict(zip(fields, row))
+            for row in zip(
+                *(np.asarray(column).tolist() for column in self.columns.values())
+            )
+        ]
+
+    def to_json(self):
+        if isinstance(self.columns, dict):
+            columns = {field: to_json(column) for field, column in self.columns.items()}
+        else:
+            columns = to_json(self.columns)
+        block = {"columns": columns}
+        if self.timestamps is not None:
+            block["timestamps"] = to_json(self.timestamps)
+        return block
+
+    @classmethod
+    def from_json(cls, block):
+        columns = block["columns"]
+        if isinstance(columns, dict):
+            columns = {field: np.asarray(column) for field, column in columns.items()}
+        else:
+            columns = np.asarray(columns)
+        timestamps = block.get("timestamps")
+        return cls(columns, None if timestamps is None else np.asarray(timestamps))
+
+
+class Trace:
+    """
+    Delivery details of a record on a traced channel: its per-channel
+    sequence number, the producer's send time and the time each hop (broker,
+    proxies) forwarded it, all in seconds since the epoch.
+    """
+
+    __slots__ = ("seq", "sent", "hops")
+
+    def __init__(self, seq=None, sent=None, hops=None):
+        self.seq = seq
+        self.sent = sent
+        self.hops = dict(hops or {})
+
+    def __repr__(self):
+        return f"Trace(seq={self.seq}, sent={self.sent}, hops={self.hops})"
+
+    def stamp(self, hop, timestamp=None):
+        """
+        Record the time a hop forwarded the record.
+        """
+        self.hops[hop] = time.time() if timestamp is None else timestamp
+
+    def to_json(self):
+        fields = {"seq": self.seq, "sent": self.sent}
+        if self.hops:
+            fields["hops"] = self.hops
+        return fields
+
+    @classmethod
+    def from_json(cls, record, hops=None):
+        """
+        Trace of a decoded JSON record, merged with the hops of its message,
+        or None if neither carries one.
+        """
+        if "seq" not in record and "hops" not in record and not hops:
+            return None
+        return cls(
+            record.get("seq"),
+            record.get("sent"),
+            {**record.get("hops", {}), **(hops or {})},
+        )
+
+
+def pack_hop(name, timestamp):
+    name = name.encode()
+    return NAME_SIZE.pack(len(name)) + name + SCALAR.pack(timestamp)
+
+
+def unpack_hop(body, offset):
+    """
+    Hop name and time at `offset`, and the offset just past them.
+    """
+    (size,) = NAME_SIZE.unpack_from(body, offset)
+    offset += NAME_SIZE.size
+    name = bytes(body[offset : offset + size]).decode()
+    (timestamp,) = SCALAR.unpack_from(body, offset + size)
+    return name, timestamp, offset + size + SCALAR.size
+
+
+def to_json(value):
+    """
+    JSON fallback for ndarrays, NumPy scalars and buffer-protocol objects.
+    """
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    try:
+        return memoryview(value).tolist()
+    except TypeError as e:
+        raise TypeError(
+            f"Object of type {type(value).__name__} is not JSON serializable"
+        ) from e
+
+
+class JsonCodec:
+    """Encode channel messages as JSON text."""
+
+    def __init__(self, source_name, channels):
+        self.source_name = source_name
+        self.channels = channels
+
+    @staticmethod
+    def record(channel_name, value, trace=None):
+        """
+        Message fields of a record. Column blocks replace "value" with
+        "columns" and optional "timestamps"; traced records add "seq", "sent"
+        and "hops".
+        """
+        if isinstance(value, ColumnBlock):
+            record = {"channel": channel_name, **value.to_json()}
+        else:
+            record = {"channel": channel_name, "value": value}
+        if trace is not None:
+            record.update(trace.to_json())
+        return record
+
+    def encode(self, channel_name, value, trace=None):
+        """
+        Encode a single channel value.
+        """
+        return json.dumps(
+            {"source": self.source_name, **self.record(channel_name, value, trace)},
+            default=to_json,
+        )
+
+    def encode_value(self, channel_name, value, trace=None):
+        """
+        Encode only the value, for transports that already carry the channel name.
+        There is no envelope, so the trace is left out.
+        """
+        if isinstance(value, ColumnBlock):
+            value = value.to_json()
+        return json.dumps(value, default=to_json)
+
+    def encode_record(self, channel_name, value, trace=None):
+        """
+        Encode one record for later use with `join_batch`.
+        """
+        return json.dumps(self.record(channel_name, value, trace), default=to_json)
+
+    def join_batch(self, encoded_records):
+        """
+        Join records from `encode_record` into a single multi-record message.
+        """
+        return (
+            f'{{"source": {json.dumps(self.source_name)}, '
+            f'"batch": [{", ".join(encoded_records)}]}}'
+        )
+
+    def encode_batch(self, records):
+        """
+        Encode a list of (channel, value) records as a single message.
+        """
+        return self.join_batch(
+            [self.encode_record(channel_name, value) for channel_name, value in records]
+        )
+
+    def decode(self, frame):
+        """
+        Decode a message into a list of (channel, value) records.
+        """
+        return [
+            (channel_name, value)
+            for channel_name, value, _ in self.decode_traced(frame)
+        ]
+
+    def decode_traced(self, frame):
+        """
+        Decode a message into a list of (channel, value, trace) records, where
+        trace is a Trace, or None for records of untraced channels.
+        """
+        message = json.loads(frame)
+        # Proxies stamp their hop on the whole message
+        hops = message.get("hops") if "batch" in message else None
+        return [
+            (
+                record["channel"],
+                (
+                    ColumnBlock.from_json(record)
+                    if "columns" in record
+                    else record["value"]
+                ),
+                Trace.from_json(record, hops),
+            )
+            for record in message.get("batch", [message])
+        ]
+
+    def decode_value(self, channel_name, payload):
+        """
+        Decode a value encoded by `encode_value`.
+        """
+        value = json.loads(payload)
+        if isinstance(value, dict) and "columns" in value:
+            channel_type = self.channels.get(channel_name, {}).get("type")
+            # A struct may itself have a field called "columns"
+            if channel_type != "struct" or isinstance(value["columns"], dict):
+                return ColumnBlock.from_json(value)
+        return value
+
+
+class BinaryCodec(JsonCodec):
+    """
+    Encode channel messages as compact little-endian binary frames.
+
+    The layout of each channel is derived from its front matter declaration:
+    `time_series` channels are sent as a float64, `struct` channels as packed
+    `fields`, and `array`/`image` channels as a raw typed buffer with its shape.
+    Array and image channels with a `compression` key have their buffer
+    compressed, which makes the codec stateful: frames must be decoded in the
+    order they were encoded.
+    Values that do not fit the declared layout fall back to a JSON record.
+    """
+
+    def __init__(self, source_name, channels, compress=True):
+        """
+        :param compress: Apply the channels' `compression`. Frames from a codec
+            without it can be decoded by any codec.
+        """
+        super().__init__(source_name, channels)
+        self.names = list(channels)
+        self.ids = {name: index for index, name in enumerate(self.names)}
+        self.fields = {}
+        self.records = {}
+        self.dtypes = {}
+        self.compressors = {}
+
+        for name, config in channels.items():
+            channel_type = config.get("type")
+            if channel_type == "struct":
+                fields = dict(config.get("fields", {}))
+                self.fields[name] = list(fields)
+                self.records[name] = struct.Struct(
+                    "<"
+                    + "".join(
+                        STRUCT_CHARS[resolve_dtype(dtype)] for dtype in fields.values()
+                    )
+                )
+            elif channel_type == "image":
+                self.dtypes[name] = resolve_dtype(config.get("dtype"), "uint8")
+            elif channel_type == "array":
+                self.dtypes[name] = resolve_dtype(config.get("dtype"))
+            if name in self.dtypes and "compression" in config:
+                self.compressors[name] = ArrayCompressor.from_config(config)
+        self.compress = compress
+
+    def encode(self, channel_name, value, trace=None):
+        """
+        Encode a single channel value as a binary frame, behind its trace if
+        it has one.
+        """
+        frame = self.encode_frame(channel_name, value)
+        if trace is None:
+            return frame
+        return b"".join(
+            [
+                HEADER.pack(MAGIC, KIND_TRACED, self.ids[channel_name]),
+                TRACE.pack(
+                    NO_SEQ if trace.seq is None else trace.seq,
+                    float("nan") if trace.sent is None else trace.sent,
+                    len(trace.hops),
+                ),
+                *(pack_hop(hop, timestamp) for hop, timestamp in trace.hops.items()),
+                frame,
+            ]
+        )
+
+    def encode_frame(self, channel_name, value):
+        channel_id = self.ids[channel_name]
+        if isinstance(value, ColumnBlock):
+            return self.encode_columns(channel_id, channel_name, value)
+        try:
+            if channel_name in self.records:
+                return self.encode_struct(channel_id, channel_name, value)
+            if channel_name in self.dtypes:
+                return self.encode_array(channel_name, channel_id, value)
+            if self.channels[channel_name].get("type") == "time_series":
+                return HEADER.pack(MAGIC, KIND_SCALAR, channel_id) + SCALAR.pack(value)
+        except (TypeError, ValueError, KeyError, OverflowError, struct.error):
+            pass
+        return (
+            HEADER.pack(MAGIC, KIND_JSON, channel_id)
+            + json.dumps(value, default=to_json).encode()
+        )
+
+    def encode_value(self, channel_name, value, trace=None):
+        """
+        Encode only the value. Binary frames always carry the channel id.
+        """
+        return self.encode(channel_name, value, trace)
+
+    def encode_struct(self, channel_id, channel_name, value):
+        fields = self.fields[channel_name]
+        record = self.records[channel_name]
+        if isinstance(value, dict):
+            return HEADER.pack(MAGIC, KIND_STRUCT, channel_id) + record.pack(
+                *(value[field] for field in fields)
+            )
+        return b"".join(
+            [
+                HEADER.pack(MAGIC, KIND_STRUCT_LIST, channel_id),
+                COUNT.pack(len(value)),
+                *(record.pack(*(item[field] for field in fields)) for item in value),
+            ]
+        )
+
+    def column_dtypes(self, channel_name):
+        """
+        Wire dtype of each column of a channel's blocks (None for a time series).
+        """
+        if channel_name not in self.records:
+            return None
+        fields = self.channels[channel_name].get("fields", {})
+        return {field: resolve_dtype(dtype) for field, dtype in fields.items()}
+
+    def encode_columns(self, channel_id, channel_name, block):
+        """
+        Count and flags, then each column as a packed little-endian array
+        (float64 for time series), then the float64 timestamps if present.
+        """
+        dtypes = self.column_dtypes(channel_name)
+        if dtypes is None:
+            columns = [np.asarray(block.columns, "<f8")]
+        else:
+            columns = [
+                np.asarray(block.columns[field], np.dtype(dtype).newbyteorder("<"))
+                for field, dtype in dtypes.items()
+            ]
+        flags = 0
+        if block.timestamps is not None:
+            flags |= HAS_TIMESTAMPS
+            columns.append(np.asarray(block.timestamps, "<f8"))
+        return b"".join(
+            [
+                HEADER.pack(MAGIC, KIND_COLUMNS, channel_id),
+                COUNT.pack(len(block)),
+                bytes([flags]),
+                *(column.tobytes() for column in columns),
+            ]
+        )
+
+    def decode_columns(self, channel_name, body):
+        (count,) = COUNT.unpack_from(body)
+        flags = body[COUNT.size]
+        offset = COUNT.size + 1
+
+        def read(dtype):
+            nonlocal offset
+            dtype = np.dtype(dtype).newbyteorder("<")
+            column = np.frombuffer(body, dtype, count, offset)
+            offset += count * dtype.itemsize
+            return column
+
+        dtypes = self.column_dtypes(channel_name)
+        if dtypes is None:
+            columns = read("f8")
+        else:
+            columns = {field: read(dtype) for field, dtype in dtypes.items()}
+        timestamps = read("f8") if flags & HAS_TIMESTAMPS else None
+        return ColumnBlock(columns, timestamps)
+
+    def encode_array(self, channel_name, channel_id, value):
+        array = as_array(value, self.dtypes[channel_name])
+        compressor = self.compressors.get(channel_name) if self.compress else None
+        if compressor is None:
+            kind, header, data = KIND_ARRAY, b"", memoryview(array).cast("B")
+        else:
+            kind = KIND_PACKED
+            header, data = compressor.compress(array)
+        return b"".join(
+            [
+                HEADER.pack(MAGIC, kind, channel_id),
+                ARRAY_HEADER.pack(DTYPES.index(array.dtype.name), array.ndim),
+                struct.pack(f"<{array.ndim}I", *array.shape),
+                header,
+                data,
+            ]
+        )
+
+    def encode_record(self, channel_name, value, trace=None):
+        """
+        Encode one record for later use with `join_batch`.
+        """
+        return self.encode(channel_name, value, trace)
+
+    def join_batch(self, encoded_records):
+        """
+        Join frames from `encode_record` into a single batch frame.
+        """
+        parts = [HEADER.pack(MAGIC, KIND_BATCH, 0), COUNT.pack(len(encoded_records))]
+        for frame in encoded_records:
+            parts.append(COUNT.pack(len(frame)))
+            parts.append(frame)
+        return b"".join(parts)
+
+    def encode_batch(self, records):
+        """
+        Encode a list of (channel, value) records as a single binary frame.
+        """
+        return self.join_batch(
+            [self.encode(channel_name, value) for channel_name, value in records]
+        )
+
+    def decode_traced(self, frame, hops=None):
+        """
+        Decode a binary frame into a list of (channel, value, trace) records.
+        :param hops: Hops stamped on an enclosing frame by proxies.
+        """
+        if isinstance(frame, str):
+            return super().decode_traced(frame)
+
+        magic, kind, channel_id = HEADER.unpack_from(frame)
+        if magic != MAGIC:
+            raise ValueError("Frame is not a binary channel frame.")
+
+        if kind == KIND_BATCH:
+            records = []
+            (count,) = COUNT.unpack_from(frame, HEADER.size)
+            offset = HEADER.size + COUNT.size
+            for _ in range(count):
+                (length,) = COUNT.unpack_from(frame, offset)
+                offset += COUNT.size
+                records.extend(
+                    self.decode_traced(frame[offset : offset + length], hops)
+                )
+                offset += length
+            return records
+        if kind == KIND_HOP:
+            name, timestamp, offset = unpack_hop(frame, HEADER.size)
+            return self.decode_traced(frame[offset:], {**(hops or {}), name: timestamp})
+        if kind == KIND_TRACED:
+            seq, sent, count = TRACE.unpack_from(frame, HEADER.size)
+            trace = Trace(
+                None if seq == NO_SEQ else seq, None if math.isnan(sent) else sent
+            )
+            offset = HEADER.size + TRACE.size
+            for _ in range(count):
+                name, timestamp, offset = unpack_hop(frame, offset)
+                trace.hops[name] = timestamp
+            trace.hops.update(hops or {})
+            return [
+                (channel_name, value, trace)
+                for channel_name, value, _ in self.decode_traced(frame[offset:])
+            ]
+
+        trace = Trace(hops=hops) if hops else None
+        return [
+            (channel_name, value, trace) for channel_name, value in self.decode(frame)
+        ]
+
+    def decode(self, frame):
+        """
+        Decode a binary frame into a list of (channel, value) records.
+        """
+        if isinstance(frame, str):
+            return super().decode(frame)
+
+        magic, kind, channel_id = HEADER.unpack_from(frame)
+        if magic != MAGIC:
+            raise ValueError("Frame is not a binary channel frame.")
+
+        if kind in (KIND_BATCH, KIND_HOP, KIND_TRACED):
+            return [
+                (channel_name, value)
+                for channel_name, value, _ in self.decode_traced(frame)
+            ]
+
+        channel_name = self.names[channel_id]
+        body = memoryview(frame)[HEADER.size :]
+        if kind == KIND_JSON:
+            value = json.loads(bytes(body))
+        elif kind == KIND_SCALAR:
+            (value,) = SCALAR.unpack_from(body)
+        elif kind == KIND_STRUCT:
+            value = dict(
+                zip(
+                    self.fields[channel_name],
+                    self.records[channel_name].unpack_from(body),
+                )
+            )
+        elif kind == KIND_STRUCT_LIST:
+            fields = self.fields[channel_name]
+            value = [
+                dict(zip(fields, item))
+                for item in self.records[channel_name].iter_unpack(body[COUNT.size :])
+            ]
+        elif kind == KIND_COLUMNS:
+            value = self.decode_columns(channel_name, body)
+        elif kind in (KIND_ARRAY, KIND_PACKED):
+            dtype_code, ndim = ARRAY_HEADER.unpack_from(body)
+            shape = struct.unpack_from(f"<{ndim}I", body, ARRAY_HEADER.size)
+            data = body[ARRAY_HEADER.size + 4 * ndim :]
+            dtype = f"<{np.dtype(DTYPES[dtype_code]).str[1:]}"
+            if kind == KIND_PACKED:
+                compressor = self.compressors.get(channel_name)
+                if compressor is None:
+                    raise ValueError(
+                        f"Channel '{channel_name}' has no compression configured."
+                    )
+                value = compressor.decompress(data, dtype, shape)
+                if value is None:
+                    return []  # Delta against a frame this decoder never saw
+            else:
+                value = np.frombuffer(data, dtype=dtype).reshape(shape)
+        else:
+            raise ValueError(f"Unknown frame kind {kind}.")
+        return [(channel_name, value)]
+
+
+CODECS = {"json": JsonCodec, "binary": BinaryCodec}
+
+
+def make_codec(encoding, source_name, channels):
+    """
+    Create the codec for an encoding name.
+    """
+    if encoding not in CODECS:
+        raise ValueError(
+            f"Unknown encoding '{encoding}'. Expected one of: {', '.join(CODECS)}."
+        )
+    return CODECS[encoding](source_name, channels)
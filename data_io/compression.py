@@ -0,0 +1,171 @@
+"""Per-channel payload compression for array and image channels."""
+
+import struct
+import zlib
+
+import numpy as np
+
+FLAG_DELTA = 1  # XOR against the previous frame of the channel
+FLAG_BITPACK = 2  # Two-valued uint8 data packed to one bit per element
+FLAG_RLE = 4  # (value, run length - 1) byte pairs
+FLAG_ZLIB = 8  # zlib stream
+
+METHODS = {
+    "delta": FLAG_DELTA,
+    "bitpack": FLAG_BITPACK,
+    "rle": FLAG_RLE,
+    "zlib": FLAG_ZLIB,
+}
+
+# flags, frame number, base frame number (for deltas)
+PACKED_HEADER = struct.Struct("<BII")
+BITPACK_VALUES = struct.Struct("<BB")  # value of 0 bits, value of 1 bits
+
+
+def rle_encode(data):
+    """
+    Run-length encode bytes as (value, run length - 1) pairs, runs of at most 256.
+    """
+    data = np.frombuffer(data, dtype=np.uint8)
+    if not len(data):
+        return b""
+    starts = np.flatnonzero(np.diff(data)) + 1
+    lengths = np.diff(np.concatenate(([0], starts, [len(data)])))
+    values = data[np.concatenate(([0], starts))]
+
+    # Split long runs into chunks of 256
+    chunks = -(-lengths // 256)
+    counts = np.full(chunks.sum(), 256)
+    counts[np.cumsum(chunks) - 1] = lengths - 256 * (chunks - 1)
+    pairs = np.empty((len(counts), 2), dtype=np.uint8)
+    pairs[:, 0] = np.repeat(values, chunks)
+    pairs[:, 1] = counts - 1
+    return pairs.tobytes()
+
+
+def rle_decode(data):
+    pairs = np.frombuffer(data, dtype=np.uint8).reshape(-1, 2)
+    return np.repeat(pairs[:, 0], pairs[:, 1].astype(np.intp) + 1).tobytes()
+
+
+def parse_methods(compression):
+    """
+    Front matter `compression` (a method name or a list of them) as flags.
+    """
+    if isinstance(compression, str):
+        compression = [compression]
+    flags = 0
+    for method in compression:
+        if method not in METHODS:
+            raise ValueError(
+                f"Unknown compression '{method}'. "
+                f"Expected one of: {', '.join(METHODS)}."
+            )
+        flags |= METHODS[method]
+    return flags
+
+
+class ArrayCompressor:
+    """
+    Compress the payload of one array/image channel.
+
+    Delta frames are XORed against the previous frame, so every frame carries
+    its number and deltas carry the number of their base frame. A decoder that
+    missed the base (a dropped frame, or a consumer that joined late) drops
+    deltas until the next keyframe.
+    """
+
+    def __init__(self, flags, keyframe_interval=30, min_size=1024):
+        """
+        :param flags: FLAG_* bits from `parse_methods`.
+        :param keyframe_interval: Send a full frame every this many frames.
+        :param min_size: Only zlib-compress payloads at least this many bytes long.
+        """
+        self.flags = flags
+        self.keyframe_interval = keyframe_interval
+        self.min_size = min_size
+        self.frame = 0
+        self.sent = None  # (frame number, layout, delta-level bytes) last encoded
+        self.received = None  # (frame number, delta-level bytes) last decoded
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            parse_methods(config["compression"]),
+            config.get("keyframe_interval", 30),
+            config.get("compress_min_size", 1024),
+        )
+
+    def compress(self, array):
+        """
+        Encode a contiguous array's data as a packed payload.
+        """
+        flags = 0
+        extra = b""
+        data = memoryview(array).cast("B")
+
+        if self.flags & FLAG_BITPACK and array.dtype == np.uint8:
+            low, high = array.min(), array.max()
+            if np.all((array == low) | (array == high)):
+                data = np.packbits(array.ravel() == high).tobytes()
+                extra = BITPACK_VALUES.pack(low, high)
+                flags |= FLAG_BITPACK
+
+        self.frame = (self.frame + 1) & 0xFFFFFFFF
+        base = 0
+        current = bytes(data)
+        layout = (flags, array.dtype.str, array.shape)
+        if (
+            self.flags & FLAG_DELTA
+            and self.sent is not None
+            and self.sent[1] == layout
+            and self.frame % self.keyframe_interval
+        ):
+            base = self.sent[0]
+            previous = np.frombuffer(self.sent[2], dtype=np.uint8)
+            data = np.bitwise_xor(np.frombuffer(current, np.uint8), previous).tobytes()
+            flags |= FLAG_DELTA
+        self.sent = (self.frame, layout, current)
+
+        # Noisy data does not compress, so keep whichever is smaller
+        if self.flags & FLAG_RLE:
+            encoded = rle_encode(data)
+            if len(encoded) < len(data):
+                data = encoded
+                flags |= FLAG_RLE
+        if self.flags & FLAG_ZLIB and len(data) >= self.min_size:
+            encoded = zlib.compress(data, 1)
+            if len(encoded) < len(data):
+                data = encoded
+                flags |= FLAG_ZLIB
+        return PACKED_HEADER.pack(flags, self.frame, base) + extra, data
+
+    def decompress(self, body, dtype, shape):
+        """
+        Decode a packed payload. Returns None if it is a delta whose base
+        frame was not the last frame decoded.
+        """
+        flags, frame, base = PACKED_HEADER.unpack_from(body)
+        offset = PACKED_HEADER.size
+        if flags & FLAG_BITPACK:
+            low, high = BITPACK_VALUES.unpack_from(body, offset)
+            offset += BITPACK_VALUES.size
+        data = bytes(body[offset:])
+
+        if flags & FLAG_ZLIB:
+            data = zlib.decompress(data)
+        if flags & FLAG_RLE:
+            data = rle_decode(data)
+        if flags & FLAG_DELTA:
+            if self.received is None or self.received[0] != base:
+                self.received = None
+                return None
+            previous = np.frombuffer(self.received[1], dtype=np.uint8)
+            data = np.bitwise_xor(np.frombuffer(data, np.uint8), previous).tobytes()
+        self.received = (frame, data)
+
+        if flags & FLAG_BITPACK:
+            size = int(np.prod(shape))
+            bits = np.unpackbits(np.frombuffer(data, np.uint8), count=size)
+            return np.where(bits, np.uint8(high), np.uint8(low)).reshape(shape)
+        return np.frombuffer(data, dtype=dtype).reshape(shape)
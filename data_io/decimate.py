@@ -0,0 +1,156 @@
+"""Reduce dense time series to what a chart can actually draw."""
+
+import time
+
+import numpy as np
+
+
+def minmax(values, n_out):
+    """
+    Keep the minimum and maximum of each of n_out // 2 equal buckets, in
+    time order, so spikes survive the reduction.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    buckets = max(n_out // 2, 1)
+    if len(values) <= n_out:
+        return values
+    size = -(-len(values) // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[: len(values)] = values
+    padded = padded.reshape(buckets, size)
+    padded = padded[~np.isnan(padded[:, 0])]  # Drop buckets that are all padding
+
+    rows = np.arange(len(padded))
+    low, high = np.nanargmin(padded, axis=1), np.nanargmax(padded, axis=1)
+    first, second = np.minimum(low, high), np.maximum(low, high)
+    return np.stack((padded[rows, first], padded[rows, second]), axis=1).ravel()
+
+
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets: keep the first and last points and, from
+    each bucket in between, the point forming the largest triangle with the
+    point kept from the previous bucket and the mean of the next bucket.
+    Returns the indices of the kept points.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    # Mean of every bucket, used as the third triangle vertex
+    counts = np.diff(edges)
+    mean_x = np.add.reduceat(x[1:-1], edges[:-1] - 1) / counts
+    mean_y = np.add.reduceat(y[1:-1], edges[:-1] - 1) / counts
+    mean_x = np.append(mean_x, x[-1])
+    mean_y = np.append(mean_y, y[-1])
+
+    kept = np.empty(n_out, dtype=np.intp)
+    kept[0], kept[-1] = 0, n - 1
+    previous = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        ax, ay = x[previous], y[previous]
+        areas = np.abs(
+            (ax - mean_x[i + 1]) * (y[start:end] - ay)
+            - (ax - x[start:end]) * (mean_y[i + 1] - ay)
+        )
+        previous = start + int(areas.argmax())
+        kept[i + 1] = previous
+    return kept
+
+
+METHODS = ("minmax", "lttb")
+
+
+class Decimator:
+    """
+    Accumulate the values published to one channel and release a reduced set
+    of them once per interval.
+    """
+
+    def __init__(
+        self, method="minmax", target_rate=None, target_points=None, interval=0.1
+    ):
+        """
+        :param method: "minmax" or "lttb".
+        :param target_rate: Maximum points per second released.
+        :param target_points: Maximum points released per interval
+            (used instead of target_rate).
+        :param interval: Seconds of values reduced together.
+        """
+        if method not in METHODS:
+            raise ValueError(
+                f"Unknown decimation method '{method}', expected {METHODS}."
+            )
+        if target_points is None:
+            if target_rate is None:
+                raise ValueError("Decimation needs a target_rate or target_points.")
+            target_points = int(target_rate * interval)
+        if target_points < 2:
+            raise ValueError("Decimation must keep at least 2 points per interval.")
+        self.method = method
+        self.target_points = target_points
+        self.interval = interval
+        self.times = []
+        self.values = []
+        self.started = None
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            config["decimate"],
+            config.get("target_rate"),
+            config.get("target_points"),
+            config.get("decimate_interval", 0.1),
+        )
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, value, now=None):
+        """
+        Accumulate a value. Returns the reduced values of the interval it
+        completes, or an empty list.
+        """
+        now = time.monotonic() if now is None else now
+        if self.started is None:
+            self.started = now
+        self.times.append(now)
+        self.values.append(value)
+        if now - self.started >= self.interval:
+            return self.flush()
+        return []
+
+    def flush(self):
+        """
+        Reduce and release every accumulated value.
+        """
+        values = self.values
+        if self.method == "minmax":
+            reduced = minmax(values, self.target_points)
+        else:
+            reduced = np.asarray(values)[lttb(self.times, values, self.target_points)]
+        self.times, self.values, self.started = [], [], None
+        return reduced.tolist()
+
+
+def make_decimators(data_channels):
+    """
+    Build a Decimator for every time_series channel with a `decimate` key.
+    """
+    decimators = {}
+    for name, config in data_channels.items():
+        if "decimate" not in config:
+            continue
+        if config.get("type") != "time_series":
+            raise ValueError(
+                f"Data channel '{name}': decimate is only supported for time_series."
+            )
+        try:
+            decimators[name] = Decimator.from_config(config)
+        except ValueError as e:
+            raise ValueError(f"Data channel '{name}': {e}") from e
+    return decimators
@@ -0,0 +1,199 @@
+"""Counters, histograms and gauges for publishers and proxies."""
+
+import asyncio
+import inspect
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+METRICS_CHANNEL = "_metrics"
+
+# Upper bounds in seconds, from 50 us to 5 s
+LATENCY_BUCKETS = (
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    5.0,
+)
+
+
+class Histogram:
+    """Fixed-bucket histogram, cheap enough to update on every send."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """
+        Upper bound of the bucket holding the q-th quantile (None if empty).
+        Values above the largest bucket count as the largest bound, so the
+        result stays finite and JSON-serializable.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+        }
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    """
+    Per-key counters (keyed by channel, or by port for proxies), latency
+    histograms and gauges read on demand.
+
+    Components take `metrics=None` and skip all bookkeeping when it is None,
+    so metrics cost nothing unless enabled.
+    """
+
+    def __init__(self, label="channel"):
+        """
+        :param label: Name of the key counters are broken down by.
+        """
+        self.label = label
+        self.counters = defaultdict(Counter)  # metric -> key -> value
+        self.histograms = defaultdict(Histogram)  # metric -> histogram
+        self.gauges = {}  # metric -> callable returning the current value
+
+    def inc(self, name, key=None, amount=1):
+        """
+        Add to a counter, for one key or overall (key None).
+        """
+        self.counters[name][key] += amount
+
+    def observe(self, name, seconds):
+        self.histograms[name].observe(seconds)
+
+    def gauge(self, name, read):
+        """
+        Register a gauge, read whenever metrics are exported.
+        """
+        self.gauges[name] = read
+
+    def record_encode(self, channel_name, size, seconds):
+        """
+        Count one encoded message: messages, bytes and time spent encoding.
+        """
+        self.counters["messages"][channel_name] += 1
+        self.counters["bytes"][channel_name] += size
+        self.counters["encode_seconds"][channel_name] += seconds
+
+    def snapshot(self):
+        """
+        Current values as plain Python objects, e.g. for the `_metrics` channel.
+        """
+        return {
+            "counters": {name: dict(values) for name, values in self.counters.items()},
+            "histograms": {
+                name: histogram.snapshot()
+                for name, histogram in self.histograms.items()
+            },
+            "gauges": {name: read() for name, read in self.gauges.items()},
+        }
+
+    def prometheus(self, prefix="data_io"):
+        """
+        Current values in the Prometheus text exposition format.
+        """
+        lines = []
+        for name, values in self.counters.items():
+            metric = f"{prefix}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for key, value in values.items():
+                if key is None:
+                    lines.append(f"{metric} {value}")
+                else:
+                    label = f'{self.label}="{escape_label(key)}"'
+                    lines.append(f"{metric}{{{label}}} {value}")
+        for name, histogram in self.histograms.items():
+            metric = f"{prefix}_{name}"
+            lines.append(f"# TYPE {metric} histogram")
+            total = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                total += count
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {total}')
+            lines.append(f'{metric}_bucket{{le="+Inf"}} {histogram.count}')
+            lines.append(f"{metric}_sum {histogram.sum}")
+            lines.append(f"{metric}_count {histogram.count}")
+        for name, read in self.gauges.items():
+            metric = f"{prefix}_{name}"
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {read()}")
+        return "\n".join(lines) + "\n"
+
+
+async def serve_prometheus(metrics, port=9100, host="0.0.0.0"):
+    """
+    Serve `metrics.prometheus()` at http://host:port/metrics until cancelled.
+    """
+
+    async def handle(reader, writer):
+        try:
+            request = await reader.readline()
+            while (await reader.readline()).strip():
+                pass  # Skip the headers
+            if request.split(b" ")[1:2] == [b"/metrics"]:
+                status, body = "200 OK", metrics.prometheus().encode()
+            else:
+                status, body = "404 Not Found", b"Not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    print(f"Serving metrics on http://{host}:{port}/metrics")
+    async with server:
+        await server.serve_forever()
+
+
+async def publish_metrics(publisher, interval=1.0, channel=METRICS_CHANNEL):
+    """
+    Publish the publisher's metrics snapshot to a channel every `interval`
+    seconds. The channel (`_metrics` by default) must be declared in the
+    interface file, e.g. with `type: json` and `buffer: 1`. Works with both
+    sync and asyncio publishers.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        result = publisher.publish(channel, publisher.metrics.snapshot())
+        if inspect.isawaitable(result):
+            await result
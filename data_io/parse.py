@@ -1,8 +1,20 @@
+import asyncio
+import hashlib
+import os
 import re
 import sys
 from ruamel.yaml import YAML, YAMLError
 
-yaml = YAML()
+from data_io.validators import compile_validators
+
+# The safe loader uses the C-based parser when ruamel.yaml.clib is installed.
+yaml = YAML(typ="safe")
+
+# Parsed interface files keyed by absolute path:
+# path -> ((mtime_ns, size), content digest, components by yaml block, result)
+file_cache = {}
+
+YAML_BLOCK = re.compile(r"```yaml\n(.*?)```", re.DOTALL)
 
 
 def parse_front_matter(interface_file):
@@ -13,6 +25,13 @@ def parse_front_matter(interface_file):
     with open(interface_file, "r", encoding="utf-8") as f:
         content = f.read()
 
+    return split_front_matter(content)
+
+
+def split_front_matter(content):
+    """
+    Splits interface file content into its config, data channels and Markdown body.
+    """
     try:
         yaml_part, markdown_part = content.split("---", 2)[1:]
     except ValueError as exc:
@@ -39,12 +58,17 @@ def validate_data_channels(data_channels):
             raise ValueError(f"Data channel '{name}' properties must be a dictionary.")
 
 
-def parse_markdown_body(markdown_part):
+def parse_markdown_body(markdown_part, known_blocks=None):
     """
     Extracts YAML blocks from the Markdown body.
+    Blocks found in `known_blocks` (block text -> component) are not parsed again.
     """
-    yaml_blocks = re.findall(r"```yaml\n(.*?)```", markdown_part, re.DOTALL)
-    components = [yaml.load(block) for block in yaml_blocks]
+    known_blocks = known_blocks or {}
+    yaml_blocks = YAML_BLOCK.findall(markdown_part)
+    components = [
+        known_blocks[block] if block in known_blocks else yaml.load(block)
+        for block in yaml_blocks
+    ]
     return components
 
 
@@ -64,27 +88,66 @@ def validate_components(components, data_channels):
 def parse_interface_file(interface_file):
     """
     Parses the entire interface file and returns a structured representation.
+    Results are cached on the file's mtime and content hash, and only component
+    blocks that changed are parsed again. Treat the result as read-only.
     """
-    config, data_channels, markdown_part = parse_front_matter(interface_file)
+    path = os.path.abspath(interface_file)
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    cached = file_cache.get(path)
+    if cached and cached[0] == version:
+        return cached[3]
+
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read()
+    digest = hashlib.sha256(content.encode()).hexdigest()
+    if cached and cached[1] == digest:
+        file_cache[path] = (version, *cached[1:])
+        return cached[3]
+
+    config, data_channels, markdown_part = split_front_matter(content)
 
-    # Validate the data channels
+    # Validate the data channels and compile their value validators
     validate_data_channels(data_channels)
+    validators = compile_validators(data_channels)
 
     # Parse and validate components from Markdown body
-    components = parse_markdown_body(markdown_part)
+    known_blocks = cached[2] if cached else None
+    components = parse_markdown_body(markdown_part, known_blocks)
     validate_components(components, data_channels)
 
-    return {
+    result = {
         "title": config.get("title", "Untitled"),
         "description": config.get("description", ""),
         "data_channels": data_channels,
         "components": components,
+        "validators": validators,
     }
+    blocks = YAML_BLOCK.findall(markdown_part)
+    file_cache[path] = (version, digest, dict(zip(blocks, components)), result)
+    return result
+
+
+async def watch_interface_file(interface_file, on_change, interval=1.0):
+    """
+    Poll the interface file and call `on_change(result)` whenever its content changes.
+    """
+    previous = parse_interface_file(interface_file)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            result = parse_interface_file(interface_file)
+        except (OSError, ValueError, YAMLError) as e:
+            print(f"Failed to reload {interface_file}: {e}")
+            continue
+        if result is not previous:
+            previous = result
+            on_change(result)
 
 
 if __name__ == "__main__":
     if len(sys.argv) != 2:
-        print("Usage: python parser.py <path_to_interface_file>")
+        print("Usage: python -m data_io.parse <path_to_interface_file>")
         sys.exit(1)
 
     file_path = sys.argv[1]
@@ -0,0 +1,325 @@
+"""Poll HTTP JSON feeds and publish what changed."""
+
+import asyncio
+import inspect
+import json
+import random
+
+import aiohttp
+
+try:
+    import ijson  # Optional: parse responses as they stream in
+except ImportError:
+    ijson = None
+
+CONTAINER_DEPTH = {"start_map": 1, "start_array": 1, "end_map": -1, "end_array": -1}
+
+
+def parse_path(path):
+    """
+    "geometry.coordinates.1" -> ["geometry", "coordinates", 1]
+    """
+    return [int(part) if part.isdigit() else part for part in path.split(".")]
+
+
+def extract(value, path):
+    """
+    Follow a parsed path into a document, or None if it is missing.
+    """
+    for part in path:
+        try:
+            value = value[part]
+        except (KeyError, IndexError, TypeError):
+            return None
+    return value
+
+
+class Projection:
+    """
+    Pick named fields out of the records of a JSON document, e.g. for a GeoJSON
+    feed: Projection({"mag": "properties.mag"}, items="features").
+
+    With ijson installed, `project_stream` parses the response as it arrives
+    and only builds the selected fields; otherwise the document is parsed whole.
+    """
+
+    def __init__(self, fields, items=None):
+        """
+        :param fields: Record field name -> dotted path inside each item.
+            Numeric parts index into arrays.
+        :param items: Dotted path to the array of records, or None if the
+            whole document is a single record.
+        """
+        self.fields = {name: parse_path(path) for name, path in fields.items()}
+        self.items = parse_path(items) if items else None
+        self.prefix = f"{items}.item" if items else ""
+
+        # ijson prefixes have no array indexes, so the part of each path up to
+        # the first index is built as a value and the rest looked up in it
+        self.targets = {}  # ijson prefix -> [(field name, remaining path)]
+        for name, path in self.fields.items():
+            split = next(
+                (i for i, part in enumerate(path) if isinstance(part, int)), len(path)
+            )
+            prefix = ".".join(
+                [self.prefix, *path[:split]] if self.prefix else path[:split]
+            )
+            self.targets.setdefault(prefix, []).append((name, path[split:]))
+        # Fields inside another selected field are looked up in its built value
+        for prefix, targets in self.targets.items():
+            for other, nested in self.targets.items():
+                if other.startswith(f"{prefix}."):
+                    relative = other[len(prefix) + 1 :].split(".")
+                    targets.extend((name, relative + path) for name, path in nested)
+
+    def project(self, document):
+        """
+        Records of an already parsed document.
+        """
+        items = extract(document, self.items) if self.items else [document]
+        return [
+            {name: extract(item, path) for name, path in self.fields.items()}
+            for item in items or ()
+        ]
+
+    def finish(self, record):
+        return {name: record.get(name) for name in self.fields}
+
+    async def project_stream(self, stream):
+        """
+        Records of a document read from an async stream (e.g. response.content).
+        """
+        if ijson is None:
+            return self.project(json.loads(await stream.read()))
+
+        records = []
+        record = None if self.items else {}
+        builder = None
+        async for prefix, event, value in ijson.parse_async(stream, use_float=True):
+            if builder is not None:
+                builder.event(event, value)
+                depth += CONTAINER_DEPTH.get(event, 0)
+                if not depth:
+                    for name, path in targets:
+                        record[name] = extract(builder.value, path)
+                    builder = None
+                continue
+
+            if self.items and prefix == self.prefix:
+                if event == "start_map":
+                    record = {}
+                elif event == "end_map":
+                    records.append(self.finish(record))
+                    record = None
+                continue
+
+            targets = self.targets.get(prefix)
+            if targets is None or record is None or event == "map_key":
+                continue
+            if event in ("start_map", "start_array"):
+                builder = ijson.ObjectBuilder()
+                builder.event(event, value)
+                depth = 1
+            else:
+                for name, path in targets:
+                    record[name] = extract(value, path)
+
+        if not self.items:
+            records.append(self.finish(record))
+        return records
+
+
+class Feed:
+    """One polled URL, with its conditional request state and last records."""
+
+    def __init__(
+        self,
+        channel,
+        url,
+        projection,
+        interval=10,
+        transform=None,
+        key=None,
+        publish="snapshot",
+    ):
+        """
+        :param channel: Channel the records are published to.
+        :param projection: Projection selecting the record fields.
+        :param interval: Seconds between polls.
+        :param transform: Optional function applied to each record; records it
+            returns None for are skipped.
+        :param key: Record fields identifying a record when diffing, so a
+            changed record replaces the previous one with the same key
+            (default: every field).
+        :param publish: "snapshot" to publish the full list of records whenever
+            it changed, "changes" to publish each new or changed record on its
+            own, or "latest" to publish the first record whenever it changed.
+        """
+        if publish not in ("snapshot", "changes", "latest"):
+            raise ValueError(
+                f"Unknown publish mode '{publish}', "
+                "expected 'snapshot', 'changes' or 'latest'."
+            )
+        self.channel = channel
+        self.url = url
+        self.projection = projection
+        self.interval = interval
+        self.transform = transform
+        self.key = key
+        self.publish = publish
+        self.etag = None
+        self.last_modified = None
+        self.seen = {}  # key -> fingerprint of the records of the last poll
+
+    def headers(self):
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def diff(self, records):
+        """
+        Records that are new, or whose key was seen with different contents in
+        the previous poll, and the number of records that disappeared.
+        """
+        current = {}
+        changed = []
+        for record in records:
+            fingerprint = json.dumps(record, sort_keys=True)
+            key = fingerprint if self.key is None else tuple(map(record.get, self.key))
+            if self.seen.get(key) != fingerprint:
+                changed.append(record)
+            current[key] = fingerprint
+        removed = len(self.seen.keys() - current.keys())
+        self.seen = current
+        return changed, removed
+
+
+class PollingSource:
+    """
+    Poll many HTTP JSON feeds over one shared connection pool and publish the
+    records that changed.
+
+    Requests are conditional (ETag / If-Modified-Since), so unchanged feeds
+    cost a 304 and no parsing, and polls are jittered so feeds with the same
+    interval do not all fire at once.
+    """
+
+    def __init__(
+        self,
+        publisher,
+        limit=100,
+        limit_per_host=10,
+        timeout=10,
+        jitter=0.1,
+    ):
+        """
+        :param publisher: Publisher the records are published through (sync or async).
+        :param limit: Maximum number of open connections.
+        :param limit_per_host: Maximum number of open connections per host.
+        :param timeout: Seconds before a request is abandoned.
+        :param jitter: Fraction by which each poll interval is randomly varied.
+        """
+        self.publisher = publisher
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self.jitter = jitter
+        self.feeds = []
+        self.session = None
+
+    def add_feed(self, channel, url, fields, items=None, interval=10, **options):
+        """
+        Poll a URL every `interval` seconds and publish the projected records to
+        a channel. See Feed for the other options.
+        """
+        feed = Feed(channel, url, Projection(fields, items), interval, **options)
+        self.feeds.append(feed)
+        return feed
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def start(self):
+        """
+        Open the shared session.
+        """
+        connector = aiohttp.TCPConnector(
+            limit=self.limit, limit_per_host=self.limit_per_host, ttl_dns_cache=300
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def run(self):
+        """
+        Poll every feed until cancelled.
+        """
+        if self.session is None:
+            await self.start()
+        await asyncio.gather(*(self.poll_loop(feed) for feed in self.feeds))
+
+    async def poll_loop(self, feed):
+        # Spread the first polls over one interval
+        await asyncio.sleep(random.uniform(0, feed.interval))
+        while True:
+            try:
+                await self.poll(feed)
+            except Exception as e:
+                print(f"Error polling {feed.url}: {e}")
+            jitter = random.uniform(-self.jitter, self.jitter)
+            await asyncio.sleep(feed.interval * (1 + jitter))
+
+    async def fetch(self, feed):
+        """
+        Records of a feed, or None if it has not changed since the last poll.
+        """
+        async with self.session.get(feed.url, headers=feed.headers()) as response:
+            if response.status == 304:
+                return None
+            response.raise_for_status()
+            feed.etag = response.headers.get("ETag")
+            feed.last_modified = response.headers.get("Last-Modified")
+            return await feed.projection.project_stream(response.content)
+
+    async def poll(self, feed):
+        """
+        Fetch a feed once and publish what changed. Returns the number of
+        changed records.
+        """
+        records = await self.fetch(feed)
+        if records is None:
+            return 0
+        if feed.transform is not None:
+            records = [
+                record for record in map(feed.transform, records) if record is not None
+            ]
+
+        changed, removed = feed.diff(records)
+        if not changed and not removed:
+            return 0
+        if feed.publish == "snapshot":
+            await self.send(feed.channel, records)
+        elif feed.publish == "latest":
+            if records:
+                await self.send(feed.channel, records[0])
+        else:
+            for record in changed:
+                await self.send(feed.channel, record)
+        return len(changed)
+
+    async def send(self, channel_name, value):
+        result = self.publisher.publish(channel_name, value)
+        if inspect.isawaitable(result):
+            await result
@@ -0,0 +1,434 @@
+"""Record channel traffic to disk and replay it through a publisher."""
+
+import argparse
+import asyncio
+import heapq
+import inspect
+import json
+import os
+import time
+from urllib.parse import urlencode
+
+import numpy as np
+import websockets
+
+from data_io.async_websocket_channel import AsyncWebSocketChannelPublisher
+from data_io.channel_store import channel_dtype
+from data_io.codec import (
+    DECODE_ERRORS,
+    BinaryCodec,
+    ColumnBlock,
+    resolve_dtype,
+    to_json,
+)
+from data_io.parse import parse_interface_file
+
+# One entry per chunk in `<channel>.index`
+INDEX_DTYPE = np.dtype(
+    [("start", "<f8"), ("end", "<f8"), ("row", "<u8"), ("rows", "<u4")]
+)
+MANIFEST = "manifest.json"
+
+
+def channel_layout(config, value):
+    """
+    Storage layout of a channel, from its declaration and first value:
+    a fixed-size NumPy record ("typed") or one JSON document per value ("json").
+    """
+    channel_type = config.get("type")
+    if channel_type in ("time_series", "struct"):
+        dtype = channel_dtype(config)
+        return {
+            "kind": "typed",
+            "dtype": dtype.descr if dtype.names else dtype.str,
+            "shape": [],
+        }
+    if channel_type in ("array", "image") and isinstance(value, np.ndarray):
+        default = "uint8" if channel_type == "image" else "float64"
+        dtype = resolve_dtype(config.get("dtype"), default)
+        return {"kind": "typed", "dtype": dtype, "shape": list(value.shape)}
+    return {"kind": "json"}
+
+
+def layout_dtype(layout):
+    """
+    NumPy dtype of one stored value of a typed layout.
+    """
+    dtype = layout["dtype"]
+    if isinstance(dtype, list):
+        dtype = [tuple(field) for field in dtype]
+    return np.dtype((np.dtype(dtype), tuple(layout["shape"])))
+
+
+class ChannelRecorder:
+    """
+    Append channel values to a recording directory, one set of column files
+    per channel, written in chunks:
+
+    - `<channel>.time`: float64 timestamps
+    - `<channel>.values`: fixed-size records for time series, structs and
+      fixed-shape arrays; concatenated JSON documents for anything else
+    - `<channel>.offsets`: uint64 end offset of each JSON document
+    - `<channel>.index`: start/end time and first row of each chunk
+
+    The index is written after the data, so a recording cut short by a crash
+    is readable up to its last complete chunk.
+    """
+
+    def __init__(self, path, interface_file, chunk_size=4096):
+        """
+        :param path: Recording directory, created if needed. Existing column
+            files are appended to.
+        :param chunk_size: Values buffered per channel before they are written.
+        """
+        self.path = path
+        self.chunk_size = chunk_size
+        self.channels = parse_interface_file(interface_file)["data_channels"]
+        os.makedirs(path, exist_ok=True)
+        self.manifest = {"channels": {}}
+        if os.path.exists(os.path.join(path, MANIFEST)):
+            with open(os.path.join(path, MANIFEST)) as f:
+                self.manifest = json.load(f)
+        self.rows = {}
+        for name in self.manifest["channels"]:
+            self.rows[name] = self.truncate(name)
+        self.pending = {}  # channel -> ([timestamps], [values])
+        self.dropped = 0
+
+    def truncate(self, channel_name):
+        """
+        Cut the column files of an existing channel back to its last indexed
+        chunk, dropping a partial write, and return its number of rows.
+        """
+        index = self.read_index(self.path, channel_name)
+        rows = int(index["row"][-1] + index["rows"][-1]) if len(index) else 0
+        base = os.path.join(self.path, channel_name)
+        layout = self.manifest["channels"][channel_name]
+        sizes = {"time": rows * 8}
+        if layout["kind"] == "json":
+            sizes["offsets"] = rows * 8
+            end = 0
+            if rows:
+                offsets = np.memmap(f"{base}.offsets", "<u8", "r", shape=(rows,))
+                end = int(offsets[-1])
+                del offsets
+            sizes["values"] = end
+        else:
+            sizes["values"] = rows * layout_dtype(layout).itemsize
+        for column, size in sizes.items():
+            file = f"{base}.{column}"
+            if os.path.exists(file) and os.path.getsize(file) > size:
+                os.truncate(file, size)
+        return rows
+
+    @staticmethod
+    def read_index(path, channel_name):
+        file = os.path.join(path, f"{channel_name}.index")
+        if not os.path.exists(file):
+            return np.empty(0, INDEX_DTYPE)
+        return np.fromfile(file, INDEX_DTYPE)
+
+    def record(self, channel_name, value, timestamp=None):
+        """
+        Buffer one value, writing the channel's chunk once it is full.
+        Values of unknown channels are ignored. Column blocks are recorded
+        value by value, at their own timestamps if they carry them.
+        """
+        if channel_name not in self.channels:
+            return
+        if isinstance(value, ColumnBlock):
+            times = value.timestamps
+            for i, row in enumerate(value.rows()):
+                self.record(
+                    channel_name, row, timestamp if times is None else float(times[i])
+                )
+            return
+        times, values = self.pending.setdefault(channel_name, ([], []))
+        times.append(time.time() if timestamp is None else timestamp)
+        values.append(value)
+        if len(values) >= self.chunk_size:
+            self.write_chunk(channel_name)
+
+    def extend(self, records, timestamp=None):
+        """
+        Buffer a list of (channel, value) records received together.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        for channel_name, value in records:
+            self.record(channel_name, value, timestamp)
+
+    def write_chunk(self, channel_name):
+        times, values = self.pending.pop(channel_name, ([], []))
+        if not values:
+            return
+        layout = self.manifest["channels"].get(channel_name)
+        if layout is None:
+            layout = channel_layout(self.channels[channel_name], values[0])
+            self.manifest["channels"][channel_name] = layout
+            self.rows[channel_name] = 0
+            self.write_manifest()
+
+        try:
+            block, offsets = self.encode(layout, values)
+        except (TypeError, ValueError, KeyError) as e:
+            # A value does not fit the layout chosen from the first one
+            self.dropped += len(values)
+            print(f"Dropped {len(values)} values of '{channel_name}': {e}")
+            return
+
+        base = os.path.join(self.path, channel_name)
+        with open(f"{base}.values", "ab") as f:
+            start = f.tell()
+            f.write(block)
+        if offsets is not None:
+            with open(f"{base}.offsets", "ab") as f:
+                f.write((offsets + start).astype("<u8").tobytes())
+        with open(f"{base}.time", "ab") as f:
+            f.write(np.asarray(times, "<f8").tobytes())
+        entry = np.array(
+            [(times[0], times[-1], self.rows[channel_name], len(values))], INDEX_DTYPE
+        )
+        with open(f"{base}.index", "ab") as f:
+            f.write(entry.tobytes())
+        self.rows[channel_name] += len(values)
+
+    @staticmethod
+    def encode(layout, values):
+        """
+        Column bytes for a chunk, plus the JSON end offsets for json layouts.
+        """
+        if layout["kind"] == "json":
+            documents = [
+                json.dumps(value, default=to_json).encode() for value in values
+            ]
+            offsets = np.cumsum([len(document) for document in documents])
+            return b"".join(documents), offsets
+        dtype = layout_dtype(layout)
+        if dtype.names:
+            values = [tuple(value[field] for field in dtype.names) for value in values]
+        block = np.asarray(values, dtype=dtype.base)
+        if block.shape[1:] != dtype.shape:
+            raise ValueError(f"Expected shape {dtype.shape}, got {block.shape[1:]}.")
+        return block.tobytes(), None
+
+    def write_manifest(self):
+        file = os.path.join(self.path, MANIFEST)
+        with open(f"{file}.tmp", "w") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(f"{file}.tmp", file)
+
+    def flush(self):
+        """
+        Write every buffered value.
+        """
+        for channel_name in list(self.pending):
+            self.write_chunk(channel_name)
+
+    def close(self):
+        self.flush()
+
+
+class ChannelReplayer:
+    """
+    Read a recording made by ChannelRecorder. Column files are memory-mapped
+    and read a chunk at a time, so recordings larger than memory can be
+    replayed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, MANIFEST)) as f:
+            self.layouts = json.load(f)["channels"]
+        self.index = {
+            name: ChannelRecorder.read_index(path, name) for name in self.layouts
+        }
+        self.index = {name: index for name, index in self.index.items() if len(index)}
+
+    @property
+    def channels(self):
+        return list(self.index)
+
+    @property
+    def start_time(self):
+        return min(index["start"][0] for index in self.index.values())
+
+    @property
+    def end_time(self):
+        return max(index["end"][-1] for index in self.index.values())
+
+    def columns(self, channel_name):
+        """
+        Memory-mapped (times, values, offsets) columns of a channel.
+        """
+        base = os.path.join(self.path, channel_name)
+        index = self.index[channel_name]
+        rows = int(index["row"][-1] + index["rows"][-1])
+        times = np.memmap(f"{base}.time", "<f8", "r", shape=(rows,))
+        layout = self.layouts[channel_name]
+        if layout["kind"] == "json":
+            offsets = np.memmap(f"{base}.offsets", "<u8", "r", shape=(rows,))
+            values = np.memmap(
+                f"{base}.values", np.uint8, "r", shape=(int(offsets[-1]),)
+            )
+            return times, values, offsets
+        dtype = layout_dtype(layout)
+        values = np.memmap(
+            f"{base}.values", dtype.base, "r", shape=(rows, *dtype.shape)
+        )
+        return times, values, None
+
+    def iter_channel(self, channel_name, start=None, end=None):
+        """
+        Yield (timestamp, channel, value) for one channel, from the first chunk
+        that can hold `start`.
+        """
+        index = self.index[channel_name]
+        times, values, offsets = self.columns(channel_name)
+        layout = self.layouts[channel_name]
+        fields = layout_dtype(layout).names if layout["kind"] == "typed" else None
+        first = 0 if start is None else np.searchsorted(index["end"], start)
+        for chunk in index[first:]:
+            if end is not None and chunk["start"] > end:
+                return
+            row, rows = int(chunk["row"]), int(chunk["rows"])
+            chunk_times = np.array(times[row : row + rows])
+            skip = 0 if start is None else np.searchsorted(chunk_times, start)
+            for i in range(skip, rows):
+                timestamp = float(chunk_times[i])
+                if end is not None and timestamp > end:
+                    return
+                yield timestamp, channel_name, self.value(
+                    values, offsets, row + i, fields
+                )
+
+    @staticmethod
+    def value(values, offsets, row, fields):
+        if offsets is not None:
+            begin = int(offsets[row - 1]) if row else 0
+            return json.loads(bytes(values[begin : int(offsets[row])]))
+        value = values[row]
+        if fields:
+            return {field: value[field].item() for field in fields}
+        if value.ndim:
+            return np.array(value)  # Copy, so the value outlives the mapping
+        return value.item()
+
+    def records(self, start=None, end=None, channels=None):
+        """
+        Yield (timestamp, channel, value) for every recorded value between
+        `start` and `end` (absolute timestamps), in time order.
+        """
+        names = self.channels if channels is None else channels
+        return heapq.merge(
+            *(
+                self.iter_channel(name, start, end)
+                for name in names
+                if name in self.index
+            ),
+            key=lambda record: record[0],
+        )
+
+    async def replay(self, publisher, speed=1.0, start=None, end=None, channels=None):
+        """
+        Publish recorded values through an AbstractChannelPublisher (sync or
+        async), `speed` times faster than recorded, or as fast as possible if
+        speed is None. Returns the number of values published.
+        """
+        started = time.monotonic()
+        first = None
+        count = 0
+        for timestamp, channel_name, value in self.records(start, end, channels):
+            if speed:
+                first = timestamp if first is None else first
+                delay = started + (timestamp - first) / speed - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            result = publisher.publish(channel_name, value)
+            if inspect.isawaitable(result):
+                await result
+            count += 1
+            if not speed and count % 1000 == 0:
+                await asyncio.sleep(0)  # Let the publisher's sender run
+        return count
+
+
+async def record_broker(
+    recorder, ws_url, channels=None, flush_interval=1.0, retry_interval=1
+):
+    """
+    Record the live traffic of a broker's /consumer endpoint until cancelled.
+    Buffered values are written at least every `flush_interval` seconds.
+    """
+    query = {"encoding": "binary", "history": "0"}
+    if channels:
+        query["channels"] = ",".join(channels)
+    url = f"{ws_url}/consumer?{urlencode(query)}"
+    while True:
+        try:
+            async with websockets.connect(url, max_size=None) as ws:
+                print(f"Recording from {url}")
+                codec = BinaryCodec("recorder", recorder.channels)
+                flushed = time.monotonic()
+                async for frame in ws:
+                    try:
+                        records = codec.decode(frame)
+                    except DECODE_ERRORS as e:
+                        print(f"Dropped invalid frame: {e}")
+                        continue
+                    recorder.extend(records)
+                    if time.monotonic() - flushed >= flush_interval:
+                        recorder.flush()
+                        flushed = time.monotonic()
+        except (websockets.exceptions.ConnectionClosed, OSError) as e:
+            print(f"WebSocket disconnected ({e}). Retrying...")
+        await asyncio.sleep(retry_interval)
+
+
+async def replay_to_broker(path, interface_file, ws_url, speed, start):
+    replayer = ChannelReplayer(path)
+    start = None if start is None else replayer.start_time + start
+    async with AsyncWebSocketChannelPublisher(
+        "replay", interface_file, ws_url, encoding="binary"
+    ) as publisher:
+        count = await replayer.replay(publisher, speed, start)
+    print(f"Replayed {count} values.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record or replay channel traffic")
+    parser.add_argument("command", choices=["record", "replay"])
+    parser.add_argument("path", help="Recording directory")
+    parser.add_argument(
+        "-i", "--interface-file", required=True, help="Interface (MDX) file"
+    )
+    parser.add_argument(
+        "--url", default="ws://localhost:8080", help="Broker WebSocket URL"
+    )
+    parser.add_argument(
+        "-c", "--channels", nargs="+", help="Channels to record (default: all)"
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="Replay speed multiplier, 0 for as fast as possible (default: 1)",
+    )
+    parser.add_argument(
+        "--start", type=float, help="Start replaying this many seconds in"
+    )
+    args = parser.parse_args()
+
+    if args.command == "record":
+        recorder = ChannelRecorder(args.path, args.interface_file)
+        try:
+            asyncio.run(record_broker(recorder, args.url, args.channels))
+        except KeyboardInterrupt:
+            print("Stopping...")
+        finally:
+            recorder.close()
+    else:
+        asyncio.run(
+            replay_to_broker(
+                args.path, args.interface_file, args.url, args.speed, args.start
+            )
+        )
@@ -1,28 +1,368 @@
 """Basic channel publisher implementation."""
 
-import json
+import asyncio
+import contextlib
+import threading
+import time
 
-from redis import Redis
+from redis import ConnectionPool, Redis
+from redis import asyncio as aioredis
 
 from data_io.abstract_channel import AbstractChannelPublisher
+from data_io.batching import AsyncOutbox, BackgroundFlusher, BackpressureError
 
 
-class RedisChannelPublisher(AbstractChannelPublisher):
+class RedisPublisherMixin:
+    """Commands shared by the sync and asyncio Redis publishers."""
+
+    def subscription_counts(self, counts):
+        """
+        Apply a PUBSUB NUMSUB reply. Streams are read back later, so every
+        channel stays subscribed in streams mode.
+        """
+        if self.streams:
+            return
+        self.set_subscriptions(
+            name.decode() if isinstance(name, bytes) else name
+            for name, count in counts
+            if count
+        )
+
+    def reduce(self, channel_name, value):
+        """
+        Values to send for a published value. Unlike other publishers, values
+        are never decimated, so Redis keeps the raw stream; unchanged values
+        are still skipped and `max_rate` still applies.
+        """
+        if self.is_unchanged(channel_name, value):
+            return ()
+        return self.schedule(channel_name, (value,))
+
+    def write(self, client, channel_name, value):
+        """
+        Issue the command for one value on a client or pipeline.
+        """
+        payload = self.format_value(channel_name, value)
+        if self.streams:
+            client.xadd(
+                channel_name,
+                {"value": payload},
+                maxlen=self.channels[channel_name].get("buffer", 1),
+                approximate=True,
+            )
+        else:
+            client.publish(channel_name, payload)
+
+    def observe_send(self, start):
+        if self.metrics is not None:
+            self.metrics.observe("send_seconds", time.perf_counter() - start)
+
+
+class RedisChannelPublisher(RedisPublisherMixin, AbstractChannelPublisher):
     """Simple class to publish messages to data channels."""
 
-    def __init__(self, interface_file, redis_host="localhost", redis_port=6379):
+    def __init__(
+        self,
+        source_name: str,
+        interface_file: str,
+        redis_host="localhost",
+        redis_port=6379,
+        pipeline_size=None,
+        max_latency=0.01,
+        max_queue=100000,
+        coalesce=(),
+        streams=False,
+        encoding="json",
+        client=None,
+    ):
         """
         Parse the interface file and initialize Redis connection.
+        :param pipeline_size: Enable pipelining; flush once this many commands are queued.
+        :param max_latency: Maximum seconds a command may wait before being flushed.
+        :param max_queue: Maximum number of queued commands before publish fails.
+        :param coalesce: Channels for which only the newest queued value is sent.
+        :param streams: Append to a Redis Stream per channel (XADD) instead of PUBLISH.
+            Streams are trimmed to roughly the channel's `buffer` size.
+        :param encoding: Wire encoding for values, "json" or "binary".
+        :param client: Publish with this Redis client (e.g. a fakeredis one)
+            instead of connecting to `redis_host`. `close` leaves it open.
         """
-        super().__init__(interface_file)
-        self.redis = Redis(host=redis_host, port=redis_port, decode_responses=True)
+        super().__init__(source_name, interface_file, encoding)
+        self.lock = threading.Lock()  # Rate-limited values are released by timers
+        self.pool = None
+        if client is None:
+            self.pool = ConnectionPool(host=redis_host, port=redis_port)
+            client = Redis(connection_pool=self.pool)
+        self.redis = client
+        self.streams = streams
+
+        self.flusher = None
+        if pipeline_size:
+            self.flusher = BackgroundFlusher(
+                self.send_records, pipeline_size, max_latency, max_queue, coalesce
+            )
+
+    @property
+    def queue_depth(self):
+        return len(self.flusher) if self.flusher is not None else 0
+
+    @property
+    def queue_dropped(self):
+        return self.flusher.queue.dropped if self.flusher is not None else 0
 
     def publish(self, channel_name, value):
         """
         Publish a value to a Redis channel.
+        Values are never decimated, so Redis keeps the raw stream. Values for
+        channels without subscribers are discarded once `refresh_subscriptions`
+        has run.
         """
-        if channel_name not in self.channels:
-            raise ValueError(
-                f"Channel '{channel_name}' is not defined in the interface file."
-            )
-        self.redis.publish(channel_name, json.dumps(value))
+        if channel_name in self.idle:
+            return
+        value = self.prepare(channel_name, value)
+        with self.lock:
+            for value in self.reduce(channel_name, value):
+                self.send_value(channel_name, value)
+
+    def publish_many(self, channel_name, values, timestamps=None):
+        """
+        Publish a block of values of a time series or struct channel as a
+        single columnar message. See `make_block` for the accepted values;
+        `timestamps` are optional seconds since the epoch, one per value.
+        """
+        if channel_name in self.idle:
+            return
+        block = self.make_block(channel_name, values, timestamps)
+        with self.lock:
+            for block in self.reduce_block(channel_name, block):
+                self.send_value(channel_name, block)
+
+    def release(self, channel_name):
+        with self.lock:
+            super().release(channel_name)
+
+    def send_released(self, channel_name, value):
+        try:
+            self.send_value(channel_name, value)
+        except Exception as e:
+            if self.metrics is not None:
+                self.metrics.inc("dropped", channel_name)
+            print(f"Failed to publish rate-limited value: {e}")
+
+    def send_value(self, channel_name, value):
+        if self.flusher is not None:
+            self.flusher.put(channel_name, value)
+            return
+
+        try:
+            start = time.perf_counter()
+            self.write(self.redis, channel_name, value)
+            self.observe_send(start)
+        except Exception as e:
+            raise RuntimeError(f"Failed to publish message: {e}") from e
+
+    def refresh_subscriptions(self):
+        """
+        Ask Redis which channels have subscribers and skip publishing the others.
+        Pattern subscriptions are not counted, so only call this when consumers
+        subscribe to channels by name.
+        """
+        self.subscription_counts(self.redis.pubsub_numsub(*self.channels))
+
+    def send_records(self, records):
+        """
+        Send records in a single non-transactional pipeline.
+        """
+        pipeline = self.redis.pipeline(transaction=False)
+        for channel_name, value in records:
+            self.write(pipeline, channel_name, value)
+        start = time.perf_counter()
+        pipeline.execute()
+        self.observe_send(start)
+
+    def flush(self):
+        """
+        Send every queued command immediately.
+        """
+        if self.flusher is not None:
+            self.flusher.flush()
+
+    def close(self):
+        """
+        Flush queued commands and release the connection pool.
+        """
+        with self.lock:
+            for channel_name, value in self.drain_held():
+                self.send_value(channel_name, value)
+        if self.flusher is not None:
+            self.flusher.close()
+        if self.pool is not None:
+            self.pool.disconnect()
+
+
+class AsyncRedisChannelPublisher(RedisPublisherMixin, AbstractChannelPublisher):
+    """Publish messages to data channels via Redis from an asyncio event loop."""
+
+    def __init__(
+        self,
+        source_name: str,
+        interface_file: str,
+        redis_host="localhost",
+        redis_port=6379,
+        pipeline_size=1000,
+        max_latency=0.005,
+        max_queue=100000,
+        coalesce=(),
+        streams=False,
+        encoding="json",
+        subscription_interval=None,
+        client=None,
+    ):
+        """
+        Parse the interface file. Commands are sent by `start()`'s background task.
+        :param pipeline_size: Maximum number of commands sent in a single pipeline.
+        :param max_latency: Seconds to wait for a partial pipeline to fill.
+        :param max_queue: Maximum number of commands waiting to be sent.
+        :param coalesce: Channels for which only the newest queued value is sent.
+        :param streams: Append to a Redis Stream per channel (XADD) instead of PUBLISH.
+        :param encoding: Wire encoding for values, "json" or "binary".
+        :param subscription_interval: Check which channels have subscribers every
+            this many seconds and skip publishing the others (see
+            `refresh_subscriptions`); None publishes everything.
+        :param client: Publish with this `redis.asyncio` client (e.g. a
+            fakeredis one) instead of connecting to `redis_host`. `close`
+            leaves it open.
+        """
+        super().__init__(source_name, interface_file, encoding)
+        self.pool = None
+        if client is None:
+            self.pool = aioredis.ConnectionPool(host=redis_host, port=redis_port)
+            client = aioredis.Redis(connection_pool=self.pool)
+        self.redis = client
+        self.streams = streams
+        self.outbox = AsyncOutbox(max_queue, coalesce, pipeline_size, max_latency)
+        self.sender = None
+        self.subscription_interval = subscription_interval
+        self.watcher = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    @property
+    def queue_depth(self):
+        return len(self.outbox)
+
+    @property
+    def queue_dropped(self):
+        return self.outbox.queue.dropped
+
+    async def start(self):
+        """
+        Start the background pipeline sender.
+        """
+        self.sender = asyncio.create_task(self.send_loop())
+        if self.subscription_interval and not self.streams:
+            self.watcher = asyncio.create_task(self.watch_subscriptions())
+
+    async def refresh_subscriptions(self):
+        """
+        Ask Redis which channels have subscribers and skip publishing the others.
+        """
+        self.subscription_counts(await self.redis.pubsub_numsub(*self.channels))
+
+    async def watch_subscriptions(self):
+        """
+        Refresh the subscribed channels every `subscription_interval` seconds.
+        """
+        while True:
+            try:
+                await self.refresh_subscriptions()
+            except Exception as e:
+                print(f"Failed to check subscriptions: {e}")
+            await asyncio.sleep(self.subscription_interval)
+
+    async def publish(self, channel_name, value):
+        """
+        Queue a value for sending, waiting for space if the queue is full.
+        """
+        if channel_name in self.idle:
+            return
+        value = self.prepare(channel_name, value)
+        for value in self.reduce(channel_name, value):
+            await self.outbox.put(channel_name, value)
+
+    async def publish_many(self, channel_name, values, timestamps=None):
+        """
+        Queue a block of values of a time series or struct channel, sent as a
+        single columnar message.
+        """
+        if channel_name in self.idle:
+            return
+        block = self.make_block(channel_name, values, timestamps)
+        for block in self.reduce_block(channel_name, block):
+            await self.outbox.put(channel_name, block)
+
+    def publish_nowait(self, channel_name, value):
+        """
+        Queue a value for sending without waiting.
+        Raises BackpressureError if the queue is full.
+        """
+        if channel_name in self.idle:
+            return
+        value = self.prepare(channel_name, value)
+        for value in self.reduce(channel_name, value):
+            self.outbox.put_nowait(channel_name, value)
+
+    def call_later(self, delay, callback, *args):
+        return asyncio.get_running_loop().call_later(delay, callback, *args)
+
+    def send_released(self, channel_name, value):
+        try:
+            self.outbox.put_nowait(channel_name, value)
+        except BackpressureError:
+            if self.metrics is not None:
+                self.metrics.inc("dropped", channel_name)
+            print(f"Dropped rate-limited value for '{channel_name}': outbox full.")
+
+    async def send_loop(self):
+        """
+        Send queued values in pipelines as they become available.
+        """
+        while records := await self.outbox.get_batch():
+            pipeline = self.redis.pipeline(transaction=False)
+            for channel_name, value in records:
+                self.write(pipeline, channel_name, value)
+            start = time.perf_counter()
+            try:
+                await pipeline.execute()
+                self.observe_send(start)
+            except Exception as e:
+                if self.metrics is not None:
+                    for channel_name, _ in records:
+                        self.metrics.inc("dropped", channel_name)
+                print(f"Failed to publish {len(records)} messages: {e}")
+
+    async def close(self, timeout=5):
+        """
+        Send any queued values and release the connection pool.
+        """
+        if self.watcher is not None:
+            self.watcher.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self.watcher
+            self.watcher = None
+        for channel_name, value in self.drain_held():
+            await self.outbox.put(channel_name, value)
+        self.outbox.close()
+        if self.sender is not None:
+            try:
+                await asyncio.wait_for(self.sender, timeout)
+            except asyncio.TimeoutError:
+                print(f"Dropped {len(self.outbox)} unsent messages on close.")
+            self.sender = None
+        if self.pool is not None:
+            await self.pool.disconnect()
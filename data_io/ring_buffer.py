@@ -0,0 +1,115 @@
+"""Single-producer/single-consumer ring buffer for callback-driven producers."""
+
+import asyncio
+
+import numpy as np
+
+
+class SPSCRingBuffer:
+    """
+    Fixed-capacity ring buffer shared by one writer thread and one reader.
+
+    Instead of locks, the writer publishes two sequence counters: `reserved`
+    before copying a block in and `written` once the copy is complete. Readers
+    only look at samples below `written`, and can tell whether the writer has
+    since wrapped around onto them with `valid()`. Reads return views into the
+    buffer rather than copies.
+    """
+
+    def __init__(self, capacity, dtype=np.float32, frame_shape=()):
+        """
+        Allocate the buffer.
+        :param capacity: Maximum number of frames kept.
+        :param dtype: Dtype of the stored samples.
+        :param frame_shape: Shape of one frame, e.g. (2,) for stereo audio.
+        """
+        if capacity < 1:
+            raise ValueError("Ring buffer capacity must be at least 1.")
+        self.capacity = capacity
+        self.frame_shape = tuple(frame_shape)
+        self.data = np.zeros((capacity, *self.frame_shape), dtype=dtype)
+        self.reserved = 0  # Frames the writer has started to write
+        self.written = 0  # Frames completely written
+        self.read = 0  # Frames handed to the reader by read_new()
+        self.overruns = 0  # Frames overwritten before read_new() got to them
+        self.loop = None
+        self.new_data = None
+
+    def __len__(self):
+        return min(self.written, self.capacity)
+
+    def write(self, block):
+        """
+        Append a block of frames. Called from the producer thread only.
+        """
+        block = np.asarray(block, dtype=self.data.dtype).reshape(
+            (-1, *self.frame_shape)
+        )
+        # Frames that would be overwritten within this block are never stored
+        skipped = max(len(block) - self.capacity, 0)
+        block = block[skipped:]
+        n = len(block)
+        start = (self.written + skipped) % self.capacity
+        head = min(n, self.capacity - start)
+
+        self.reserved = self.written + skipped + n
+        self.data[start : start + head] = block[:head]
+        self.data[: n - head] = block[head:]
+        self.written = self.reserved
+
+        if self.new_data is not None:
+            self.loop.call_soon_threadsafe(self.new_data.set)
+
+    def valid(self, start):
+        """
+        Whether frames from sequence number `start` onwards are still intact.
+        Check this after using views returned by `views()` or `latest()`.
+        """
+        return self.reserved - start <= self.capacity
+
+    def views(self, start, stop):
+        """
+        Views of the frames with sequence numbers [start, stop), oldest first.
+        Returns one view, or two when the range wraps around the end.
+        """
+        if stop == start:
+            return ()
+        begin = start % self.capacity
+        end = begin + stop - start
+        if end <= self.capacity:
+            return (self.data[begin:end],)
+        return (self.data[begin:], self.data[: end - self.capacity])
+
+    def latest(self, n):
+        """
+        The most recent `n` frames (fewer if not yet written) as
+        (start sequence number, views).
+        """
+        stop = self.written
+        start = max(stop - n, stop - self.capacity, 0)
+        return start, self.views(start, stop)
+
+    def read_new(self):
+        """
+        Every frame written since the previous call as (start sequence number,
+        views). Frames overwritten before they could be read are skipped and
+        counted in `overruns`.
+        """
+        stop = self.written
+        start = max(self.read, self.reserved - self.capacity)
+        self.overruns += start - self.read
+        self.read = stop
+        return start, self.views(start, stop)
+
+    async def wait(self):
+        """
+        Wait until frames not yet returned by read_new() are available.
+        """
+        if self.new_data is None:
+            self.loop = asyncio.get_running_loop()
+            self.new_data = asyncio.Event()
+        while self.written == self.read:
+            self.new_data.clear()
+            if self.written != self.read:
+                break
+            await self.new_data.wait()
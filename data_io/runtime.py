@@ -0,0 +1,334 @@
+"""Run producers in worker processes that share one publisher connection."""
+
+import asyncio
+import inspect
+import multiprocessing
+import queue
+import traceback
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Messages sent from workers to the publisher process
+VALUE = 0  # (VALUE, worker id, channel, value)
+SLOT = 1  # (SLOT, worker id, channel, slot, dtype, shape)
+DONE = 2  # (DONE, worker id, None)
+ERROR = 3  # (ERROR, worker id, formatted traceback)
+BLOCK = 4  # (BLOCK, worker id, channel, values, timestamps)
+
+
+def attach_shared_memory(name):
+    """
+    Attach to a shared memory block created by the publisher process, which
+    stays responsible for unlinking it.
+    """
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        # Before Python 3.13 attaching registers the block again, but spawned
+        # workers share the parent's resource tracker, so this is harmless
+        return shared_memory.SharedMemory(name)
+
+
+class WorkerPublisher:
+    """
+    Publisher handed to producers running in a worker process.
+
+    Arrays of at least `min_shared_size` bytes are copied into a free shared
+    memory slot and only the slot number is sent to the publisher process;
+    other values are pickled.
+    """
+
+    def __init__(
+        self,
+        worker_id,
+        channels,
+        messages,
+        free_slots,
+        shm_name,
+        slot_size,
+        min_shared_size,
+        idle=(),
+        subscriptions=None,
+    ):
+        self.worker_id = worker_id
+        self.channels = channels
+        self.messages = messages
+        self.idle = set(idle)  # Channels nobody is watching
+        self.subscriptions = subscriptions  # Queue of idle set updates
+        self.free_slots = free_slots
+        self.shm = attach_shared_memory(shm_name)
+        self.slot_size = slot_size
+        self.min_shared_size = min_shared_size
+
+    def refresh_subscriptions(self, block=False):
+        """
+        Apply the idle channel updates sent by the publisher process.
+        """
+        try:
+            self.idle = self.subscriptions.get(block)
+            while True:
+                self.idle = self.subscriptions.get_nowait()
+        except queue.Empty:
+            pass
+
+    def is_subscribed(self, channel_name):
+        """
+        Whether anyone is watching a channel.
+        """
+        if self.subscriptions is not None:
+            self.refresh_subscriptions()
+        return channel_name not in self.idle
+
+    def wait_for_subscribers_blocking(self, channel_name):
+        """
+        Block until a consumer subscribes to a channel.
+        """
+        while not self.is_subscribed(channel_name):
+            self.refresh_subscriptions(block=True)
+
+    def publish(self, channel_name, value):
+        """
+        Send a value to the publisher process. Values for channels nobody
+        watches are discarded.
+        Blocks while every shared memory slot of this worker is in use.
+        """
+        if channel_name not in self.channels:
+            raise ValueError(
+                f"Channel '{channel_name}' is not defined in the interface file."
+            )
+        if not self.is_subscribed(channel_name):
+            return
+
+        if (
+            isinstance(value, np.ndarray)
+            and self.min_shared_size <= value.nbytes <= self.slot_size
+        ):
+            slot = self.free_slots.get()
+            view = np.ndarray(
+                value.shape,
+                value.dtype,
+                buffer=self.shm.buf,
+                offset=slot * self.slot_size,
+            )
+            view[...] = value
+            del view  # Release the buffer export so the block can be closed
+            self.messages.put(
+                (SLOT, self.worker_id, channel_name, slot, value.dtype.str, value.shape)
+            )
+        else:
+            self.messages.put((VALUE, self.worker_id, channel_name, value))
+
+    def publish_many(self, channel_name, values, timestamps=None):
+        """
+        Send a block of values to the publisher process, which publishes it
+        with `publish_many`.
+        """
+        if channel_name not in self.channels:
+            raise ValueError(
+                f"Channel '{channel_name}' is not defined in the interface file."
+            )
+        if not self.is_subscribed(channel_name):
+            return
+        self.messages.put((BLOCK, self.worker_id, channel_name, values, timestamps))
+
+    def close(self):
+        self.shm.close()
+
+
+def run_worker(
+    worker_id, producer, args, channels, messages, free_slots, worker_options
+):
+    """
+    Worker process entry point: run one producer until it returns.
+    """
+    publisher = WorkerPublisher(
+        worker_id, channels, messages, free_slots, **worker_options
+    )
+    try:
+        result = producer(publisher, *args)
+        if inspect.isawaitable(result):
+            asyncio.run(result)
+        messages.put((DONE, worker_id, None))
+    except KeyboardInterrupt:
+        pass
+    except Exception:
+        messages.put((ERROR, worker_id, traceback.format_exc()))
+    finally:
+        publisher.close()
+
+
+class ProducerRuntime:
+    """
+    Run CPU-heavy producers in their own processes and I/O-bound producers as
+    tasks, all publishing through a single asyncio publisher.
+    """
+
+    def __init__(
+        self,
+        publisher,
+        slots=4,
+        slot_size=1 << 20,
+        min_shared_size=4096,
+        max_queue=10000,
+    ):
+        """
+        :param publisher: Started async publisher (AsyncWebSocketChannelPublisher
+            or AsyncRedisChannelPublisher) that owns the connection.
+        :param slots: Shared memory slots per worker process.
+        :param slot_size: Bytes per slot; larger arrays are pickled instead.
+        :param min_shared_size: Smaller arrays are pickled rather than using a slot.
+        :param max_queue: Maximum number of messages waiting for the publisher
+            process; workers block while it is full.
+        """
+        self.publisher = publisher
+        self.slots = slots
+        self.slot_size = slot_size
+        self.min_shared_size = min_shared_size
+        self.context = multiprocessing.get_context("spawn")
+        self.messages = self.context.Queue(max_queue)
+        self.processes = []  # (producer, args) run in worker processes
+        self.tasks = []  # (producer, args) run on the publisher's event loop
+        self.workers = {}  # worker id -> (process, shared memory, free slot queue)
+        self.subscription_queues = []  # Idle channel updates, one queue per worker
+
+    def add_process(self, producer, *args):
+        """
+        Run `producer(publisher, *args)` in a worker process. The producer must be
+        picklable (defined at module level) and may be a plain or async function.
+        """
+        self.processes.append((producer, args))
+
+    def add_task(self, producer, *args):
+        """
+        Run the coroutine function `producer(publisher, *args)` in this process.
+        """
+        self.tasks.append((producer, args))
+
+    def notify_workers(self, subscriptions):
+        """
+        Forward the publisher's idle channels to the workers on every change.
+        """
+        for updates in self.subscription_queues:
+            updates.put(set(self.publisher.idle))
+
+    def start_workers(self):
+        channels = set(self.publisher.channels)
+        shm_size = self.slots * self.slot_size
+        if self.processes:
+            self.publisher.subscription_listeners.append(self.notify_workers)
+        for worker_id, (producer, args) in enumerate(self.processes):
+            shm = shared_memory.SharedMemory(create=True, size=shm_size)
+            free_slots = self.context.Queue()
+            for slot in range(self.slots):
+                free_slots.put(slot)
+            updates = self.context.Queue()
+            self.subscription_queues.append(updates)
+            worker_options = {
+                "shm_name": shm.name,
+                "slot_size": self.slot_size,
+                "min_shared_size": self.min_shared_size,
+                "idle": set(self.publisher.idle),
+                "subscriptions": updates,
+            }
+            process = self.context.Process(
+                target=run_worker,
+                args=(
+                    worker_id,
+                    producer,
+                    args,
+                    channels,
+                    self.messages,
+                    free_slots,
+                    worker_options,
+                ),
+                daemon=True,
+            )
+            process.start()
+            self.workers[worker_id] = (process, shm, free_slots)
+
+    def receive(self, limit=1000, timeout=0.5):
+        """
+        Wait for the next worker message, then take any others already queued.
+        Runs in a thread, so it gives up after `timeout` to allow shutdown.
+        """
+        messages = []
+        try:
+            messages.append(self.messages.get(timeout=timeout))
+            while len(messages) < limit:
+                messages.append(self.messages.get_nowait())
+        except queue.Empty:
+            pass
+        return messages
+
+    async def forward_loop(self):
+        """
+        Publish worker messages until every worker has finished.
+        """
+        loop = asyncio.get_running_loop()
+        running = set(self.workers)
+        while running:
+            messages = await loop.run_in_executor(None, self.receive)
+            if not messages:
+                for worker_id in list(running):
+                    process = self.workers[worker_id][0]
+                    if not process.is_alive():
+                        print(
+                            f"Producer process {worker_id} exited "
+                            f"with code {process.exitcode}"
+                        )
+                        running.discard(worker_id)
+            for kind, worker_id, *payload in messages:
+                if kind == BLOCK:
+                    try:
+                        await self.publisher.publish_many(*payload)
+                    except ValueError as e:
+                        print(f"Dropped block from producer process {worker_id}: {e}")
+                    continue
+                if kind == VALUE:
+                    channel_name, value = payload
+                elif kind == SLOT:
+                    channel_name, slot, dtype, shape = payload
+                    _, shm, free_slots = self.workers[worker_id]
+                    value = np.ndarray(
+                        shape, dtype, buffer=shm.buf, offset=slot * self.slot_size
+                    ).copy()
+                    free_slots.put(slot)
+                else:
+                    running.discard(worker_id)
+                    if kind == ERROR:
+                        print(f"Producer process {worker_id} failed:\n{payload[0]}")
+                    continue
+
+                try:
+                    await self.publisher.publish(channel_name, value)
+                except ValueError as e:
+                    print(f"Dropped value from producer process {worker_id}: {e}")
+
+    async def run(self):
+        """
+        Start every producer and run until they have all finished.
+        """
+        self.start_workers()
+        try:
+            await asyncio.gather(
+                self.forward_loop(),
+                *(producer(self.publisher, *args) for producer, args in self.tasks),
+            )
+        finally:
+            self.stop()
+
+    def stop(self):
+        """
+        Stop the worker processes and free their shared memory.
+        """
+        if self.notify_workers in self.publisher.subscription_listeners:
+            self.publisher.subscription_listeners.remove(self.notify_workers)
+        self.subscription_queues = []
+        for process, shm, _ in self.workers.values():
+            if process.is_alive():
+                process.terminate()
+            process.join()
+            shm.close()
+            shm.unlink()
+        self.workers = {}
@@ -0,0 +1,139 @@
+"""Per-channel rate limiting with latest-value coalescing."""
+
+import time
+from collections import Counter
+
+
+class TokenBucket:
+    """Allow `rate` events per second on average, with bursts of up to `burst`."""
+
+    def __init__(self, rate, burst=1):
+        if rate <= 0:
+            raise ValueError("Rate must be positive.")
+        if burst < 1:
+            raise ValueError("Burst must be at least 1.")
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Bucket for a channel's `max_rate` (per second) or `min_interval` (seconds).
+        """
+        if "max_rate" in config:
+            rate = float(config["max_rate"])
+        else:
+            rate = 1 / float(config["min_interval"])
+        return cls(rate, config.get("burst", 1))
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now):
+        """
+        Use a token if one is available.
+        """
+        self.refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def delay(self, now):
+        """
+        Seconds until a token is available.
+        """
+        self.refill(now)
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class ChannelScheduler:
+    """
+    Limit how often channels with a `max_rate` or `min_interval` are sent.
+
+    Values offered while a channel is out of tokens are held, the newest
+    replacing any older one, and must be released by the caller once the
+    delay returned by `arm` has elapsed.
+    """
+
+    def __init__(self, data_channels):
+        self.buckets = {
+            name: TokenBucket.from_config(config)
+            for name, config in data_channels.items()
+            if "max_rate" in config or "min_interval" in config
+        }
+        self.held = {}  # channel -> newest value waiting for a token
+        self.armed = set()  # channels with a release scheduled
+        self.coalesced = Counter()  # values replaced by a newer one while held
+
+    def __contains__(self, channel_name):
+        return channel_name in self.buckets
+
+    @property
+    def throttled(self):
+        """
+        Channels currently holding back a value.
+        """
+        return set(self.held)
+
+    def offer(self, channel_name, value, now=None):
+        """
+        Returns True if the value may be sent now, otherwise holds it.
+        """
+        bucket = self.buckets.get(channel_name)
+        if bucket is None:
+            return True
+        now = time.monotonic() if now is None else now
+        if channel_name in self.held:
+            self.coalesced[channel_name] += 1
+        elif bucket.take(now):
+            return True
+        self.held[channel_name] = value
+        return False
+
+    def arm(self, channel_name, now=None):
+        """
+        Seconds after which `release` should be called for a channel, or None if
+        it holds no value or a release is already scheduled.
+        """
+        if channel_name not in self.held or channel_name in self.armed:
+            return None
+        self.armed.add(channel_name)
+        now = time.monotonic() if now is None else now
+        return self.buckets[channel_name].delay(now)
+
+    def release(self, channel_name, now=None):
+        """
+        Records to send for a scheduled release: the held value if a token is
+        available. Call `arm` again afterwards in case it is still held.
+        """
+        self.armed.discard(channel_name)
+        now = time.monotonic() if now is None else now
+        if channel_name in self.held and self.buckets[channel_name].take(now):
+            return [(channel_name, self.held.pop(channel_name))]
+        return []
+
+    def drain(self):
+        """
+        Every held value as records, regardless of the rate (e.g. on close).
+        """
+        records = list(self.held.items())
+        self.held.clear()
+        self.armed.clear()
+        return records
+
+    def stats(self):
+        """
+        Rate, held state and coalesced count of every rate-limited channel.
+        """
+        return {
+            name: {
+                "max_rate": bucket.rate,
+                "throttled": name in self.held,
+                "coalesced": self.coalesced[name],
+            }
+            for name, bucket in self.buckets.items()
+        }
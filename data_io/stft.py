@@ -0,0 +1,145 @@
+"""Incremental short-time Fourier transform for streaming audio."""
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+from scipy.signal import get_window
+
+
+class StreamingSpectrogram:
+    """
+    Rolling average power spectrum over the most recent `history` segments.
+
+    Matches `scipy.signal.spectrogram` defaults (Tukey window, constant detrend,
+    one-sided PSD), but each call to `feed` only transforms the segments that
+    completed since the previous call.
+    """
+
+    def __init__(
+        self,
+        samplerate,
+        nperseg=256,
+        noverlap=None,
+        history=45,
+        freq_range=None,
+        window=("tukey", 0.25),
+    ):
+        """
+        Precompute the window, scaling and frequency slice.
+        :param samplerate: Audio sampling rate.
+        :param nperseg: Number of samples per segment.
+        :param noverlap: Samples shared by consecutive segments (default nperseg // 8).
+        :param history: Number of most recent segments averaged together.
+        :param freq_range: Optional (min_freq, max_freq) to keep; other bins are
+            never stored.
+        :param window: Window passed to `scipy.signal.get_window`.
+        """
+        if noverlap is None:
+            noverlap = nperseg // 8
+        if not 0 <= noverlap < nperseg:
+            raise ValueError("noverlap must be at least 0 and less than nperseg.")
+        if history < 1:
+            raise ValueError("history must be at least 1.")
+
+        self.nperseg = nperseg
+        self.hop = nperseg - noverlap
+        self.history = history
+
+        self.window = get_window(window, nperseg).astype(np.float32)
+        # PSD ("density") scaling, doubled for the one-sided spectrum except
+        # for the DC and (even nperseg) Nyquist bins
+        frequencies = np.fft.rfftfreq(nperseg, 1 / samplerate)
+        scale = np.full(len(frequencies), 2 / (samplerate * (self.window**2).sum()))
+        scale[0] /= 2
+        if nperseg % 2 == 0:
+            scale[-1] /= 2
+
+        if freq_range is None:
+            self.bins = slice(0, len(frequencies))
+        else:
+            low, high = freq_range
+            selected = np.flatnonzero((frequencies >= low) & (frequencies <= high))
+            self.bins = slice(selected[0], selected[-1] + 1)
+        self.frequencies = frequencies[self.bins]
+        self.scale = scale[self.bins]
+
+        # Samples not yet part of a complete segment
+        self.pending = np.zeros(nperseg + self.hop * history, dtype=np.float32)
+        self.pending_size = 0
+
+        # Power of the last `history` segments and their running sum
+        self.segments = np.zeros((history, len(self.frequencies)))
+        self.total = np.zeros(len(self.frequencies))
+        self.count = 0  # Total number of segments ever transformed
+
+        self.average = np.zeros(len(self.frequencies))
+        self.normalized = np.zeros(len(self.frequencies))
+
+    def feed(self, samples):
+        """
+        Add new samples and transform every segment they complete.
+        Returns the number of new segments.
+        """
+        samples = np.asarray(samples, dtype=np.float32).ravel()
+        end = self.pending_size + len(samples)
+        if end > len(self.pending):
+            # Only the segments that fit in the history are worth transforming
+            keep = self.nperseg + self.hop * (self.history - 1)
+            keep += (end - keep) % self.hop
+            if len(samples) >= keep:
+                self.pending[:keep] = samples[-keep:]
+            else:
+                kept = keep - len(samples)
+                start = self.pending_size - kept
+                self.pending[:kept] = self.pending[start : self.pending_size]
+                self.pending[kept:keep] = samples
+            end = keep
+        else:
+            self.pending[self.pending_size : end] = samples
+
+        if end < self.nperseg:
+            self.pending_size = end
+            return 0
+
+        n = (end - self.nperseg) // self.hop + 1
+        step = self.pending.strides[0]
+        frames = as_strided(
+            self.pending, (n, self.nperseg), (step * self.hop, step), writeable=False
+        )
+        frames = (frames - frames.mean(axis=1, keepdims=True)) * self.window
+        spectrum = np.fft.rfft(frames, axis=1)[:, self.bins]
+        power = (spectrum.real**2 + spectrum.imag**2) * self.scale
+        self.push(power)
+
+        # Keep the overlap and any partial segment for the next call
+        consumed = n * self.hop
+        self.pending_size = end - consumed
+        self.pending[: self.pending_size] = self.pending[consumed:end]
+        return n
+
+    def push(self, power):
+        """
+        Replace the oldest stored segments with new ones, updating the running sum.
+        """
+        power = power[-self.history :]
+        n = len(power)
+        rows = (self.count + np.arange(n)) % self.history
+
+        self.total -= self.segments[rows].sum(axis=0)
+        self.segments[rows] = power
+        self.total += power.sum(axis=0)
+        self.count += n
+
+        if self.count % self.history < n:
+            # Resynchronise once per lap so rounding errors cannot accumulate
+            self.segments.sum(axis=0, out=self.total)
+
+    def amplitudes(self):
+        """
+        Mean power per frequency over the stored segments, min-max normalized.
+        Returns an array that is overwritten by the next call.
+        """
+        np.divide(self.total, max(min(self.count, self.history), 1), out=self.average)
+        low = self.average.min()
+        np.subtract(self.average, low, out=self.normalized)
+        self.normalized /= self.average.max() - low + 1e-9
+        return self.normalized
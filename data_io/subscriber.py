@@ -0,0 +1,276 @@
+"""Python consumers for data channels, buffering values in NumPy ring buffers."""
+
+import asyncio
+from abc import abstractmethod
+from urllib.parse import urlencode
+
+import websockets
+from redis import asyncio as aioredis
+from websockets.exceptions import ConnectionClosed
+
+from data_io.channel_store import ChannelStore
+from data_io.codec import DECODE_ERRORS, BinaryCodec
+from data_io.parse import parse_interface_file
+
+
+class AbstractChannelSubscriber:
+    """
+    Keep the recent history of subscribed channels in per-channel ring buffers
+    sized from the front matter `buffer`.
+
+    Time series come out as 1-D arrays, structs as structured arrays (index
+    them by field name) and arrays/images as one (n, *shape) array.
+    """
+
+    def __init__(self, interface_file: str, channels=None, tracker=None):
+        """
+        Parse the interface file and allocate the buffers.
+        :param channels: Channel names to subscribe to, or None for every channel.
+        :param tracker: Optional data_io.tracing.LatencyTracker fed the traces
+            of received records.
+        """
+        self.interface_file = interface_file
+        self.channels = parse_interface_file(interface_file)["data_channels"]
+        if channels is not None:
+            unknown = set(channels) - set(self.channels)
+            if unknown:
+                raise ValueError(
+                    f"Channels {sorted(unknown)} are not defined in the interface file."
+                )
+        self.subscribed = list(self.channels if channels is None else channels)
+        self.store = ChannelStore(self.channels, typed_arrays=True)
+        self.updated = asyncio.Condition()
+        self.receiver = None
+        self.tracker = tracker
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def __aiter__(self):
+        return self.updates()
+
+    async def start(self):
+        """
+        Start receiving in a background task.
+        """
+        self.receiver = asyncio.create_task(self.receive_loop())
+
+    async def close(self):
+        if self.receiver is not None:
+            self.receiver.cancel()
+            try:
+                await self.receiver
+            except asyncio.CancelledError:
+                pass
+            self.receiver = None
+
+    @abstractmethod
+    async def receive_loop(self):
+        """Receive and buffer values until cancelled."""
+
+    def decode_frame(self, codec, frame):
+        """
+        Decode a frame into (channel, value) records, passing their traces to
+        the tracker.
+        """
+        if self.tracker is None:
+            return codec.decode(frame)
+        records = codec.decode_traced(frame)
+        self.tracker.observe_records(records)
+        return [(channel_name, value) for channel_name, value, _ in records]
+
+    async def store_records(self, records):
+        """
+        Append decoded (channel, value) records and wake up `updates` iterators.
+        """
+        if not records:
+            return
+        self.store.extend(records)
+        async with self.updated:
+            self.updated.notify_all()
+
+    def latest(self, channel_name):
+        """
+        The most recent value of a channel, or None if nothing was received.
+        """
+        return self.store[channel_name].latest()
+
+    def window(self, channel_name, n=None):
+        """
+        The last `n` values of a channel (all buffered values by default),
+        oldest first, as a single array.
+        """
+        return self.store[channel_name].window(n)
+
+    def count(self, channel_name):
+        """
+        Total number of values received on a channel.
+        """
+        return self.store[channel_name].count
+
+    async def updates(self, channels=None):
+        """
+        Yield (channel, values) with the values received on each channel since
+        the previous iteration, as a single array. Values that were overwritten
+        in the buffer before the iterator caught up are skipped.
+        """
+        names = self.subscribed if channels is None else list(channels)
+        seen = {name: self.store[name].count for name in names}
+        while True:
+            changed = False
+            for name in names:
+                buffer = self.store[name]
+                new = buffer.count - seen[name]
+                if new < 0:  # The buffer was replaced, e.g. after a reconnect
+                    new = buffer.count
+                seen[name] = buffer.count
+                if new:
+                    changed = True
+                    yield name, buffer.window(new)
+            if not changed:
+                async with self.updated:
+                    await self.updated.wait()
+
+
+class WebSocketChannelSubscriber(AbstractChannelSubscriber):
+    """Subscribe to channels through the broker's /consumer endpoint."""
+
+    def __init__(
+        self,
+        interface_file: str,
+        ws_url="ws://localhost:8080",
+        channels=None,
+        encoding="binary",
+        retry_interval=1,
+        tracker=None,
+    ):
+        """
+        :param channels: Channel names to subscribe to, or None for every channel.
+        :param encoding: Encoding requested from the broker, "json" or "binary".
+        :param retry_interval: Seconds to wait between reconnect attempts.
+        :param tracker: Optional LatencyTracker for traced channels.
+        """
+        super().__init__(interface_file, channels, tracker)
+        query = {"encoding": encoding}
+        if channels is not None:
+            query["channels"] = ",".join(channels)
+        self.ws_url = f"{ws_url}/consumer?{urlencode(query)}"
+        self.retry_interval = retry_interval
+
+    async def receive_loop(self):
+        """
+        Receive frames, reconnecting whenever the connection drops. The broker
+        sends the buffered history again on every connection, so the buffers
+        are cleared first.
+        """
+        while True:
+            try:
+                async with websockets.connect(self.ws_url, max_size=None) as ws:
+                    print(f"Connected to WebSocket server at {self.ws_url}")
+                    # Compressed frames depend on earlier ones, so start afresh
+                    codec = BinaryCodec("subscriber", self.channels)
+                    self.store = ChannelStore(self.channels, typed_arrays=True)
+                    async for frame in ws:
+                        try:
+                            records = self.decode_frame(codec, frame)
+                        except DECODE_ERRORS as e:
+                            print(f"Dropped invalid frame: {e}")
+                            continue
+                        await self.store_records(records)
+            except (ConnectionClosed, OSError) as e:
+                print(f"WebSocket disconnected ({e}). Retrying...")
+            await asyncio.sleep(self.retry_interval)
+
+
+class RedisChannelSubscriber(AbstractChannelSubscriber):
+    """Subscribe to channels published by RedisChannelPublisher."""
+
+    def __init__(
+        self,
+        interface_file: str,
+        redis_host="localhost",
+        redis_port=6379,
+        channels=None,
+        encoding="json",
+        streams=False,
+        batch_size=1000,
+        tracker=None,
+    ):
+        """
+        :param channels: Channel names to subscribe to, or None for every channel.
+        :param encoding: Encoding used by the publisher, "json" or "binary".
+        :param streams: Read the Redis Stream of each channel (XREAD) instead of
+            subscribing; matches a publisher created with `streams=True`.
+        :param batch_size: Maximum number of messages decoded and stored together.
+        :param tracker: Optional LatencyTracker for traced channels. Only binary
+            payloads carry traces.
+        """
+        super().__init__(interface_file, channels, tracker)
+        self.pool = aioredis.ConnectionPool(host=redis_host, port=redis_port)
+        self.redis = aioredis.Redis(connection_pool=self.pool)
+        self.codec = BinaryCodec("subscriber", self.channels)
+        self.encoding = encoding
+        self.streams = streams
+        self.batch_size = batch_size
+
+    def decode(self, channel_name, payload):
+        """
+        Decode one Redis payload into records; invalid payloads are dropped.
+        """
+        try:
+            if self.encoding == "binary":
+                return self.decode_frame(self.codec, payload)
+            return [(channel_name, self.codec.decode_value(channel_name, payload))]
+        except DECODE_ERRORS as e:
+            print(f"Dropped invalid message on '{channel_name}': {e}")
+            return []
+
+    async def receive_loop(self):
+        if self.streams:
+            await self.read_streams()
+        else:
+            await self.read_pubsub()
+
+    async def read_pubsub(self):
+        """
+        Wait for a message, then take every message already received, up to
+        `batch_size`, and store them together.
+        """
+        async with self.redis.pubsub(ignore_subscribe_messages=True) as pubsub:
+            await pubsub.subscribe(*self.subscribed)
+            while True:
+                message = await pubsub.get_message(timeout=None)
+                records = []
+                while message is not None:
+                    channel_name = message["channel"].decode()
+                    records.extend(self.decode(channel_name, message["data"]))
+                    if len(records) >= self.batch_size:
+                        break
+                    message = await pubsub.get_message(timeout=0)
+                await self.store_records(records)
+
+    async def read_streams(self):
+        """
+        Read the entries of every subscribed channel's stream, starting with
+        those it still holds, `batch_size` at a time.
+        """
+        last_ids = {name: "0-0" for name in self.subscribed}
+        while True:
+            response = await self.redis.xread(
+                last_ids, count=self.batch_size, block=1000
+            )
+            records = []
+            for stream, entries in response:
+                channel_name = stream.decode()
+                for _, fields in entries:
+                    records.extend(self.decode(channel_name, fields[b"value"]))
+                last_ids[channel_name] = entries[-1][0]
+            await self.store_records(records)
+
+    async def close(self):
+        await super().close()
+        await self.pool.disconnect()
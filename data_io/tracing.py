@@ -0,0 +1,205 @@
+"""Consumer-side latency, gap and reordering statistics for traced channels."""
+
+import argparse
+import asyncio
+import time
+from collections import Counter, defaultdict
+from urllib.parse import urlencode
+
+import websockets
+
+from data_io.codec import BinaryCodec
+from data_io.metrics import Histogram
+from data_io.parse import parse_interface_file
+
+# Sequence numbers remembered per gap; records later than this are duplicates
+REORDER_WINDOW = 1024
+
+
+class LatencyTracker:
+    """
+    Collect the traces of received records (see data_io.codec.Trace).
+
+    Per channel: end-to-end latency from the producer's send time, and gaps and
+    reordering in the sequence numbers. Per hop: the time between consecutive
+    stamps, e.g. "producer>broker" and "broker>consumer", which shows where
+    latency is added. Hops on other machines are only comparable if their
+    clocks are synchronized.
+    """
+
+    def __init__(self):
+        self.latency = defaultdict(Histogram)  # channel -> seconds since sent
+        self.hops = defaultdict(Histogram)  # "from>to" -> seconds between stamps
+        self.counters = defaultdict(Counter)  # counter -> channel -> count
+        self.last_seq = {}
+        self.gaps = defaultdict(set)  # channel -> recent missing sequence numbers
+
+    def observe(self, channel_name, trace, received=None):
+        """
+        Account for one received record. Records without a trace are ignored.
+        """
+        if trace is None:
+            return
+        received = time.time() if received is None else received
+        self.counters["received"][channel_name] += 1
+        if trace.seq is not None:
+            self.check_sequence(channel_name, trace.seq)
+
+        stamps = sorted(trace.hops.items(), key=lambda hop: hop[1])
+        if trace.sent is not None:
+            self.latency[channel_name].observe(received - trace.sent)
+            stamps.insert(0, ("producer", trace.sent))
+        stamps.append(("consumer", received))
+        for (start, started), (end, ended) in zip(stamps, stamps[1:]):
+            self.hops[f"{start}>{end}"].observe(ended - started)
+
+    def observe_records(self, records, received=None):
+        """
+        Account for the (channel, value, trace) records of one frame.
+        """
+        received = time.time() if received is None else received
+        for channel_name, _, trace in records:
+            self.observe(channel_name, trace, received)
+
+    def check_sequence(self, channel_name, seq):
+        """
+        Count records skipped, received out of order or received twice. A
+        record that fills a gap seen within the last `REORDER_WINDOW` sequence
+        numbers is reordered, and no longer counted as missing.
+        """
+        last = self.last_seq.get(channel_name)
+        counters = self.counters
+        if last is None or seq == last + 1:
+            self.last_seq[channel_name] = seq
+        elif seq > last + 1:
+            counters["missing"][channel_name] += seq - last - 1
+            oldest = seq - REORDER_WINDOW
+            gaps = self.gaps[channel_name]
+            gaps.update(range(max(last + 1, oldest), seq))
+            if len(gaps) > REORDER_WINDOW:
+                self.gaps[channel_name] = {n for n in gaps if n >= oldest}
+            self.last_seq[channel_name] = seq
+        elif seq == 0:
+            # The producer restarted and numbers its records from 0 again
+            counters["restarts"][channel_name] += 1
+            self.gaps.pop(channel_name, None)
+            self.last_seq[channel_name] = seq
+        elif seq in self.gaps[channel_name]:
+            self.gaps[channel_name].discard(seq)
+            counters["reordered"][channel_name] += 1
+            counters["missing"][channel_name] -= 1
+        else:
+            counters["duplicates"][channel_name] += 1
+
+    def report(self):
+        """
+        Current statistics as plain Python objects. Latency quantiles are the
+        upper bounds of histogram buckets.
+        """
+        channels = {}
+        for channel_name in self.counters["received"]:
+            histogram = self.latency.get(channel_name)
+            channels[channel_name] = {
+                counter: self.counters[counter][channel_name]
+                for counter in (
+                    "received",
+                    "missing",
+                    "reordered",
+                    "duplicates",
+                    "restarts",
+                )
+            }
+            if histogram is not None:
+                channels[channel_name].update(quantiles(histogram))
+        return {
+            "channels": channels,
+            "hops": {hop: quantiles(histogram) for hop, histogram in self.hops.items()},
+        }
+
+    def format_report(self):
+        report = self.report()
+        lines = [
+            f"{'channel':<20}{'received':>10}{'missing':>9}{'reordered':>11}"
+            f"{'duplicates':>12}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+        ]
+        for channel_name, stats in report["channels"].items():
+            lines.append(
+                f"{channel_name:<20}{stats['received']:>10}{stats['missing']:>9}"
+                f"{stats['reordered']:>11}{stats['duplicates']:>12}"
+                f"{format_ms(stats.get('p50')):>9}"
+                f"{format_ms(stats.get('p95')):>9}{format_ms(stats.get('p99')):>9}"
+            )
+        for hop, stats in report["hops"].items():
+            lines.append(
+                f"{hop:<40}{format_ms(stats['p50']):>31}"
+                f"{format_ms(stats['p95']):>9}{format_ms(stats['p99']):>9}"
+            )
+        return "\n".join(lines)
+
+
+def quantiles(histogram):
+    return {
+        "count": histogram.count,
+        "p50": histogram.quantile(0.5),
+        "p95": histogram.quantile(0.95),
+        "p99": histogram.quantile(0.99),
+    }
+
+
+def format_ms(seconds):
+    return "-" if seconds is None else f"{seconds * 1000:.2f}"
+
+
+async def trace_broker(
+    tracker, interface_file, ws_url, channels=None, interval=5.0, retry_interval=1
+):
+    """
+    Track the live traffic of a broker's /consumer endpoint, printing the
+    report every `interval` seconds, until cancelled.
+    """
+    data_channels = parse_interface_file(interface_file)["data_channels"]
+    query = {"encoding": "binary", "history": "0"}
+    if channels:
+        query["channels"] = ",".join(channels)
+    url = f"{ws_url}/consumer?{urlencode(query)}"
+    reported = time.monotonic()
+    while True:
+        try:
+            async with websockets.connect(url, max_size=None) as ws:
+                print(f"Tracing {url}")
+                codec = BinaryCodec("tracer", data_channels)
+                async for frame in ws:
+                    tracker.observe_records(codec.decode_traced(frame))
+                    if time.monotonic() - reported >= interval:
+                        print(tracker.format_report())
+                        reported = time.monotonic()
+        except (websockets.exceptions.ConnectionClosed, OSError) as e:
+            print(f"WebSocket disconnected ({e}). Retrying...")
+        await asyncio.sleep(retry_interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Report latency, gaps and reordering of traced channels"
+    )
+    parser.add_argument(
+        "-i", "--interface-file", required=True, help="Interface (MDX) file"
+    )
+    parser.add_argument(
+        "--ws-url", default="ws://localhost:8080", help="Broker WebSocket URL"
+    )
+    parser.add_argument("-c", "--channels", nargs="+", help="Channels to track")
+    parser.add_argument(
+        "--interval", type=float, default=5.0, help="Seconds between reports"
+    )
+    args = parser.parse_args()
+
+    tracker = LatencyTracker()
+    try:
+        asyncio.run(
+            trace_broker(
+                tracker, args.interface_file, args.ws_url, args.channels, args.interval
+            )
+        )
+    except KeyboardInterrupt:
+        print(tracker.format_report())
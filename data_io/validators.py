@@ -0,0 +1,144 @@
+"""Per-channel value validators compiled from the interface file channel specs."""
+
+import numpy as np
+
+from data_io.codec import resolve_dtype
+
+NUMERIC_KINDS = "biuf"
+
+
+def scalar_cast(dtype_name):
+    """
+    Python type used to coerce a scalar of a front matter dtype.
+    """
+    dtype = np.dtype(resolve_dtype(dtype_name))
+    return float if dtype.kind == "f" else int
+
+
+def compile_time_series(name, config):
+    cast = scalar_cast(config.get("dtype"))
+
+    def validate_time_series(value):
+        try:
+            return cast(value)
+        except (TypeError, ValueError) as e:
+            raise ValueError(
+                f"Channel '{name}' expects a number, got {value!r}."
+            ) from e
+
+    return validate_time_series
+
+
+def compile_struct(name, config):
+    fields = list(config.get("fields", {}))
+    casts = [scalar_cast(dtype) for dtype in config.get("fields", {}).values()]
+
+    def validate_record(value):
+        try:
+            if isinstance(value, dict):
+                items = tuple(value[field] for field in fields)
+            elif len(value) == len(fields):
+                items = value
+            else:
+                raise ValueError(f"expected {len(fields)} fields")
+            return {
+                field: cast(item) for field, cast, item in zip(fields, casts, items)
+            }
+        except (TypeError, ValueError, KeyError) as e:
+            raise ValueError(
+                f"Channel '{name}' expects records with fields {fields}, "
+                f"got {value!r} ({e})."
+            ) from e
+
+    def validate_struct(value):
+        # A list of records (e.g. every current earthquake) or a single record
+        if isinstance(value, list) and (
+            not value or isinstance(value[0], (dict, list, tuple))
+        ):
+            return [validate_record(record) for record in value]
+        return validate_record(value)
+
+    return validate_struct
+
+
+def compile_array(name, config):
+    dtype = resolve_dtype(config.get("dtype"))
+
+    def check(value):
+        array = value if isinstance(value, np.ndarray) else np.asarray(value, dtype)
+        if array.dtype.kind not in NUMERIC_KINDS:
+            raise ValueError(
+                f"Channel '{name}' expects a numeric array, got dtype {array.dtype}."
+            )
+        return array
+
+    def validate_array(value):
+        try:
+            # Arrays may also be published as a mapping of named arrays
+            if isinstance(value, dict):
+                return {key: check(item) for key, item in value.items()}
+            return check(value)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Channel '{name}' expects a numeric array ({e}).") from e
+
+    return validate_array
+
+
+def compile_image(name, config):
+    height, width = config.get("height"), config.get("width")
+    channels = config.get("channels", 1)
+    shape = (height, width) if channels == 1 else (height, width, channels)
+    shapes = [shape, (height, width, 1)] if channels == 1 else [shape]
+
+    def matches(actual):
+        return any(
+            len(actual) == len(expected)
+            and all(e is None or a == e for a, e in zip(actual, expected))
+            for expected in shapes
+        )
+
+    def validate_image(value):
+        array = np.asarray(value)
+        if not matches(array.shape):
+            raise ValueError(
+                f"Channel '{name}' expects an image of shape {shape}, "
+                f"got {array.shape}."
+            )
+        if array.dtype.kind not in NUMERIC_KINDS:
+            raise ValueError(
+                f"Channel '{name}' expects numeric pixels, got dtype {array.dtype}."
+            )
+        return array
+
+    return validate_image
+
+
+COMPILERS = {
+    "time_series": compile_time_series,
+    "struct": compile_struct,
+    "array": compile_array,
+    "image": compile_image,
+}
+
+
+def compile_validator(name, config):
+    """
+    Build the validator for one channel: a callable that returns the coerced
+    value or raises ValueError. Returns None for channels without a known type.
+    """
+    compiler = COMPILERS.get(config.get("type"))
+    if compiler is None:
+        return None
+    try:
+        return compiler(name, config)
+    except ValueError as e:
+        raise ValueError(f"Data channel '{name}': {e}") from e
+
+
+def compile_validators(data_channels):
+    """
+    Build the validators for every channel.
+    """
+    return {
+        name: compile_validator(name, config) for name, config in data_channels.items()
+    }
@@ -1,17 +1,35 @@
-from websocket import create_connection
+import threading
+import time
+
+from websocket import WebSocketException, create_connection
 from data_io.abstract_channel import AbstractChannelPublisher
+from data_io.batching import BackgroundFlusher
 
 
 class WebSocketChannelPublisher(AbstractChannelPublisher):
     """Simple class to publish messages to data channels via WebSocket."""
 
     def __init__(
-        self, source_name: str, interface_file: str, ws_url="ws://localhost:8080"
+        self,
+        source_name: str,
+        interface_file: str,
+        ws_url="ws://localhost:8080",
+        batch_size=None,
+        max_latency=0.01,
+        max_queue=100000,
+        coalesce=(),
+        encoding="json",
     ):
         """
         Parse the interface file and initialize WebSocket connection.
+        :param batch_size: Enable batching; flush once this many records are queued.
+        :param max_latency: Maximum seconds a record may wait before being flushed.
+        :param max_queue: Maximum number of queued records before publish fails.
+        :param coalesce: Channels for which only the newest queued value is sent.
+        :param encoding: Wire encoding for messages, "json" or "binary".
         """
-        super().__init__(source_name, interface_file)
+        super().__init__(source_name, interface_file, encoding)
+        self.lock = threading.Lock()  # Rate-limited values are released by timers
         self.ws_url = f"{ws_url}/producer"
         self.ws = None
 
@@ -21,28 +39,159 @@ class WebSocketChannelPublisher(AbstractChannelPublisher):
         except Exception as e:
             raise ConnectionError(f"Failed to connect to WebSocket server: {e}") from e
 
+        # Subscription updates from the broker or proxy
+        self.receiver = threading.Thread(target=self.receive_loop, daemon=True)
+        self.receiver.start()
+
+        self.flusher = None
+        if batch_size:
+            self.flusher = BackgroundFlusher(
+                self.send_records, batch_size, max_latency, max_queue, coalesce
+            )
+
+    @property
+    def queue_depth(self):
+        return len(self.flusher) if self.flusher is not None else 0
+
+    @property
+    def queue_dropped(self):
+        return self.flusher.queue.dropped if self.flusher is not None else 0
+
+    def receive_loop(self):
+        """
+        Apply subscription updates until the connection closes.
+        """
+        try:
+            while True:
+                message = self.ws.recv()
+                if not message:
+                    break
+                if isinstance(message, str):
+                    self.handle_control(message)
+        except (WebSocketException, OSError):
+            pass
+
+    def wait_for_subscribers_blocking(self, channel_name, timeout=None):
+        """
+        Block until a consumer subscribes to a channel. Returns False if
+        `timeout` seconds passed first.
+        """
+        event = threading.Event()
+
+        def listener(channels):
+            event.set()
+
+        self.subscription_listeners.append(listener)
+        try:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while not self.is_subscribed(channel_name):
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                event.wait(remaining)
+                event.clear()
+            return True
+        finally:
+            self.subscription_listeners.remove(listener)
+
     def publish(self, channel_name, value):
         """
-        Publish a value to a WebSocket channel.
+        Publish a value to a WebSocket channel. Values for channels nobody
+        watches are discarded.
         """
-        if channel_name not in self.channels:
-            raise ValueError(
-                f"Channel '{channel_name}' is not defined in the interface file."
-            )
+        if channel_name in self.idle:
+            return
+        value = self.prepare(channel_name, value)
+        with self.lock:
+            for value in self.reduce(channel_name, value):
+                self.send_value(channel_name, value)
+
+    def publish_many(self, channel_name, values, timestamps=None):
+        """
+        Publish a block of values of a time series or struct channel as a
+        single columnar record. See `make_block` for the accepted values;
+        `timestamps` are optional seconds since the epoch, one per value.
+        """
+        if channel_name in self.idle:
+            return
+        block = self.make_block(channel_name, values, timestamps)
+        with self.lock:
+            for block in self.reduce_block(channel_name, block):
+                self.send_value(channel_name, block)
+
+    def release(self, channel_name):
+        with self.lock:
+            super().release(channel_name)
 
+    def release_decimated(self, channel_name):
+        with self.lock:
+            super().release_decimated(channel_name)
+
+    def send_released(self, channel_name, value):
         try:
-            self.ws.send(self.format(channel_name, value))
+            self.send_value(channel_name, value)
+        except Exception as e:
+            if self.metrics is not None:
+                self.metrics.inc("dropped", channel_name)
+            print(f"Failed to publish rate-limited value: {e}")
+
+    def send_value(self, channel_name, value):
+        if self.flusher is not None:
+            self.flusher.put(channel_name, value)
+            return
+
+        try:
+            self.send_frame(self.format(channel_name, value))
             # print(f"Published: [{channel_name}] {value}")
         except Exception as e:
             raise RuntimeError(f"Failed to publish message: {e}") from e
 
+    def send_records(self, records):
+        """
+        Send records as a single frame.
+        """
+        if len(records) == 1:
+            self.send_frame(self.format(*records[0]))
+        elif records:
+            self.send_frame(self.format_batch(records))
+
+    def send_frame(self, frame):
+        """
+        Send an encoded frame, as a binary message if the codec produced bytes.
+        """
+        start = time.perf_counter()
+        if isinstance(frame, bytes):
+            self.ws.send_binary(frame)
+        else:
+            self.ws.send(frame)
+        if self.metrics is not None:
+            self.metrics.observe("send_seconds", time.perf_counter() - start)
+
+    def flush(self):
+        """
+        Send every queued record immediately.
+        """
+        if self.flusher is not None:
+            self.flusher.flush()
+
     def close(self):
         """
         Close the WebSocket connection.
         """
+        with self.lock:
+            for channel_name, value in self.drain_held():
+                self.send_value(channel_name, value)
+        if self.flusher is not None:
+            self.flusher.close()
+
         if self.ws:
             try:
-                self.ws.close()
+                # The receiver thread reads the server's reply to the close frame
+                self.ws.send_close()
+                self.receiver.join(3)
+                self.ws.shutdown()
                 print("WebSocket connection closed.")
             except Exception as e:
                 raise RuntimeError(f"Failed to close WebSocket connection: {e}") from e
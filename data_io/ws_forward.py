@@ -1,20 +1,100 @@
 import argparse
 import asyncio
+import json
+import os
+import time
+
 import websockets
 from websockets.exceptions import ConnectionClosed
 
+from data_io.batching import AsyncOutbox, BackpressureError
+from data_io.metrics import Metrics, serve_prometheus
+
+
+def is_record(line):
+    """
+    Whether a line is a single JSON channel message that can join a batch.
+    """
+    try:
+        message = json.loads(line)
+    except ValueError:
+        return False
+    return isinstance(message, dict) and "batch" not in message
+
+
+class DatagramLineProtocol(asyncio.DatagramProtocol):
+    """Feed the lines of each received datagram into a MultiPortProxy."""
+
+    def __init__(self, proxy, label):
+        self.proxy = proxy
+        self.label = label
+
+    def datagram_received(self, data, addr):
+        lines = self.proxy.decode_lines(self.label, data)
+        if lines:
+            self.proxy.enqueue_lines(self.label, lines, addr)
+
 
 class MultiPortProxy:
-    def __init__(self, ws_host, ws_port, listen_ports, verbose=False, retry_interval=1):
+    def __init__(
+        self,
+        ws_host,
+        ws_port,
+        listen_ports,
+        udp_ports=(),
+        unix_paths=(),
+        verbose=False,
+        retry_interval=1,
+        batch_size=None,
+        max_latency=0.005,
+        max_buffer=100000,
+        chunk_size=65536,
+        stats_interval=0,
+        metrics_port=None,
+        trace=False,
+    ):
         """
         Initialize the proxy with WebSocket host, port, and ports to listen on.
+        :param listen_ports: TCP ports to listen on.
+        :param udp_ports: UDP ports to listen on; each datagram holds one or more lines.
+        :param unix_paths: Unix domain socket paths to listen on.
+        :param batch_size: Enable high-throughput mode: read in chunks and forward
+            up to this many lines per frame. JSON channel messages are forwarded
+            as a {"batch": [...]} message; other lines are sent on their own.
+        :param max_latency: Seconds to wait for a partial batch to fill.
+        :param max_buffer: Maximum number of lines buffered while the WebSocket is
+            slow or disconnected. Lines received while it is full are dropped.
+        :param chunk_size: Bytes read per call in high-throughput mode.
+        :param stats_interval: Seconds between printed per-port counters (0 disables).
+        :param metrics_port: Serve Prometheus metrics on this port.
+        :param trace: Stamp a "proxy" hop time on every frame, for latency
+            tracing (see data_io.tracing). Only JSON channel messages are stamped.
         """
-        self.ws_url = f"ws://{ws_host}:{ws_port}"
+        self.ws_url = f"ws://{ws_host}:{ws_port}/producer"
         self.ports = listen_ports
+        self.udp_ports = udp_ports
+        self.unix_paths = unix_paths
         self.web_socket = None
         self.verbose = verbose
         self.retry_interval = retry_interval
         self.reconnecting = False
+        self.connected = asyncio.Event()
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.stats_interval = stats_interval
+        self.outbox = AsyncOutbox(
+            max_buffer, (), batch_size or 1, max_latency if batch_size else 0
+        )
+        self.metrics_port = metrics_port
+        self.trace = trace
+        self.metrics = Metrics(label="port")
+        self.metrics.gauge("queue_depth", lambda: len(self.outbox))
+        self.labels = [
+            *listen_ports,
+            *(f"udp:{port}" for port in udp_ports),
+            *(f"unix:{path}" for path in unix_paths),
+        ]
+        self.connected_once = False
 
     async def start(self):
         """
@@ -22,18 +102,28 @@ class MultiPortProxy:
         """
         # Start listeners for each port
         listener_tasks = [self.listen_on_port(port) for port in self.ports]
+        listener_tasks += [self.listen_on_udp_port(port) for port in self.udp_ports]
+        listener_tasks += [self.listen_on_unix_socket(path) for path in self.unix_paths]
 
         # Retry WebSocket connection periodically
         retry_task = asyncio.create_task(self.retry_connection())
+        forward_task = asyncio.create_task(self.forward_loop())
+        tasks = [*listener_tasks, retry_task, forward_task]
+        if self.stats_interval:
+            tasks.append(asyncio.create_task(self.report_stats_loop()))
+        if self.metrics_port:
+            tasks.append(
+                asyncio.create_task(serve_prometheus(self.metrics, self.metrics_port))
+            )
 
-        await asyncio.gather(*listener_tasks, retry_task)
+        await asyncio.gather(*tasks)
 
     async def retry_connection(self):
         """
         Periodically attempt to connect to the WebSocket server if disconnected.
         """
         while True:
-            if self.web_socket is None or self.web_socket.closed:
+            if self.web_socket is None:
                 if not self.reconnecting:
                     self.reconnecting = True
                     if self.verbose:
@@ -41,13 +131,35 @@ class MultiPortProxy:
                 try:
                     self.web_socket = await websockets.connect(self.ws_url)
                     self.reconnecting = False
+                    if self.connected_once:
+                        self.metrics.inc("reconnects")
+                    self.connected_once = True
+                    self.connected.set()
                     if self.verbose:
                         print(f"Reconnected to WebSocket server at {self.ws_url}")
                 except Exception:
                     await asyncio.sleep(self.retry_interval)
             else:
+                await self.drain_control()
+                self.disconnected()
                 await asyncio.sleep(self.retry_interval)
 
+    async def drain_control(self):
+        """
+        Read and ignore the messages the server sends until the connection
+        closes. Subscription updates are meant for publishers, but unread
+        messages would stall the connection and its keepalive pings.
+        """
+        try:
+            async for _ in self.web_socket:
+                pass
+        except ConnectionClosed:
+            pass
+
+    def disconnected(self):
+        self.web_socket = None
+        self.connected.clear()
+
     async def listen_on_port(self, port):
         """
         Listen for incoming TCP connections on a specific port.
@@ -59,43 +171,82 @@ class MultiPortProxy:
         async with server:
             await server.serve_forever()
 
+    async def listen_on_udp_port(self, port):
+        """
+        Listen for UDP datagrams on a specific port.
+        """
+        loop = asyncio.get_running_loop()
+        transport, _ = await loop.create_datagram_endpoint(
+            lambda: DatagramLineProtocol(self, f"udp:{port}"),
+            local_addr=("0.0.0.0", port),
+        )
+        print(f"Listening on UDP port {port}")
+        try:
+            await asyncio.Future()
+        finally:
+            transport.close()
+
+    async def listen_on_unix_socket(self, path):
+        """
+        Listen for stream connections on a Unix domain socket.
+        """
+        if os.path.exists(path):
+            os.unlink(path)  # Remove a stale socket from a previous run
+        server = await asyncio.start_unix_server(
+            lambda r, w: self.handle_connection(r, w, f"unix:{path}"), path
+        )
+        print(f"Listening on Unix socket {path}")
+        async with server:
+            await server.serve_forever()
+
+    def decode_lines(self, port, data):
+        """
+        Split received bytes into stripped, non-empty lines. Lines that are not
+        valid UTF-8 are counted as invalid and skipped.
+        """
+        lines = []
+        for line in data.split(b"\n"):
+            try:
+                line = line.decode().strip()
+            except UnicodeDecodeError:
+                self.metrics.inc("invalid", port)
+                continue
+            if line:
+                lines.append(line)
+        return lines
+
+    async def iter_lines(self, reader: asyncio.StreamReader, port):
+        """
+        Yield lists of received lines until the connection closes.
+        High-throughput mode reads large chunks and splits them in bulk.
+        """
+        if not self.batch_size:
+            while data := await reader.readline():
+                if lines := self.decode_lines(port, data):
+                    yield lines
+            return
+
+        partial = b""
+        while data := await reader.read(self.chunk_size):
+            complete, _, partial = (partial + data).rpartition(b"\n")
+            if lines := self.decode_lines(port, complete):
+                yield lines
+        if lines := self.decode_lines(port, partial):
+            yield lines
+
     async def handle_connection(
         self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, port: int
     ):
         """
-        Handle a single client connection, proxying data to the WebSocket.
+        Handle a single client connection, queueing its lines for the WebSocket.
         """
         peer_name = writer.get_extra_info("peername")
         if self.verbose:
             print(f"[Port {port}] New connection from {peer_name}")
 
         try:
-            while True:
-                print("listen again...")
-                data = await reader.readline()
-                print("data: ", data)
-                if not data:
-                    if self.verbose:
-                        print(f"[Port {port}] Connection from {peer_name} closed")
-                    break  # Connection closed
-                message = data.decode().strip()
-
-                if self.verbose:
-                    print(f"[Port {port}] Received: {message} from {peer_name}")
-
-                # Forward data to the WebSocket
-                if self.web_socket and not self.web_socket.closed:
-                    try:
-                        await self.web_socket.send(message)
-                        if self.verbose:
-                            print(f"[Port {port}] Forwarded to WebSocket: {message}")
-                    except ConnectionClosed:
-                        if self.verbose:
-                            print(
-                                f"[Port {port}] WebSocket disconnected. Message not sent."
-                            )
-                elif self.verbose:
-                    print(f"[Port {port}] WebSocket unavailable. Message not sent.")
+            async for lines in self.iter_lines(reader, port):
+                self.enqueue_lines(port, lines, peer_name)
         except Exception as e:
             print(f"[Port {port}] Error handling connection from {peer_name}: {e}")
         finally:
@@ -104,6 +255,83 @@ class MultiPortProxy:
             writer.close()
             await writer.wait_closed()
 
+    def enqueue_lines(self, port, lines, peer_name):
+        """
+        Queue received lines for the WebSocket, counting any that do not fit.
+        """
+        counters = self.metrics.counters
+        counters["received"][port] += len(lines)
+        if self.verbose:
+            print(f"[Port {port}] Received {len(lines)} lines from {peer_name}")
+
+        for line in lines:
+            try:
+                self.outbox.put_nowait(port, line)
+            except BackpressureError:
+                counters["dropped"][port] += 1
+
+    async def forward_loop(self):
+        """
+        Forward buffered lines to the WebSocket, holding them across reconnects.
+        """
+        while records := await self.outbox.get_batch():
+            for frame in self.frames([line for _, line in records]):
+                while True:
+                    await self.connected.wait()
+                    start = time.perf_counter()
+                    try:
+                        await self.web_socket.send(frame)
+                        self.metrics.observe(
+                            "send_seconds", time.perf_counter() - start
+                        )
+                        break
+                    except ConnectionClosed:
+                        self.disconnected()
+
+            self.metrics.counters["forwarded"].update(port for port, _ in records)
+            if self.verbose:
+                print(f"Forwarded {len(records)} lines to WebSocket")
+
+    def frames(self, lines):
+        """
+        Frames to send for a batch of lines. Channel messages are joined into a
+        single {"batch": [...]} message; other lines, such as invalid JSON or
+        messages that already are batches, are sent on their own so they
+        cannot invalidate the rest.
+        """
+        if len(lines) == 1 and not self.trace:
+            return lines
+        records, others = [], []
+        for line in lines:
+            (records if is_record(line) else others).append(line)
+        if not records:
+            return others
+
+        joined = ", ".join(records)
+        if self.trace:
+            hops = json.dumps({"proxy": time.time()})
+            frame = f'{{"hops": {hops}, "batch": [{joined}]}}'
+        elif len(records) == 1:
+            frame = records[0]
+        else:
+            frame = f'{{"batch": [{joined}]}}'
+        return [frame, *others]
+
+    def report_stats(self):
+        counters = self.metrics.counters
+        for port in self.labels:
+            print(
+                f"[Port {port}] received={counters['received'][port]} "
+                f"forwarded={counters['forwarded'][port]} "
+                f"dropped={counters['dropped'][port]} "
+                f"invalid={counters['invalid'][port]}"
+            )
+
+    async def report_stats_loop(self):
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            self.report_stats()
+
     async def close(self):
         """
         Close the WebSocket connection.
@@ -111,6 +339,7 @@ class MultiPortProxy:
         if self.web_socket:
             await self.web_socket.close()
             print("WebSocket connection closed.")
+        self.report_stats()
 
 
 if __name__ == "__main__":
@@ -123,19 +352,73 @@ if __name__ == "__main__":
         "-o", "--output-port", required=True, type=int, help="WebSocket server port"
     )
     parser.add_argument(
-        "-p", "--ports", required=True, nargs="+", type=int, help="Ports to listen on"
+        "-p", "--ports", nargs="+", type=int, default=[], help="TCP ports to listen on"
+    )
+    parser.add_argument(
+        "-u",
+        "--udp-ports",
+        nargs="+",
+        type=int,
+        default=[],
+        help="UDP ports to listen on",
+    )
+    parser.add_argument(
+        "-s",
+        "--unix-sockets",
+        nargs="+",
+        default=[],
+        help="Unix domain socket paths to listen on",
+    )
+    parser.add_argument(
+        "-b",
+        "--batch-size",
+        type=int,
+        help="High-throughput mode: forward up to this many JSON lines per frame",
+    )
+    parser.add_argument(
+        "--max-buffer",
+        type=int,
+        default=100000,
+        help="Maximum lines buffered while the WebSocket is unavailable",
+    )
+    parser.add_argument(
+        "--stats-interval",
+        type=float,
+        default=0,
+        help="Print per-port counters every N seconds (default: off)",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="Serve Prometheus metrics at http://0.0.0.0:PORT/metrics",
+    )
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help="Stamp a proxy hop time on every frame for latency tracing",
     )
     parser.add_argument(
         "-v", "--verbose", action="store_true", help="Enable verbose output"
     )
     args = parser.parse_args()
+    if not (args.ports or args.udp_ports or args.unix_sockets):
+        parser.error(
+            "at least one of --ports, --udp-ports or --unix-sockets is required"
+        )
 
     # Initialize and start the proxy
     proxy = MultiPortProxy(
         ws_host=args.host,
         ws_port=args.output_port,
         listen_ports=args.ports,
+        udp_ports=args.udp_ports,
+        unix_paths=args.unix_sockets,
         verbose=args.verbose,
+        batch_size=args.batch_size,
+        max_buffer=args.max_buffer,
+        stats_interval=args.stats_interval,
+        metrics_port=args.metrics_port,
+        trace=args.trace,
     )
 
     try:
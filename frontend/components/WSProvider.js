@@ -1,8 +1,9 @@
 import { createContext, useEffect, useRef, useState } from "react";
+import { buildStructLayouts, decodeFrame } from "../utils/binaryCodec";
 
 export const WsBufferContext = createContext();
 
-export const WsBufferProvider = ({ children }) => {
+export const WsBufferProvider = ({ children, channels = {} }) => {
   // React state holds a dictionary of channels -> array of data points
   const [bufferedData, setBufferedData] = useState({});
 
@@ -13,35 +14,65 @@ export const WsBufferProvider = ({ children }) => {
   // Example structure: innerBufferRef.current = { channelA: [point1, point2], channelB: [point3] }
   const innerBufferRef = useRef({});
 
+  // Channel names (in front matter order), struct layouts and the delta state
+  // of compressed channels for binary frames
+  const codecRef = useRef({ names: [], layouts: {}, deltas: {} });
+
+  // Binary frames are decoded asynchronously, but must be decoded in order
+  const decodingRef = useRef(Promise.resolve());
+
+  useEffect(() => {
+    codecRef.current = {
+      names: Object.keys(channels),
+      layouts: buildStructLayouts(channels),
+      deltas: {},
+    };
+  }, [channels]);
+
   useEffect(() => {
     // Connect to your wsproxy /consumer endpoint
     const socket = new WebSocket("ws://127.0.0.1:8080/consumer");
-    socket.binaryType = "blob"; // Ensure binary messages come in as Blobs
+    socket.binaryType = "arraybuffer"; // Binary frames come from the binary codec
 
     wsRef.current = socket;
     socket.onopen = () => {
       console.log("WebSocket connected to wsproxy /consumer");
     };
 
-    socket.onmessage = async (event) => {
-      try {
-        let rawMessage = event.data;
-
-        // If the message is a Blob, convert it to text
-        if (rawMessage instanceof Blob) {
-          rawMessage = await rawMessage.text();
-        }
-
-        // Parse the JSON: { source, channel, value }
-        const { channel, value } = JSON.parse(rawMessage);
-
+    const bufferRecords = (records) => {
+      for (const { channel, value, columns, timestamps } of records) {
         // If we haven't seen this channel in the buffer yet, create an empty array
         if (!innerBufferRef.current[channel]) {
           innerBufferRef.current[channel] = [];
         }
 
-        // Push the new data point onto the buffer array
-        innerBufferRef.current[channel].push(value);
+        // Push the new data point onto the buffer array. Blocks sent by
+        // publish_many stay whole until a component merges them.
+        innerBufferRef.current[channel].push(
+          columns !== undefined ? new ColumnBlock(columns, timestamps) : value
+        );
+      }
+    };
+
+    socket.onmessage = (event) => {
+      if (event.data instanceof ArrayBuffer) {
+        decodingRef.current = decodingRef.current
+          .then(() => {
+            const { names, layouts, deltas } = codecRef.current;
+            return decodeFrame(event.data, names, layouts, deltas);
+          })
+          .then(bufferRecords)
+          .catch((err) => {
+            console.error("Invalid binary WS message:", err);
+          });
+        return;
+      }
+
+      try {
+        // Parse the JSON: { source, channel, value }, { source, channel,
+        // columns, timestamps } or { source, batch: [...] }
+        const message = JSON.parse(event.data);
+        bufferRecords(message.batch || [message]);
       } catch (err) {
         console.error("Invalid WS message or parse error:", event.data, err);
       }
@@ -121,12 +152,66 @@ export const WsBufferProvider = ({ children }) => {
   );
 };
 
+// A block of time series values (one column) or struct records (one column
+// per field) sent as a single message by publish_many
+export class ColumnBlock {
+  constructor(columns, timestamps) {
+    this.columns = columns;
+    this.timestamps = timestamps;
+    // Time series columns are arrays; struct columns are { field: array }
+    const isSeries = Array.isArray(columns) || ArrayBuffer.isView(columns);
+    this.fields = isSeries ? null : Object.keys(columns);
+    const first = isSeries ? columns : columns[this.fields[0]];
+    this.length = first ? first.length : 0;
+  }
+
+  row(i) {
+    if (!this.fields) return this.columns[i];
+    const record = {};
+    for (const field of this.fields) {
+      record[field] = this.columns[field][i];
+    }
+    return record;
+  }
+
+  // Only the last `limit` values are built, since older ones would be dropped
+  rows(limit = this.length) {
+    const start = Math.max(this.length - limit, 0);
+    if (!this.fields) return Array.from(this.columns.slice(start));
+    const records = [];
+    for (let i = start; i < this.length; i++) {
+      records.push(this.row(i));
+    }
+    return records;
+  }
+}
+
+// Expand column blocks into individual values, keeping at most the last `width`
+const unpackValues = (values, width = Infinity) => {
+  const unpacked = [];
+  for (let i = values.length - 1; i >= 0 && unpacked.length < width; i--) {
+    const value = values[i];
+    if (value instanceof ColumnBlock) {
+      unpacked.push(...value.rows(width - unpacked.length).reverse());
+    } else {
+      unpacked.push(value);
+    }
+  }
+  return unpacked.reverse();
+};
+
 export const channelMerger = (oldValues, newValues, width, mapFn) => {
-  const mappedNewValues = mapFn ? newValues.map(mapFn) : newValues;
+  const unpacked = unpackValues(newValues, width);
+  const mappedNewValues = mapFn ? unpacked.map(mapFn) : unpacked;
   const merged = [...oldValues, ...mappedNewValues];
   return merged.slice(-1 * width);
 };
 
 export const channelSampler = (oldValue, newValues) => {
-  return newValues.length > 0 ? newValues[newValues.length - 1] : oldValue;
+  if (newValues.length === 0) return oldValue;
+  const newest = newValues[newValues.length - 1];
+  if (newest instanceof ColumnBlock) {
+    return newest.length > 0 ? newest.row(newest.length - 1) : oldValue;
+  }
+  return newest;
 };
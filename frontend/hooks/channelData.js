@@ -1,5 +1,9 @@
 import { useContext, useEffect, useState } from "react";
-import { WsBufferContext, channelMerger } from "../components/WSProvider";
+import {
+  WsBufferContext,
+  channelMerger,
+  channelSampler,
+} from "../components/WSProvider";
 
 /**
  * A custom hook that returns a "merged" array of the last `dataWidth` data points
@@ -48,8 +52,10 @@ export function useLatestChannelValue(
     // Each time data[channel] changes, we only want the very last item if it exists
     const newDataArray = data[channel] || [];
     if (newDataArray.length > 0) {
-      const newestItem = newDataArray[newDataArray.length - 1];
-      setLatestValue(transformFn(newestItem));
+      const newestItem = channelSampler(undefined, newDataArray);
+      if (newestItem !== undefined) {
+        setLatestValue(transformFn(newestItem));
+      }
     }
   }, [data[channel], transformFn]);
 
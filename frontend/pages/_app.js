@@ -5,7 +5,7 @@ import { Map, MultiMap } from "../components/dataViz/map";
 import { LineChart } from "../components/dataViz/lineChart";
 import { Spectrogram } from "../components/dataViz/spectrogram";
 import { MatrixImage } from "../components/dataViz/matrixImage";
-import { useEffect, useState, useMemo } from "react";
+import { useEffect, useState } from "react";
 
 // Custom components mapping for MDX
 const components = {
@@ -39,10 +39,8 @@ function MyApp({ Component, pageProps }) {
     fetchLayoutData();
   }, []);
 
-  const memoizedChannels = useMemo(() => Object.keys(channels), [channels]);
-
   return (
-    <WsBufferProvider channels={memoizedChannels}>
+    <WsBufferProvider channels={channels}>
       <MDXProvider components={components}>
         <Component {...pageProps} />
       </MDXProvider>
@@ -3,10 +3,19 @@ import path from "path";
 import matter from "gray-matter";
 import { compile } from "@mdx-js/mdx";
 
+// Last compiled layout, reused until the file's mtime changes
+let cachedLayout = { mtimeMs: null, body: null };
+
 export default async function handler(req, res) {
   const layoutFilePath = path.join(process.cwd(), "layout.mdx");
 
   try {
+    const { mtimeMs } = fs.statSync(layoutFilePath);
+    if (cachedLayout.mtimeMs === mtimeMs) {
+      res.status(200).json(cachedLayout.body);
+      return;
+    }
+
     // Read the MDX file
     const fileContent = fs.readFileSync(layoutFilePath, "utf-8");
     const { data: config, content: mdxContent } = matter(fileContent);
@@ -17,7 +26,8 @@ export default async function handler(req, res) {
     );
 
     const channels = config.channels;
-    res.status(200).json({ channels, compiledMdx });
+    cachedLayout = { mtimeMs, body: { channels, compiledMdx } };
+    res.status(200).json(cachedLayout.body);
   } catch (error) {
     res.status(500).json({ error: "Failed to parse layout file." });
   }
@@ -0,0 +1,318 @@
+// utils/binaryCodec.js
+// Decoder for the binary frames produced by data_io.codec.BinaryCodec.
+
+const MAGIC = 0xd1;
+const HEADER_SIZE = 4; // magic (u8), kind (u8), channel id (u16)
+
+const KIND_JSON = 0;
+const KIND_SCALAR = 1;
+const KIND_STRUCT = 2;
+const KIND_STRUCT_LIST = 3;
+const KIND_ARRAY = 4;
+const KIND_BATCH = 5;
+const KIND_PACKED = 6;
+const KIND_COLUMNS = 7;
+const KIND_TRACED = 8;
+const KIND_HOP = 9;
+
+// Column block flags
+const HAS_TIMESTAMPS = 1;
+
+// Payload compression flags of packed arrays (see data_io/compression.py)
+const FLAG_DELTA = 1;
+const FLAG_BITPACK = 2;
+const FLAG_RLE = 4;
+const FLAG_ZLIB = 8;
+
+// Index in this list is the dtype code sent on the wire.
+const ARRAY_TYPES = [
+  Uint8Array,
+  Int8Array,
+  Uint16Array,
+  Int16Array,
+  Uint32Array,
+  Int32Array,
+  Float32Array,
+  Float64Array,
+  BigInt64Array,
+];
+
+// Typed array for each column dtype of a column block
+const COLUMN_TYPES = {
+  uint8: Uint8Array,
+  int8: Int8Array,
+  uint16: Uint16Array,
+  int16: Int16Array,
+  uint32: Uint32Array,
+  int32: Int32Array,
+  float32: Float32Array,
+  float64: Float64Array,
+  int64: BigInt64Array,
+};
+
+const DTYPE_ALIASES = { float: "float64", double: "float64", int: "int64" };
+
+const FIELD_READERS = {
+  uint8: [1, (view, offset) => view.getUint8(offset)],
+  int8: [1, (view, offset) => view.getInt8(offset)],
+  uint16: [2, (view, offset) => view.getUint16(offset, true)],
+  int16: [2, (view, offset) => view.getInt16(offset, true)],
+  uint32: [4, (view, offset) => view.getUint32(offset, true)],
+  int32: [4, (view, offset) => view.getInt32(offset, true)],
+  float32: [4, (view, offset) => view.getFloat32(offset, true)],
+  float64: [8, (view, offset) => view.getFloat64(offset, true)],
+  int64: [8, (view, offset) => Number(view.getBigInt64(offset, true))],
+};
+
+const textDecoder = new TextDecoder();
+
+/**
+ * Build the field readers for every struct channel in the channel config.
+ *
+ * @param {Object} channels - channel config from the layout front matter
+ * @returns {Object} channel name -> { fields: [[name, size, read]], size }
+ */
+export const buildStructLayouts = (channels) => {
+  const layouts = {};
+  for (const [name, config] of Object.entries(channels)) {
+    if (config.type !== "struct") continue;
+    const fields = Object.entries(config.fields || {}).map(([field, dtype]) => {
+      const name = DTYPE_ALIASES[dtype] || dtype;
+      const [size, read] = FIELD_READERS[name];
+      return [field, size, read, COLUMN_TYPES[name]];
+    });
+    const size = fields.reduce((total, [, fieldSize]) => total + fieldSize, 0);
+    layouts[name] = { fields, size };
+  }
+  return layouts;
+};
+
+const readStruct = (view, offset, layout) => {
+  const record = {};
+  for (const [field, size, read] of layout.fields) {
+    record[field] = read(view, offset);
+    offset += size;
+  }
+  return record;
+};
+
+const readArrayHeader = (view, offset) => {
+  const ArrayType = ARRAY_TYPES[view.getUint8(offset)];
+  const ndim = view.getUint8(offset + 1);
+  const shape = [];
+  for (let i = 0; i < ndim; i++) {
+    shape.push(view.getUint32(offset + 2 + 4 * i, true));
+  }
+  return { ArrayType, shape, start: offset + 2 + 4 * ndim };
+};
+
+const readArray = (buffer, view, offset) => {
+  const { ArrayType, shape, start } = readArrayHeader(view, offset);
+  // Copy into a fresh buffer so the typed array is correctly aligned
+  return shapeArray(new ArrayType(buffer.slice(start, view.byteLength)), shape);
+};
+
+const shapeArray = (data, shape) => {
+  if (shape.length !== 2) return data;
+
+  // Expose 2-D arrays as rows so they can be indexed as matrix[y][x]
+  const [height, width] = shape;
+  const rows = new Array(height);
+  for (let y = 0; y < height; y++) {
+    rows[y] = data.subarray(y * width, (y + 1) * width);
+  }
+  return rows;
+};
+
+// Columns of a block sent by publish_many: float64 values for a time series,
+// one column per field for a struct, then optional float64 timestamps
+const readColumns = (buffer, view, offset, layout) => {
+  const count = view.getUint32(offset, true);
+  const flags = view.getUint8(offset + 4);
+  let pos = offset + 5;
+  const readColumn = (ArrayType) => {
+    const end = pos + count * ArrayType.BYTES_PER_ELEMENT;
+    // Copy into a fresh buffer so the typed array is correctly aligned
+    let column = new ArrayType(buffer.slice(pos, end));
+    if (ArrayType === BigInt64Array) column = Array.from(column, Number);
+    pos = end;
+    return column;
+  };
+
+  let columns;
+  if (layout) {
+    columns = {};
+    for (const [field, , , ArrayType] of layout.fields) {
+      columns[field] = readColumn(ArrayType);
+    }
+  } else {
+    columns = readColumn(Float64Array);
+  }
+  const block = { columns };
+  if (flags & HAS_TIMESTAMPS) block.timestamps = readColumn(Float64Array);
+  return block;
+};
+
+const inflate = async (bytes) => {
+  const stream = new Blob([bytes])
+    .stream()
+    .pipeThrough(new DecompressionStream("deflate"));
+  return new Uint8Array(await new Response(stream).arrayBuffer());
+};
+
+const rleDecode = (bytes) => {
+  let size = 0;
+  for (let i = 1; i < bytes.length; i += 2) size += bytes[i] + 1;
+  const data = new Uint8Array(size);
+  let offset = 0;
+  for (let i = 0; i < bytes.length; i += 2) {
+    data.fill(bytes[i], offset, offset + bytes[i + 1] + 1);
+    offset += bytes[i + 1] + 1;
+  }
+  return data;
+};
+
+// Returns undefined for a delta whose base frame was never received
+const readPacked = async (buffer, view, offset, channel, deltas) => {
+  const { ArrayType, shape, start } = readArrayHeader(view, offset);
+  const flags = view.getUint8(start);
+  const frame = view.getUint32(start + 1, true);
+  const base = view.getUint32(start + 5, true);
+  let pos = start + 9;
+  let low, high;
+  if (flags & FLAG_BITPACK) {
+    low = view.getUint8(pos);
+    high = view.getUint8(pos + 1);
+    pos += 2;
+  }
+
+  let data = new Uint8Array(buffer, pos);
+  if (flags & FLAG_ZLIB) data = await inflate(data);
+  if (flags & FLAG_RLE) data = rleDecode(data);
+  if (flags & FLAG_DELTA) {
+    const previous = deltas[channel];
+    if (!previous || previous.frame !== base) {
+      delete deltas[channel];
+      return undefined;
+    }
+    data = data.map((byte, i) => byte ^ previous.data[i]);
+  }
+  deltas[channel] = { frame, data };
+
+  if (flags & FLAG_BITPACK) {
+    const size = shape.reduce((total, dim) => total * dim, 1);
+    const pixels = new Uint8Array(size);
+    for (let i = 0; i < size; i++) {
+      pixels[i] = (data[i >> 3] >> (7 - (i & 7))) & 1 ? high : low;
+    }
+    return shapeArray(pixels, shape);
+  }
+  // Copy so the typed array is aligned and the delta base stays untouched
+  return shapeArray(new ArrayType(data.slice().buffer), shape);
+};
+
+/**
+ * Decode a binary frame into a list of { channel, value } records, or
+ * { channel, columns, timestamps } records for blocks sent by publish_many.
+ * Frames must be decoded one at a time, in order, since compressed channels
+ * may be sent as deltas against their previous frame.
+ *
+ * @param {ArrayBuffer} buffer - the binary WebSocket message
+ * @param {Array<string>} channelNames - channel names in front matter order
+ * @param {Object} structLayouts - result of buildStructLayouts
+ * @param {Object} deltas - per-channel state of compressed channels, kept
+ *   between calls
+ * @returns {Promise<Array<{channel: string, value: any}>>}
+ */
+export const decodeFrame = async (
+  buffer,
+  channelNames,
+  structLayouts,
+  deltas = {}
+) => {
+  const view = new DataView(buffer);
+  if (view.getUint8(0) !== MAGIC) {
+    throw new Error("Not a binary channel frame");
+  }
+  const kind = view.getUint8(1);
+
+  // Latency tracing wrappers: skip the trace or hop to the wrapped frame
+  if (kind === KIND_TRACED || kind === KIND_HOP) {
+    let offset = HEADER_SIZE;
+    if (kind === KIND_TRACED) {
+      const hops = view.getUint8(HEADER_SIZE + 16);
+      offset += 17; // sequence number (u64), send time (f64), hop count (u8)
+      for (let i = 0; i < hops; i++) {
+        offset += 1 + view.getUint8(offset) + 8; // name length, name, time
+      }
+    } else {
+      offset += 1 + view.getUint8(offset) + 8;
+    }
+    return decodeFrame(
+      buffer.slice(offset),
+      channelNames,
+      structLayouts,
+      deltas
+    );
+  }
+
+  if (kind === KIND_BATCH) {
+    const records = [];
+    const count = view.getUint32(HEADER_SIZE, true);
+    let offset = HEADER_SIZE + 4;
+    for (let i = 0; i < count; i++) {
+      const length = view.getUint32(offset, true);
+      offset += 4;
+      records.push(
+        ...(await decodeFrame(
+          buffer.slice(offset, offset + length),
+          channelNames,
+          structLayouts,
+          deltas
+        ))
+      );
+      offset += length;
+    }
+    return records;
+  }
+
+  const channel = channelNames[view.getUint16(2, true)];
+  let value;
+  switch (kind) {
+    case KIND_JSON:
+      value = JSON.parse(textDecoder.decode(new Uint8Array(buffer, HEADER_SIZE)));
+      break;
+    case KIND_SCALAR:
+      value = view.getFloat64(HEADER_SIZE, true);
+      break;
+    case KIND_STRUCT:
+      value = readStruct(view, HEADER_SIZE, structLayouts[channel]);
+      break;
+    case KIND_STRUCT_LIST: {
+      const layout = structLayouts[channel];
+      const count = view.getUint32(HEADER_SIZE, true);
+      value = [];
+      for (let i = 0; i < count; i++) {
+        value.push(readStruct(view, HEADER_SIZE + 4 + i * layout.size, layout));
+      }
+      break;
+    }
+    case KIND_ARRAY:
+      value = readArray(buffer, view, HEADER_SIZE);
+      break;
+    case KIND_COLUMNS:
+      return [
+        {
+          channel,
+          ...readColumns(buffer, view, HEADER_SIZE, structLayouts[channel]),
+        },
+      ];
+    case KIND_PACKED:
+      value = await readPacked(buffer, view, HEADER_SIZE, channel, deltas);
+      if (value === undefined) return [];
+      break;
+    default:
+      throw new Error(`Unknown frame kind ${kind}`);
+  }
+  return [{ channel, value }];
+};
@@ -2,8 +2,9 @@ import argparse
 import asyncio
 import numpy as np
 import sounddevice as sd
-from scipy.signal import spectrogram
-from data_io.websocket_channel import WebSocketChannelPublisher
+from data_io.async_websocket_channel import AsyncWebSocketChannelPublisher
+from data_io.ring_buffer import SPSCRingBuffer
+from data_io.stft import StreamingSpectrogram
 
 
 class AudioStreamer:
@@ -28,71 +29,68 @@ class AudioStreamer:
         self.blocksize = blocksize
         self.nperseg = nperseg
         self.vocal_range = vocal_range
-        self.buffer = np.zeros((blocksize * 10,), dtype=np.float32)  # Circular buffer
-        self.write_index = 0
+        # Shared with the PortAudio callback thread
+        self.buffer = SPSCRingBuffer(blocksize * 10, dtype=np.float32)
+        # Average over as many segments as fit in the ring buffer
+        hop = nperseg - nperseg // 8
+        self.spectrogram = StreamingSpectrogram(
+            samplerate,
+            nperseg,
+            history=(self.buffer.capacity - nperseg) // hop + 1,
+            freq_range=vocal_range,
+        )
 
     def audio_callback(self, indata, frames, time, status):
-        """Callback to continuously record audio into the circular buffer."""
+        """Callback to continuously record audio into the ring buffer."""
         if status:
             print(f"Audio callback status: {status}")
-        indata = indata.flatten()
-        available_space = len(self.buffer) - self.write_index
-        if len(indata) <= available_space:
-            self.buffer[self.write_index : self.write_index + len(indata)] = indata
-        else:
-            # Wrap-around to the beginning of the buffer
-            self.buffer[self.write_index :] = indata[:available_space]
-            self.buffer[: len(indata) - available_space] = indata[available_space:]
-        self.write_index = (self.write_index + len(indata)) % len(self.buffer)
+        self.buffer.write(indata)
 
     def compute_vocal_spectrogram(self):
-        """Compute the spectrogram focusing on the human vocal range."""
-        # Align the buffer to start with the oldest data
-        data = np.roll(self.buffer, -self.write_index)
-
-        # Compute the spectrogram
-        f, t, Sxx = spectrogram(data, fs=self.samplerate, nperseg=self.nperseg)
-
-        # Filter frequencies to focus on the vocal range
-        vocal_min, vocal_max = self.vocal_range
-        vocal_mask = (f >= vocal_min) & (f <= vocal_max)
-        vocal_frequencies = f[vocal_mask]
-        vocal_sxx = Sxx[vocal_mask, :]
-
-        # Average amplitudes across the time axis
-        averaged_vocal_amplitudes = np.mean(vocal_sxx, axis=1)
-
-        # Normalize the averaged amplitudes
-        normalized_amplitudes = (
-            averaged_vocal_amplitudes - np.min(averaged_vocal_amplitudes)
-        ) / (
-            np.max(averaged_vocal_amplitudes) - np.min(averaged_vocal_amplitudes) + 1e-9
-        )
-
-        return vocal_frequencies, normalized_amplitudes.tolist()
+        """
+        Update the spectrogram focusing on the human vocal range.
+        Only segments completed by newly recorded audio are transformed.
+        Returns None if no new segment was completed since the last call.
+        """
+        start, views = self.buffer.read_new()
+        segments = sum(self.spectrogram.feed(view) for view in views)
+        if not self.buffer.valid(start):
+            print("Audio overrun: samples were overwritten while being read")
+        if not segments:
+            return None
+        return self.spectrogram.frequencies, self.spectrogram.amplitudes().copy()
 
     async def stream_audio(self):
-        """Process the audio buffer and publish averaged frequency data."""
-        with sd.InputStream(
-            samplerate=self.samplerate,
-            channels=1,
-            blocksize=self.blocksize,
-            callback=self.audio_callback,
-            dtype="float32",
-        ):
-            while True:
-                # Compute the vocal spectrogram
-                vocal_frequencies, averaged_data = self.compute_vocal_spectrogram()
-
-                # Publish the processed spectrogram data
-                self.publisher.publish(
-                    "audio_spectrogram",
-                    {
-                        "frequencies": vocal_frequencies.tolist(),
-                        "amplitudes": averaged_data,
-                    },
-                )
-                await asyncio.sleep(0.005)  # Publish every 100ms
+        """
+        Process the audio buffer and publish averaged frequency data. The
+        microphone is only open while someone watches the channel.
+        """
+        while True:
+            await self.publisher.wait_for_subscribers("audio_spectrogram")
+            with sd.InputStream(
+                samplerate=self.samplerate,
+                channels=1,
+                blocksize=self.blocksize,
+                callback=self.audio_callback,
+                dtype="float32",
+            ):
+                while self.publisher.is_subscribed("audio_spectrogram"):
+                    # Sleep until the callback delivers a new block
+                    await self.buffer.wait()
+
+                    # Update the vocal spectrogram with the newly recorded audio
+                    result = self.compute_vocal_spectrogram()
+
+                    # Publish the processed spectrogram data
+                    if result is not None:
+                        vocal_frequencies, averaged_data = result
+                        await self.publisher.publish(
+                            "audio_spectrogram",
+                            {
+                                "frequencies": vocal_frequencies,
+                                "amplitudes": averaged_data,
+                            },
+                        )
 
 
 async def audio_publisher(publisher):
@@ -103,11 +101,13 @@ async def audio_publisher(publisher):
 
 async def main(path: str):
     """Initialize the publisher and run the tasks."""
-    publisher = WebSocketChannelPublisher(source_name="audio", interface_file=path)
-    print(f"Publisher initialized with channels: {publisher.channels.keys()}")
+    async with AsyncWebSocketChannelPublisher(
+        source_name="audio", interface_file=path
+    ) as publisher:
+        print(f"Publisher initialized with channels: {publisher.channels.keys()}")
 
-    # Run the audio publisher task
-    await asyncio.gather(audio_publisher(publisher))
+        # Run the audio publisher task
+        await asyncio.gather(audio_publisher(publisher))
 
 
 if __name__ == "__main__":
@@ -1,38 +1,46 @@
 import argparse
 import asyncio
-import random
+import time
 
-from data_io.websocket_channel import WebSocketChannelPublisher
+import numpy as np
+
+from data_io.async_websocket_channel import AsyncWebSocketChannelPublisher
+from data_io.runtime import ProducerRuntime
 
 BW_IMAGE_PERIOD_SEC = 0.0001  # Period to publish black/white images in seconds
 
 
-async def bw_image_publisher(publisher: WebSocketChannelPublisher, channel="bw_image"):
+def bw_image_publisher(publisher, channel="bw_image"):
     """
-    Task that publishes a 128x128 matrix of black/white pixels.
-    Each pixel is randomly 0 (black) or 255 (white).
+    Publish 256x256 matrices of black/white pixels from a worker process.
+    Each pixel is randomly 0 (black) or 255 (white). Nothing is generated
+    while nobody watches the channel.
     """
     while True:
-        # Generate a random 128×128 matrix
-        image_matrix = [
-            [random.choice([0, 255]) for _ in range(256)] for _ in range(256)
-        ]
-        # Publish the matrix
+        publisher.wait_for_subscribers_blocking(channel)
+        # Generate a random 256×256 matrix
+        image_matrix = np.where(np.random.rand(256, 256) < 0.5, 0, 255).astype(np.uint8)
+        # Publish the matrix (handed over through shared memory)
         publisher.publish(channel, image_matrix)
-        await asyncio.sleep(BW_IMAGE_PERIOD_SEC)
+        time.sleep(BW_IMAGE_PERIOD_SEC)
 
 
 async def main(path: str):
     """
     Initialize the publisher and run the black/white image publishing task.
     """
-    publisher = WebSocketChannelPublisher(
-        source_name="bw_image_script", interface_file=path
-    )
-    print(f"Publisher initialized with channels: {publisher.channels.keys()}")
-
-    # Only run the black-and-white image publisher in this script
-    await bw_image_publisher(publisher)
+    async with AsyncWebSocketChannelPublisher(
+        source_name="bw_image_script",
+        interface_file=path,
+        coalesce=("bw_image",),
+        encoding="binary",
+    ) as publisher:
+        print(f"Publisher initialized with channels: {publisher.channels.keys()}")
+
+        # Only run the black-and-white image publisher in this script
+        runtime = ProducerRuntime(publisher)
+        runtime.add_process(bw_image_publisher)
+        await runtime.run()
 
 
 if __name__ == "__main__":
@@ -3,89 +3,79 @@
 import argparse
 import asyncio
 import random
-import aiohttp
-from data_io.websocket_channel import WebSocketChannelPublisher
+import time
+from data_io.async_websocket_channel import AsyncWebSocketChannelPublisher
+from data_io.polling import PollingSource
+from data_io.runtime import ProducerRuntime
 
 ISS_PERIOD_SEC = 10  # Period to fetch ISS location in seconds
 RANDOM_DATA_PERIOD_SEC = 0.0001  # Period to publish random data in seconds
-EARTHQUAKE_PERIOD_SEC = 10  # Period to fetch earthquake data in secondss
-
-
-async def get_iss_location():
-    """Asynchronously fetch the current latitude and longitude of the ISS."""
-    url = "http://api.open-notify.org/iss-now.json"
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
-            response.raise_for_status()
-            data = await response.json()
-            position = data["iss_position"]
-            latitude = float(position["latitude"])
-            longitude = float(position["longitude"])
-            return latitude, longitude
-
-
-async def temperature_publisher(
-    publisher: WebSocketChannelPublisher, channel="temperature"
-):
-    """Task that continuously publishes random temperature values."""
+EARTHQUAKE_PERIOD_SEC = 10  # Period to fetch earthquake data in seconds
+
+
+def temperature_publisher(publisher, channel="temperature"):
+    """
+    Continuously publish random temperature values.
+    Runs in its own process so the tight loop cannot starve the fetchers.
+    """
     temperature = 0.0  # Local state for temperature
     while True:
         temperature += random.uniform(-1, 1)
         publisher.publish(channel, temperature)
-        await asyncio.sleep(RANDOM_DATA_PERIOD_SEC)  # Publish every 1ms
-
-
-async def iss_location_publisher(publisher, channel="position"):
-    """Task that continuously fetches and publishes the ISS location."""
-    while True:
-        try:
-            lat, lon = await get_iss_location()
-            publisher.publish(channel, {"lat": lat, "lon": lon})
-        except Exception as e:
-            print(f"Error fetching ISS location: {e}")
-        await asyncio.sleep(ISS_PERIOD_SEC)  # Fetch and publish every 10 seconds
-
-
-async def earthquake_data_publisher(publisher, channel="earthquake_data"):
-    """Fetch and publish real-time earthquake data."""
-    url = "https://earthquake.usgs.gov/earthquakes/feed/v1.0/summary/all_day.geojson"
-
-    while True:
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        earthquakes = [
-                            {
-                                "lat": feature["geometry"]["coordinates"][1],
-                                "lon": feature["geometry"]["coordinates"][0],
-                                "magnitude": feature["properties"]["mag"],
-                            }
-                            for feature in data["features"]
-                        ]
-                        publisher.publish(channel, earthquakes)
-                    else:
-                        print(
-                            f"Failed to fetch earthquake data. HTTP status: {response.status}"
-                        )
-        except Exception as e:
-            print(f"Error fetching earthquake data: {e}")
-
-        await asyncio.sleep(EARTHQUAKE_PERIOD_SEC)  # Fetch every minute
+        time.sleep(RANDOM_DATA_PERIOD_SEC)
+
+
+def iss_position(record):
+    """The open-notify API sends coordinates as strings."""
+    return {"lat": float(record["lat"]), "lon": float(record["lon"])}
+
+
+def earthquake(record):
+    """Skip events without a magnitude."""
+    return record if record["magnitude"] is not None else None
+
+
+async def feed_publisher(publisher):
+    """Poll the ISS location and earthquake feeds and publish what changed."""
+    async with PollingSource(publisher) as source:
+        source.add_feed(
+            "position",
+            "http://api.open-notify.org/iss-now.json",
+            {"lat": "iss_position.latitude", "lon": "iss_position.longitude"},
+            interval=ISS_PERIOD_SEC,
+            transform=iss_position,
+            publish="latest",
+        )
+        source.add_feed(
+            "earthquake_data",
+            "https://earthquake.usgs.gov/earthquakes/feed/v1.0/summary/all_day.geojson",
+            {
+                "lat": "geometry.coordinates.1",
+                "lon": "geometry.coordinates.0",
+                "magnitude": "properties.mag",
+            },
+            items="features",
+            interval=EARTHQUAKE_PERIOD_SEC,
+            transform=earthquake,
+        )
+        await source.run()
 
 
 async def main(path: str):
     """Initialize the publisher and run the tasks."""
-    publisher = WebSocketChannelPublisher(source_name="script", interface_file=path)
-    print(f"Publisher initialized with channels: {publisher.channels.keys()}")
-
-    # Run the tasks concurrently
-    await asyncio.gather(
-        temperature_publisher(publisher),
-        iss_location_publisher(publisher),
-        earthquake_data_publisher(publisher),
-    )
+    async with AsyncWebSocketChannelPublisher(
+        source_name="script",
+        interface_file=path,
+        coalesce=("position", "earthquake_data"),
+    ) as publisher:
+        print(f"Publisher initialized with channels: {publisher.channels.keys()}")
+
+        # CPU-bound producers get their own process, I/O-bound ones share
+        # this event loop, and everything goes out over the one connection
+        runtime = ProducerRuntime(publisher)
+        runtime.add_process(temperature_publisher)
+        runtime.add_task(feed_publisher)
+        await runtime.run()
 
 
 if __name__ == "__main__":
@@ -1,21 +1,39 @@
 import os from "os";
 import * as http from "http";
+import { performance } from "perf_hooks";
 import WebSocket from "ws";
 import yargs from "yargs";
 import { hideBin } from "yargs/helpers";
 
+// Binary hop frame (see data_io/codec.py): magic, KIND_HOP, unused channel id,
+// hop name length and name, float64 time, then the forwarded frame
+const MAGIC = 0xd1;
+const KIND_HOP = 9;
+const HOP_NAME = Buffer.from("wsproxy");
+
+// Seconds since the epoch with sub-millisecond resolution
+const now = () => (performance.timeOrigin + performance.now()) / 1000;
+
 class DynamicProxy {
   private verbose: boolean;
+  private deflate: boolean;
+  private trace: boolean;
   private producers: Set<WebSocket> = new Set(); // Track active producers
   private consumers: Set<WebSocket> = new Set(); // Track active consumers
 
-  constructor(verbose = false) {
+  constructor(verbose = false, deflate = true, trace = false) {
     this.verbose = verbose;
+    this.deflate = deflate;
+    this.trace = trace;
   }
 
   async start(port: number, localOnly: boolean) {
     const server = http.createServer();
-    const wss = new WebSocket.Server({ noServer: true });
+    // Offer permessage-deflate for messages over 1 KB, e.g. for remote viewers
+    const wss = new WebSocket.Server({
+      noServer: true,
+      perMessageDeflate: this.deflate ? { threshold: 1024 } : false,
+    });
 
     // Handle HTTP upgrade requests to WebSocket connections
     server.on("upgrade", (req, socket, head) => {
@@ -68,13 +86,19 @@ class DynamicProxy {
       this.producers.add(ws);
       this.log("Producer connected");
 
-      ws.on("message", (message) => this.forwardToConsumers(message));
+      ws.on("message", (message, isBinary) =>
+        this.forwardToConsumers(message, isBinary)
+      );
       ws.on("close", () => this.cleanupProducer(ws));
       ws.on("error", (err) => this.logError(`Producer error: ${err.message}`));
+      ws.send(this.subscriptionMessage());
     } else if (path === "/consumer") {
       // Add to consumers
       this.consumers.add(ws);
       this.log("Consumer connected");
+      if (this.consumers.size === 1) {
+        this.notifyProducers();
+      }
 
       ws.on("close", () => this.cleanupConsumer(ws));
       ws.on("error", (err) => this.logError(`Consumer error: ${err.message}`));
@@ -85,11 +109,54 @@ class DynamicProxy {
     }
   }
 
-  private forwardToConsumers(message: WebSocket.Data) {
+  // Record when this proxy forwarded a message, for latency tracing
+  private stampHop(message: WebSocket.Data, isBinary: boolean): WebSocket.Data {
+    const data = Array.isArray(message)
+      ? Buffer.concat(message)
+      : Buffer.from(message as ArrayBuffer);
+    if (isBinary) {
+      const header = Buffer.alloc(5 + HOP_NAME.length + 8);
+      header.writeUInt8(MAGIC, 0);
+      header.writeUInt8(KIND_HOP, 1);
+      header.writeUInt8(HOP_NAME.length, 4);
+      HOP_NAME.copy(header, 5);
+      header.writeDoubleLE(now(), 5 + HOP_NAME.length);
+      return Buffer.concat([header, data]);
+    }
+    try {
+      const parsed = JSON.parse(data.toString());
+      parsed.hops = { ...parsed.hops, wsproxy: now() };
+      return JSON.stringify(parsed);
+    } catch {
+      return data;
+    }
+  }
+
+  private forwardToConsumers(message: WebSocket.Data, isBinary: boolean) {
     this.log(`Forwarding message to consumers: ${message}`);
+    if (this.trace) {
+      message = this.stampHop(message, isBinary);
+    }
     this.consumers.forEach((consumer) => {
       if (consumer.readyState === WebSocket.OPEN) {
-        consumer.send(message);
+        consumer.send(message, { binary: isBinary });
+      }
+    });
+  }
+
+  // Consumers here receive every channel, so producers only need to know
+  // whether anyone is connected: null means all channels, [] means none
+  private subscriptionMessage(): string {
+    return JSON.stringify({
+      subscriptions: this.consumers.size > 0 ? null : [],
+    });
+  }
+
+  private notifyProducers() {
+    const message = this.subscriptionMessage();
+    this.producers.forEach((producer) => {
+      if (producer.readyState === WebSocket.OPEN) {
+        producer.send(message);
       }
     });
   }
@@ -102,6 +169,9 @@ class DynamicProxy {
   private cleanupConsumer(ws: WebSocket) {
     this.consumers.delete(ws);
     this.log("Consumer disconnected");
+    if (this.consumers.size === 0) {
+      this.notifyProducers();
+    }
   }
 
   private log(message: string) {
@@ -134,9 +204,23 @@ const args = yargs(hideBin(process.argv))
     default: false,
     description: "Enable verbose output",
   })
+  .option("deflate", {
+    type: "boolean",
+    default: true,
+    description: "Negotiate permessage-deflate compression for large messages",
+  })
+  .option("trace", {
+    type: "boolean",
+    default: false,
+    description: "Stamp a hop time on every message for latency tracing",
+  })
   .parseSync();
 
-const proxy = new DynamicProxy(args.verbose as boolean);
+const proxy = new DynamicProxy(
+  args.verbose as boolean,
+  args.deflate as boolean,
+  args.trace as boolean
+);
 
 (async () => {
   try {